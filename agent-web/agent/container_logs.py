@@ -2,10 +2,11 @@
 Сбор логов Docker-контейнера для анализа инцидентов (homelab-agent имеет docker.sock).
 """
 
+import json
 import os
 import re
 import subprocess
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 # Имя монитора Uptime Kuma → имя контейнера Docker
 MONITOR_TO_CONTAINER: Dict[str, str] = {
@@ -93,6 +94,38 @@ def fetch_container_logs(
     return out
 
 
+def fetch_container_state(container: str, timeout: Optional[int] = None) -> Dict[str, Any]:
+    """Состояние контейнера из docker inspect: статус, рестарты, OOM, healthcheck."""
+    timeout = timeout or int(os.environ.get("CONTAINER_LOG_TIMEOUT", "30"))
+    cmd = ["docker", "inspect", "--format", "{{json .State}}|{{.RestartCount}}", container]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError:
+        return {"error": "docker CLI не найден в контейнере агента"}
+    except subprocess.TimeoutExpired:
+        return {"error": f"таймаут docker inspect ({timeout}s) для {container}"}
+    except Exception as e:
+        return {"error": f"ошибка docker inspect: {e}"}
+    if result.returncode != 0:
+        return {"error": (result.stderr or "").strip() or f"docker inspect exit {result.returncode}"}
+    raw_state, _, restarts = result.stdout.strip().rpartition("|")
+    try:
+        state = json.loads(raw_state)
+    except ValueError:
+        return {"error": f"неожиданный вывод docker inspect: {result.stdout[:200]}"}
+    return {
+        "status": state.get("Status"),
+        "restarting": state.get("Restarting"),
+        "oom_killed": state.get("OOMKilled"),
+        "exit_code": state.get("ExitCode"),
+        "error": state.get("Error") or None,
+        "started_at": state.get("StartedAt"),
+        "finished_at": state.get("FinishedAt"),
+        "health": (state.get("Health") or {}).get("Status"),
+        "restart_count": int(restarts) if restarts.isdigit() else None,
+    }
+
+
 def attach_container_logs(details: dict) -> None:
     """Дополняет details полями container_name и container_logs."""
     monitor = details.get("monitor_name") or ""
@@ -184,6 +184,47 @@ def build_incident_prompt(monitor_name: str, status: str, details: Dict[str, Any
         if logs
         else ""
     )
+    changes = details.get("kuma_recent_changes") or []
+    changes_block = (
+        "\nRECENT STATUS CHANGES (Uptime Kuma, oldest first):\n"
+        + "\n".join(
+            f"- {c.get('time')}: {'up' if c.get('status') == 1 else 'down'} — {c.get('msg') or ''}"
+            for c in changes
+        )
+        + "\n"
+        if changes
+        else ""
+    )
+    signal = details.get("early_signal") or {}
+    signal_parts = [f"{signal.get('reason')} since {signal.get('degraded_since')}"]
+    if signal.get("ping_ms") is not None and signal.get("baseline_ms") is not None:
+        signal_parts.append(
+            f"ping {signal['ping_ms']:.0f} ms vs baseline {signal['baseline_ms']} ms (z={signal.get('z')})"
+        )
+    signal_parts.append(f"failed checks {signal.get('failures')}")
+    signal_block = (
+        "\nEARLY SIGNAL (agent detector, before Uptime Kuma DOWN): " + "; ".join(signal_parts) + "\n"
+        if signal.get("reason")
+        else ""
+    )
+    flap = details.get("flap_summary") or {}
+    flap_block = (
+        f"\nFLAPPING (agent, per-change analysis was suppressed): {flap.get('transitions')} status changes "
+        f"({flap.get('downs')} down) from {flap.get('flapping_since')}, stable {flap.get('final_status')} "
+        f"since {flap.get('stable_since')}. Explain the oscillation, not a single outage. Changes:\n"
+        + "\n".join(f"- {c.get('time')}: {c.get('status')} — {c.get('msg') or ''}" for c in flap.get("changes") or [])
+        + "\n"
+        if flap
+        else ""
+    )
+    state = details.get("container_state") or {}
+    state_block = (
+        "\nCONTAINER STATE (docker inspect): "
+        + ", ".join(f"{k}={v}" for k, v in state.items() if v not in (None, ""))
+        + "\n"
+        if state
+        else ""
+    )
     return f"""Homelab alert. Write ONLY the final report for Telegram — Russian, markdown.
 
 DATA:
@@ -193,7 +234,7 @@ DATA:
 - type: {details.get('monitor_type', 'unknown')}
 - url: {details.get('monitor_url', 'N/A')}
 - message: {details.get('message', 'N/A')}
-{logs_block}
+{changes_block}{flap_block}{signal_block}{state_block}{logs_block}
 Repo: Docker Compose in services/, agent-web/, proxy/ (Caddy).
 Use the docker logs above as primary evidence for root cause.
 
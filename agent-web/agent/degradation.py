@@ -0,0 +1,254 @@
+"""
+Ранний детектор деградации мониторов: сбор улик до того, как Kuma пришлёт DOWN.
+
+Kuma объявляет DOWN после исчерпания повторов, и логи собирались бы уже после
+начала проблемы. Детектор смотрит поток heartbeat'ов (push постоянного
+подключения, без него — снимки /metrics из TSDB-скрейпера) и по каждому монитору
+ведёт:
+- устойчивую EWMA времени ответа и EW-среднее абсолютное отклонение; выброс
+  обрезается до ±DEGRADE_CLIP·σ перед обновлением, так что базовая линия не
+  уезжает за первым же всплеском; z = (ping − EWMA) / σ;
+- долю отказов (DOWN/PENDING) среди последних DEGRADE_WINDOW heartbeat'ов.
+
+Срабатывание: z ≥ DEGRADE_Z DEGRADE_CONSECUTIVE раз подряд, доля отказов ≥
+DEGRADE_FAIL_RATIO или PENDING (Kuma уже повторяет проверку). Тогда в фоновом
+пуле собираются docker logs и состояние контейнера; пока монитор деградирован,
+улики обновляются раз в DEGRADE_REFRESH_S. Вебхук DOWN берёт свежие улики
+(apply_evidence) вместо docker logs на критическом пути.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+
+DEGRADE_ENABLED = os.environ.get("DEGRADE_ENABLED", "true").lower() in ("1", "true", "yes")
+DEGRADE_ALPHA = float(os.environ.get("DEGRADE_ALPHA", "0.1"))
+DEGRADE_Z = float(os.environ.get("DEGRADE_Z", "4"))
+DEGRADE_CLIP = float(os.environ.get("DEGRADE_CLIP", "3"))
+DEGRADE_CONSECUTIVE = int(os.environ.get("DEGRADE_CONSECUTIVE", "3"))
+DEGRADE_WARMUP = int(os.environ.get("DEGRADE_WARMUP", "20"))
+DEGRADE_WINDOW = int(os.environ.get("DEGRADE_WINDOW", "10"))
+DEGRADE_FAIL_RATIO = float(os.environ.get("DEGRADE_FAIL_RATIO", "0.3"))
+DEGRADE_ON_PENDING = os.environ.get("DEGRADE_ON_PENDING", "true").lower() in ("1", "true", "yes")
+DEGRADE_REFRESH_S = float(os.environ.get("DEGRADE_REFRESH_S", "60"))
+DEGRADE_EVIDENCE_MAX_AGE = float(os.environ.get("DEGRADE_EVIDENCE_MAX_AGE", "180"))
+# Минимальный σ, мс: у стабильного сервиса отклонение почти нулевое
+DEGRADE_MIN_SIGMA_MS = float(os.environ.get("DEGRADE_MIN_SIGMA_MS", "5"))
+
+DOWN, UP, PENDING, MAINTENANCE = 0, 1, 2, 3
+# E|x − μ| = σ·√(2/π) для нормального распределения
+_MAD_TO_SIGMA = math.sqrt(math.pi / 2)
+
+
+@dataclass
+class MonitorState:
+    mean: Optional[float] = None
+    mad: float = 0.0
+    samples: int = 0
+    over: int = 0
+    under: int = 0
+    last_z: Optional[float] = None
+    last_ping: Optional[float] = None
+    failures: Deque[bool] = field(default_factory=lambda: deque(maxlen=DEGRADE_WINDOW))
+    degraded_since: Optional[float] = None
+    reason: Optional[str] = None
+
+    @property
+    def sigma(self) -> float:
+        floor = max(DEGRADE_MIN_SIGMA_MS, 0.05 * (self.mean or 0))
+        return max(self.mad * _MAD_TO_SIGMA, floor)
+
+    @property
+    def fail_ratio(self) -> float:
+        return sum(self.failures) / len(self.failures) if self.failures else 0.0
+
+    def signal(self) -> Dict[str, Any]:
+        return {
+            "reason": self.reason,
+            "degraded_since": (
+                datetime.fromtimestamp(self.degraded_since).isoformat(timespec="seconds")
+                if self.degraded_since else None
+            ),
+            "ping_ms": self.last_ping,
+            "baseline_ms": round(self.mean, 1) if self.mean is not None else None,
+            "z": round(self.last_z, 1) if self.last_z is not None else None,
+            "failures": f"{sum(self.failures)}/{len(self.failures)}",
+        }
+
+
+class DegradationDetector:
+    """Онлайн-статистика по мониторам; observe() — O(1) на heartbeat."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.monitors: Dict[str, MonitorState] = {}
+
+    def observe(self, name: str, status: Optional[int], ping: Optional[float], at: Optional[float] = None) -> Optional[str]:
+        """Учитывает heartbeat; возвращает причину, если монитор только что стал деградированным."""
+        if not name or status is None or status == MAINTENANCE:
+            return None
+        at = at or time.time()
+        with self._lock:
+            state = self.monitors.get(name)
+            if state is None:
+                state = self.monitors[name] = MonitorState()
+            state.failures.append(status in (DOWN, PENDING))
+
+            if status == UP and isinstance(ping, (int, float)) and ping >= 0:
+                self._update_latency(state, float(ping))
+            elif status != UP:
+                state.under = 0
+
+            reason = None
+            if status == PENDING and DEGRADE_ON_PENDING:
+                reason = "pending"
+            elif len(state.failures) == state.failures.maxlen and state.fail_ratio >= DEGRADE_FAIL_RATIO:
+                reason = "failure_ratio"
+            elif state.over >= DEGRADE_CONSECUTIVE:
+                reason = "latency"
+
+            if state.degraded_since is None:
+                if reason is None:
+                    return None
+                state.degraded_since = at
+                state.reason = reason
+                return reason
+            # Выход из деградации — с гистерезисом: спокойные heartbeat'ы подряд
+            if status == UP and state.under >= DEGRADE_CONSECUTIVE and state.fail_ratio < DEGRADE_FAIL_RATIO / 2:
+                state.degraded_since = None
+                state.reason = None
+            return None
+
+    @staticmethod
+    def _update_latency(state: MonitorState, ping: float) -> None:
+        state.last_ping = ping
+        if state.mean is None:
+            state.mean = ping
+            state.samples = 1
+            return
+        sigma = state.sigma
+        z = (ping - state.mean) / sigma
+        state.last_z = z if state.samples >= DEGRADE_WARMUP else None
+        if state.last_z is not None and z >= DEGRADE_Z:
+            state.over += 1
+            state.under = 0
+        else:
+            state.over = 0
+            state.under = state.under + 1 if z < DEGRADE_Z / 2 else 0
+        clipped = state.mean + max(-DEGRADE_CLIP * sigma, min(DEGRADE_CLIP * sigma, ping - state.mean))
+        deviation = abs(clipped - state.mean)
+        state.mean += DEGRADE_ALPHA * (clipped - state.mean)
+        state.mad += DEGRADE_ALPHA * (deviation - state.mad)
+        state.samples += 1
+
+    def is_degraded(self, name: str) -> bool:
+        state = self.monitors.get(name)
+        return state is not None and state.degraded_since is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            name: {
+                **state.signal(),
+                "degraded": state.degraded_since is not None,
+                "samples": state.samples,
+                "fail_ratio": round(state.fail_ratio, 2),
+            }
+            for name, state in list(self.monitors.items())
+        }
+
+
+_detector = DegradationDetector()
+_evidence: Dict[str, Dict[str, Any]] = {}
+_inflight: set = set()
+_evidence_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_detector() -> DegradationDetector:
+    return _detector
+
+
+def _collect(name: str) -> None:
+    from .container_logs import attach_container_logs, fetch_container_state
+
+    started = time.perf_counter()
+    try:
+        details: Dict[str, Any] = {"monitor_name": name}
+        attach_container_logs(details)
+        container = details.get("container_name")
+        evidence = {
+            "container_name": container,
+            "container_logs": details.get("container_logs"),
+            "container_state": fetch_container_state(container) if container else None,
+            "early_signal": _detector.monitors[name].signal() if name in _detector.monitors else None,
+            "collected_at": time.time(),
+            "collect_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        with _evidence_lock:
+            _evidence[name] = evidence
+    except Exception as e:
+        print(f"⚠️ Ранний сбор улик {name}: {e}", flush=True)
+    finally:
+        with _evidence_lock:
+            _inflight.discard(name)
+
+
+def _schedule(name: str) -> bool:
+    global _pool
+    with _evidence_lock:
+        if name in _inflight:
+            return False
+        _inflight.add(name)
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="degradation")
+    _pool.submit(_collect, name)
+    return True
+
+
+def on_heartbeat(name: str, status: Optional[int], ping: Optional[float], at: Optional[float] = None) -> None:
+    """Точка входа потока heartbeat'ов; сбор улик уходит в пул, вызывающий не ждёт."""
+    if not DEGRADE_ENABLED:
+        return
+    reason = _detector.observe(name, status, ping, at)
+    if reason is not None:
+        print(f"📉 {name}: ранний признак деградации ({reason}) — собираю логи и состояние", flush=True)
+        _schedule(name)
+    elif _detector.is_degraded(name):
+        evidence = _evidence.get(name)
+        if evidence is None or time.time() - evidence["collected_at"] >= DEGRADE_REFRESH_S:
+            _schedule(name)
+
+
+def apply_evidence(details: Dict[str, Any], max_age: float = DEGRADE_EVIDENCE_MAX_AGE) -> bool:
+    """Переносит в details заранее собранные улики; False — их нет или они устарели."""
+    name = details.get("monitor_name") or ""
+    with _evidence_lock:
+        evidence = _evidence.pop(name, None)
+    if evidence is None:
+        return False
+    age = time.time() - evidence["collected_at"]
+    if age > max_age:
+        return False
+    for key in ("container_name", "container_logs", "container_state", "early_signal"):
+        if evidence.get(key) is not None:
+            details[key] = evidence[key]
+    details["evidence_age_s"] = round(age, 1)
+    return True
+
+
+def degradation_status() -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "enabled": DEGRADE_ENABLED,
+        "monitors": _detector.status(),
+        "evidence": {
+            name: {"age_s": round(now - ev["collected_at"], 1), "collect_ms": ev["collect_ms"]}
+            for name, ev in list(_evidence.items())
+        },
+    }
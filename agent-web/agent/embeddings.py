@@ -0,0 +1,242 @@
+"""
+Эмбеддинги для RAG: ONNX MiniLM-L6-v2, запечённая в образ (EMBEDDING_MODEL_DIR).
+
+- модель не скачивается в рантайме (EMBEDDING_OFFLINE=true) — без сети первый
+  инцидент не зависает, а получает понятную ошибку;
+- энкодер грузится один раз на процесс, прогрев — фоновой задачей при старте app;
+- векторы кэшируются по sha256 текста: LRU в памяти + SQLite на диске,
+  повторные тексты не доходят до энкодера.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL_DIR = os.environ.get("EMBEDDING_MODEL_DIR", "/app/models/all-MiniLM-L6-v2")
+EMBEDDING_OFFLINE = os.environ.get("EMBEDDING_OFFLINE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "5000"))
+# Пустая строка — кэш только в памяти
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite")
+EMBEDDING_CACHE_DISK_MAX = int(os.environ.get("EMBEDDING_CACHE_DISK_MAX", "200000"))
+
+# Файлы, которые ONNXMiniLM_L6_V2 распаковывает в <dir>/onnx
+_MODEL_FILES = ("model.onnx", "tokenizer.json", "config.json")
+
+
+def model_files_present(model_dir: str = EMBEDDING_MODEL_DIR) -> bool:
+    folder = os.path.join(model_dir, "onnx")
+    return all(os.path.isfile(os.path.join(folder, name)) for name in _MODEL_FILES)
+
+
+def _load_encoder():
+    """ONNX-энкодер из EMBEDDING_MODEL_DIR (тот же, что DefaultEmbeddingFunction Chroma)."""
+    from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+    if EMBEDDING_OFFLINE and not model_files_present():
+        raise RuntimeError(
+            f"Модель эмбеддингов не найдена в {EMBEDDING_MODEL_DIR} (EMBEDDING_OFFLINE=true). "
+            "Пересоберите образ агента или задайте EMBEDDING_MODEL_DIR."
+        )
+    encoder = ONNXMiniLM_L6_V2()
+    encoder.DOWNLOAD_PATH = EMBEDDING_MODEL_DIR
+    return encoder
+
+
+class EmbeddingCache:
+    """LRU в памяти + таблица SQLite на диске; ключ — sha256 модели и текста."""
+
+    def __init__(
+        self,
+        max_items: int = EMBEDDING_CACHE_SIZE,
+        path: str = EMBEDDING_CACHE_PATH,
+        disk_max: int = EMBEDDING_CACHE_DISK_MAX,
+    ):
+        self.max_items = max_items
+        self.disk_max = disk_max
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "hash TEXT PRIMARY KEY, vec BLOB NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Дисковый кэш эмбеддингов недоступен ({path}): {e}")
+                self._db = None
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(f"{MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        self._mem[key] = blob
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                blob = self._mem.get(key)
+                if blob is None:
+                    missing.append(key)
+                else:
+                    self._mem.move_to_end(key)
+                    found[key] = blob
+            if missing and self._db is not None:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = blob
+                        self._remember(key, blob)
+            self.hits += len(found)
+            self.misses += len(set(keys) - set(found))
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        with self._lock:
+            for key, blob in items.items():
+                self._remember(key, blob)
+            if self._db is None or not items:
+                return
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, vec, created) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in items.items()],
+            )
+            self._db.commit()
+            self._inserts += len(items)
+            if self._inserts >= 1000:
+                self._inserts = 0
+                self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Диск ограничен EMBEDDING_CACHE_DISK_MAX: удаляются самые старые записи."""
+        total = self._db.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+        excess = total - self.disk_max
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE hash IN "
+                "(SELECT hash FROM embeddings ORDER BY created LIMIT ?)",
+                (excess,),
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_items": len(self._mem),
+            "disk": self._db is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CachedEmbedder:
+    """Энкодер с кэшем: в модель уходят только тексты, которых нет в кэше."""
+
+    def __init__(self, cache: Optional[EmbeddingCache] = None):
+        self.cache = cache or EmbeddingCache()
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def encoder(self):
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = _load_encoder()
+        return self._encoder
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        # Одинаковые тексты в одном батче кодируются один раз
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            vectors = self.encoder()(list(pending.values()))
+            computed = {
+                key: array("f", (float(x) for x in vec)).tobytes()
+                for key, vec in zip(pending.keys(), vectors)
+            }
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        result = []
+        for key in keys:
+            vec = array("f")
+            vec.frombytes(found[key])
+            result.append(vec.tolist())
+        return result
+
+
+_embedder: Optional[CachedEmbedder] = None
+_embedder_lock = threading.Lock()
+_status: Dict[str, Any] = {"ready": False, "error": None, "load_ms": None}
+
+
+def get_embedder() -> CachedEmbedder:
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = CachedEmbedder()
+    return _embedder
+
+
+def embed(texts: List[str]) -> List[List[float]]:
+    return get_embedder()(texts)
+
+
+def warm_up() -> Dict[str, Any]:
+    """Загрузка модели и пробный прогон (вызывается фоново при старте приложения)."""
+    started = time.perf_counter()
+    try:
+        embedder = get_embedder()
+        embedder.encoder()(["homelab warm-up"])
+        _status.update(
+            ready=True,
+            error=None,
+            load_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+        print(f"✅ Модель эмбеддингов загружена за {_status['load_ms']} мс")
+    except Exception as e:
+        _status.update(ready=False, error=str(e))
+        print(f"⚠️ Модель эмбеддингов: {e}")
+    return dict(_status)
+
+
+def embedding_status() -> Dict[str, Any]:
+    status = dict(_status)
+    status["model_dir"] = EMBEDDING_MODEL_DIR
+    status["model_present"] = model_files_present()
+    if _embedder is not None:
+        status["cache"] = _embedder.cache.stats()
+    return status
@@ -0,0 +1,93 @@
+"""
+Потоковая выгрузка истории LogDoc в NDJSON / CSV (опционально gzip).
+
+Строки читаются серверным курсором (AsyncConnection.stream) пачками по
+EXPORT_BATCH и сразу уходят клиенту — память не зависит от объёма выгрузки.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from models import LogDoc
+
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", "2000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+CSV_COLUMNS = ("id", "kind", "source", "timestamp", "content")
+
+
+def _ndjson_chunk(rows) -> str:
+    return "".join(
+        json.dumps({
+            "id": row.id,
+            "kind": row.kind,
+            "source": row.source,
+            "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+            "content": row.content,
+        }, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_chunk(rows, header: bool) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    writer.writerows(
+        (row.id, row.kind, row.source, row.timestamp.isoformat() if row.timestamp else "", row.content)
+        for row in rows
+    )
+    return buf.getvalue()
+
+
+async def iter_logdoc_export(
+    engine: AsyncEngine,
+    fmt: str = "ndjson",
+    kind: Optional[str] = None,
+    source: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    batch: int = EXPORT_BATCH,
+) -> AsyncIterator[bytes]:
+    """Чанки выгрузки (по одному на пачку строк) в порядке id."""
+    table = LogDoc.__table__
+    stmt = select(table.c.id, table.c.kind, table.c.source, table.c.timestamp, table.c.content)
+    if kind:
+        stmt = stmt.where(table.c.kind == kind)
+    if source:
+        stmt = stmt.where(table.c.source == source)
+    if since:
+        stmt = stmt.where(table.c.timestamp >= since)
+    if until:
+        stmt = stmt.where(table.c.timestamp < until)
+    stmt = stmt.order_by(table.c.id)
+
+    # wbits=31 — формат gzip, а не голый zlib
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    header = fmt == "csv"
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=batch))
+        async for rows in result.partitions():
+            data = encode(_csv_chunk(rows, header) if fmt == "csv" else _ndjson_chunk(rows))
+            header = False
+            if data:
+                yield data
+    tail = encode(_csv_chunk([], True)) if header else b""
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
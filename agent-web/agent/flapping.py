@@ -0,0 +1,186 @@
+"""
+Детектор флаппинга мониторов: анализ не запускается на каждом DOWN осциллирующего
+монитора, один сводный анализ — когда он стабилизировался.
+
+Как flap detection в Nagios, но по времени, а не по последним 21 проверке: вебхук
+Kuma приходит только на смену статуса. Смены up ↔ down за последние FLAP_WINDOW_S
+секунд взвешиваются по свежести (самая старая — 0.8, только что — 1.2), сумма в
+процентах от FLAP_FULL_CHANGES (= 100 %). Гистерезис:
+- ≥ FLAP_HIGH % — монитор флапает: смены записываются (инциденты, счётчики), но
+  без docker logs, Cursor и Telegram; о начале — одно короткое уведомление;
+- выход — когда процент < FLAP_LOW и смен не было FLAP_STABLE_S секунд; тогда
+  фоновая задача (flap_loop) запускает один сводный анализ по итоговому статусу.
+  Монитор, который FLAP_STABLE_S стабильно лежит, выходит сразу, не дожидаясь,
+  пока смены уйдут из окна: это уже авария. Окно при выходе очищается — сводка
+  покрыла эти смены, следующий DOWN/UP обрабатывается обычным путём.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+FLAP_ENABLED = os.environ.get("FLAP_ENABLED", "true").lower() in ("1", "true", "yes")
+FLAP_WINDOW_S = float(os.environ.get("FLAP_WINDOW_S", "3600"))
+FLAP_FULL_CHANGES = float(os.environ.get("FLAP_FULL_CHANGES", "10"))
+FLAP_HIGH = float(os.environ.get("FLAP_HIGH", "50"))
+FLAP_LOW = float(os.environ.get("FLAP_LOW", "25"))
+FLAP_STABLE_S = float(os.environ.get("FLAP_STABLE_S", "600"))
+FLAP_CHECK_INTERVAL = float(os.environ.get("FLAP_CHECK_INTERVAL", "30"))
+# Сколько подавленных смен хранить для сводки
+FLAP_KEPT = 200
+
+# Статусы вебхука, между которыми считаются смены
+_STATES = ("up", "down")
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+class FlapDecision(NamedTuple):
+    suppress: bool
+    started: bool
+    percent: float
+
+
+@dataclass
+class FlapState:
+    changes: Deque[float] = field(default_factory=deque)
+    status: Optional[str] = None
+    last_change: Optional[float] = None
+    flapping_since: Optional[float] = None
+    peak: float = 0.0
+    suppressed: Deque[Tuple[float, str, str]] = field(default_factory=lambda: deque(maxlen=FLAP_KEPT))
+
+    def percent(self, now: float) -> float:
+        while self.changes and now - self.changes[0] > FLAP_WINDOW_S:
+            self.changes.popleft()
+        weighted = sum(0.8 + 0.4 * (1 - (now - at) / FLAP_WINDOW_S) for at in self.changes)
+        return min(100.0, weighted / FLAP_FULL_CHANGES * 100)
+
+
+class FlapDetector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.monitors: Dict[str, FlapState] = {}
+
+    def observe(self, name: str, status: str, message: str = "", at: Optional[float] = None) -> FlapDecision:
+        """Учитывает алерт вебхука; suppress — монитор флапает, анализ не нужен."""
+        at = at or time.time()
+        with self._lock:
+            state = self.monitors.get(name)
+            if state is None:
+                state = self.monitors[name] = FlapState()
+            if status not in _STATES:
+                return FlapDecision(state.flapping_since is not None, False, state.percent(at))
+            # Повтор того же статуса (повторная доставка вебхука) — не смена
+            if state.status is not None and status != state.status:
+                state.changes.append(at)
+                state.last_change = at
+            state.status = status
+            percent = state.percent(at)
+            started = False
+            if state.flapping_since is None and percent >= FLAP_HIGH:
+                state.flapping_since = at
+                state.peak = percent
+                started = True
+            if state.flapping_since is None:
+                return FlapDecision(False, False, percent)
+            state.peak = max(state.peak, percent)
+            state.suppressed.append((at, status, message or ""))
+            return FlapDecision(True, started, percent)
+
+    def tick(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Мониторы, вышедшие из флаппинга (гистерезис + тишина FLAP_STABLE_S), — со сводкой."""
+        now = now or time.time()
+        stabilized = []
+        with self._lock:
+            for name, state in self.monitors.items():
+                if state.flapping_since is None:
+                    continue
+                if now - (state.last_change or 0) < FLAP_STABLE_S:
+                    continue
+                if state.percent(now) >= FLAP_LOW and state.status != "down":
+                    continue
+                events = list(state.suppressed)
+                stabilized.append({
+                    "monitor_name": name,
+                    "final_status": state.status,
+                    "flapping_since": _iso(state.flapping_since),
+                    "stable_since": _iso(state.last_change),
+                    "duration_s": round((state.last_change or now) - state.flapping_since),
+                    "transitions": len(events),
+                    "downs": sum(1 for _, status, _ in events if status == "down"),
+                    "peak_percent": round(state.peak, 1),
+                    "changes": [
+                        {"time": _iso(at), "status": status, "msg": msg} for at, status, msg in events[-20:]
+                    ],
+                })
+                state.flapping_since = None
+                state.peak = 0.0
+                state.suppressed.clear()
+                state.changes.clear()
+        return stabilized
+
+    def is_flapping(self, name: str) -> bool:
+        state = self.monitors.get(name)
+        return state is not None and state.flapping_since is not None
+
+    def status(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        with self._lock:
+            return {
+                name: {
+                    "flapping": state.flapping_since is not None,
+                    "flapping_since": _iso(state.flapping_since),
+                    "percent": round(state.percent(now), 1),
+                    "changes_in_window": len(state.changes),
+                    "suppressed": len(state.suppressed),
+                    "status": state.status,
+                }
+                for name, state in self.monitors.items()
+            }
+
+
+_detector = FlapDetector()
+
+
+def get_flap_detector() -> FlapDetector:
+    return _detector
+
+
+def flap_observe(name: str, status: str, message: str = "") -> FlapDecision:
+    if not FLAP_ENABLED:
+        return FlapDecision(False, False, 0.0)
+    return _detector.observe(name, status, message)
+
+
+def flap_status() -> Dict[str, Any]:
+    return {
+        "enabled": FLAP_ENABLED,
+        "thresholds": {"high": FLAP_HIGH, "low": FLAP_LOW, "window_s": FLAP_WINDOW_S, "stable_s": FLAP_STABLE_S},
+        "monitors": _detector.status(),
+    }
+
+
+async def flap_loop(on_stable: Callable[[Dict[str, Any]], Awaitable[Any]]) -> None:
+    """Раз в FLAP_CHECK_INTERVAL проверяет флапающие мониторы; по стабилизации — on_stable(сводка)."""
+    if not FLAP_ENABLED:
+        return
+    while True:
+        await asyncio.sleep(FLAP_CHECK_INTERVAL)
+        for summary in _detector.tick():
+            print(
+                f"🔁 {summary['monitor_name']}: флаппинг закончился ({summary['transitions']} смен), "
+                f"итог — {summary['final_status']}; сводный анализ",
+                flush=True,
+            )
+            try:
+                await on_stable(summary)
+            except Exception as e:
+                print(f"⚠️ Сводка флаппинга {summary['monitor_name']}: {e}", flush=True)
@@ -4,6 +4,7 @@
 """
 
 import os
+import threading
 from typing import Annotated, TypedDict
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langgraph.graph import StateGraph, END
@@ -11,26 +12,14 @@ from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph.message import add_messages
 
-from .tools import ALL_CUSTOM_TOOLS
-from .uptime_kuma_tools import UPTIME_KUMA_TOOLS
-from .uptime_kuma_socketio_tools import UPTIME_KUMA_SOCKETIO_TOOLS
 # from .memory_tools import MEMORY_TOOLS, set_session_id  # Временно отключено для Groq
-from .llm import get_llm
-from langchain_community.tools.tavily_search import TavilySearchResults
 
-
-# Инициализация LLM
-llm = get_llm()
-
-# Создаем список всех инструментов
-search_tool = TavilySearchResults(max_results=5)  # Увеличиваем количество результатов
-
-# Объединяем все инструменты (память временно отключена для Groq)
-tools = [search_tool] + ALL_CUSTOM_TOOLS + UPTIME_KUMA_TOOLS + UPTIME_KUMA_SOCKETIO_TOOLS  # + MEMORY_TOOLS
-
-# Отладочная информация
-print(f"🔧 Загружено инструментов: {len(tools)}")
-# print(f"🧠 Инструменты памяти: {[tool.name for tool in MEMORY_TOOLS]}")  # Временно отключено
+# LLM, Tavily и инструменты создаются при первом get_graph(), а не при импорте
+llm = None
+llm_with_tools = None
+tools: list = []
+_graph = None
+_graph_lock = threading.Lock()
 
 # Системный промпт для агента
 SYSTEM_PROMPT = """Ты - Homelab Agent, умный помощник для управления домашней лабораторией.
@@ -140,26 +129,45 @@ SYSTEM_PROMPT = """Ты - Homelab Agent, умный помощник для уп
 
 ПОМНИ: Ты можешь искать информацию в реальном времени - используй эту возможность!"""
 
-# Привязываем инструменты к LLM (только если LLM доступен)
-if llm is not None:
-    try:
-        llm_with_tools = llm.bind_tools(tools)
-        print(f"✅ LLM с инструментами инициализирован успешно")
-        print(f"🔧 Количество инструментов: {len(tools)}")
-    except Exception as e:
-        print(f"❌ Ошибка привязки инструментов к LLM: {e}")
+
+def _init_llm_and_tools() -> None:
+    """Инициализация LLM и списка инструментов (при первом построении графа)."""
+    global llm, llm_with_tools, tools
+    from .tools import ALL_CUSTOM_TOOLS
+    from .uptime_kuma_tools import UPTIME_KUMA_TOOLS
+    from .uptime_kuma_socketio_tools import UPTIME_KUMA_SOCKETIO_TOOLS
+    from .llm import get_llm
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    # Инициализация LLM
+    llm = get_llm()
+
+    # Создаем список всех инструментов
+    search_tool = TavilySearchResults(max_results=5)  # Увеличиваем количество результатов
+
+    # Объединяем все инструменты (память временно отключена для Groq)
+    tools = [search_tool] + ALL_CUSTOM_TOOLS + UPTIME_KUMA_TOOLS + UPTIME_KUMA_SOCKETIO_TOOLS  # + MEMORY_TOOLS
+
+    # Отладочная информация
+    print(f"🔧 Загружено инструментов: {len(tools)}")
+
+    # Привязываем инструменты к LLM (только если LLM доступен)
+    if llm is not None:
+        try:
+            llm_with_tools = llm.bind_tools(tools)
+            print(f"✅ LLM с инструментами инициализирован успешно")
+            print(f"🔧 Количество инструментов: {len(tools)}")
+        except Exception as e:
+            print(f"❌ Ошибка привязки инструментов к LLM: {e}")
+            llm_with_tools = None
+    else:
         llm_with_tools = None
-else:
-    llm_with_tools = None
 
 # Создаем состояние
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     session_id: str  # Добавляем session_id в состояние
 
-# Создаем граф
-graph_builder = StateGraph(State)
-
 def chatbot(state: State):
     """Основной узел чат-бота"""
     # Добавляем системный промпт к каждому запросу
@@ -234,32 +242,41 @@ def chatbot(state: State):
 #     tool_node = ToolNode(tools)
 #     return tool_node.invoke(state)
 
-# Используем стандартный ToolNode без поддержки памяти
-tool_node = ToolNode(tools)
+def _build_graph():
+    _init_llm_and_tools()
+    graph_builder = StateGraph(State)
+
+    # Используем стандартный ToolNode без поддержки памяти
+    tool_node = ToolNode(tools)
 
-# Добавляем узлы
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_node("tools", tool_node)
+    # Добавляем узлы
+    graph_builder.add_node("chatbot", chatbot)
+    graph_builder.add_node("tools", tool_node)
 
-# Добавляем условные ребра
-graph_builder.add_conditional_edges(
-    "chatbot",
-    tools_condition,
-    {
-        "tools": "tools",
-        END: END
-    }
-)
+    # Добавляем условные ребра
+    graph_builder.add_conditional_edges(
+        "chatbot",
+        tools_condition,
+        {
+            "tools": "tools",
+            END: END
+        }
+    )
 
-# Добавляем ребро от инструментов обратно к чат-боту
-graph_builder.add_edge("tools", "chatbot")
+    # Добавляем ребро от инструментов обратно к чат-боту
+    graph_builder.add_edge("tools", "chatbot")
 
-# Устанавливаем точку входа
-graph_builder.set_entry_point("chatbot")
+    # Устанавливаем точку входа
+    graph_builder.set_entry_point("chatbot")
 
-# Компилируем граф с памятью
-graph = graph_builder.compile(checkpointer=InMemorySaver())
+    # Компилируем граф с памятью
+    return graph_builder.compile(checkpointer=InMemorySaver())
 
 def get_graph():
-    """Получение скомпилированного графа"""
-    return graph
\ No newline at end of file
+    """Получение скомпилированного графа (строится при первом вызове)"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = _build_graph()
+    return _graph
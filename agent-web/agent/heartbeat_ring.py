@@ -0,0 +1,252 @@
+"""
+Последние heartbeat'ы мониторов в кольцевых буферах фиксированного размера.
+
+Вместо deque/списка словарей Kuma на монитор — строка в заранее выделенных
+массивах numpy: время (unix, с), статус, ping, id сообщения, флаг important.
+Сообщения интернируются в общую таблицу (у монитора их обычно несколько
+разных: "200 - OK", "timeout of 48000ms exceeded"), так что строки не
+дублируются в каждом heartbeat'е.
+
+Кольцо зеркальное: слот пишется и в pos, и в pos + size, поэтому последние n
+heartbeat'ов — всегда непрерывный срез [start, start + n), то есть view без
+копирования и без склейки двух кусков. Слотов на один больше ёмкости: следующая
+запись никогда не попадает в окно, которое сейчас читают, так что инструменты
+в потоках читают без блокировок (пишет один поток — event loop или поток
+socket.io). При росте числа мониторов массивы пересоздаются, старые view
+остаются валидными. Исключение — расшифровка id сообщений в строки (beats):
+сжатие таблицы сообщений перенумеровывает id, поэтому она идёт под блокировкой.
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from .slo import beat_time
+
+
+class Window(NamedTuple):
+    """Последние heartbeat'ы монитора, старые первыми; поля — view строк кольца."""
+
+    ts: np.ndarray
+    status: np.ndarray
+    ping: np.ndarray
+    msg: np.ndarray
+    important: np.ndarray
+
+
+class MessageTable:
+    """
+    Интернирование сообщений heartbeat'ов: строка ↔ int32, id 0 — пустое.
+    Хранилища с общей таблицей пишут под её блокировкой; под ней же id
+    переводятся в строки — иначе читатель мог бы взять id до сжатия, а строки после.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stores: List["HeartbeatStore"] = []
+        self._ids: Dict[str, int] = {"": 0}
+        self._strings: List[str] = [""]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern(self, msg: Any) -> int:
+        if not msg:
+            return 0
+        msg = str(msg)
+        mid = self._ids.get(msg)
+        if mid is None:
+            mid = self._ids[msg] = len(self._strings)
+            self._strings.append(msg)
+        return mid
+
+    def get(self, mid: int) -> str:
+        strings = self._strings
+        return strings[mid] if 0 <= mid < len(strings) else ""
+
+    def maybe_compact(self) -> None:
+        """Сообщений больше, чем слотов во всех кольцах, — оставляет только используемые."""
+        slots = sum(store._msg.size for store in self.stores)
+        if len(self._strings) <= 2 * slots:
+            return
+        keep = np.unique(np.concatenate([[0]] + [store._msg.ravel() for store in self.stores]))
+        remap = np.zeros(len(self._strings), dtype=np.int32)
+        remap[keep] = np.arange(len(keep), dtype=np.int32)
+        strings = [self._strings[i] for i in keep]
+        self._ids = {s: i for i, s in enumerate(strings)}
+        self._strings = strings
+        for store in self.stores:
+            store._msg = remap[store._msg]
+
+
+class HeartbeatStore:
+    """
+    Кольца по capacity последних heartbeat'ов на монитор.
+
+    Несколько хранилищ (все heartbeat'ы и important) могут делить одну
+    MessageTable. Запись — под блокировкой, чтение — по счётчику без неё.
+    """
+
+    def __init__(self, capacity: int, messages: Optional[MessageTable] = None, rows: int = 16):
+        self.capacity = int(capacity)
+        self.messages = messages if messages is not None else MessageTable()
+        self.messages.stores.append(self)
+        self._size = self.capacity + 1
+        self._lock = self.messages.lock
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._allocate(rows)
+
+    def _allocate(self, rows: int) -> None:
+        width = 2 * self._size
+        ts = np.zeros((rows, width), dtype=np.float64)
+        status = np.full((rows, width), -1, dtype=np.int8)
+        ping = np.full((rows, width), np.nan, dtype=np.float32)
+        msg = np.zeros((rows, width), dtype=np.int32)
+        important = np.zeros((rows, width), dtype=bool)
+        count = np.zeros(rows, dtype=np.int64)
+        old = getattr(self, "_count", None)
+        if old is not None:
+            n = len(old)
+            ts[:n], status[:n], ping[:n] = self._ts, self._status, self._ping
+            msg[:n], important[:n], count[:n] = self._msg, self._important, old
+            self._free.extend(range(rows - 1, n - 1, -1))
+        else:
+            self._free = list(range(rows - 1, -1, -1))
+        # Сначала данные, потом счётчики: читатель не увидит count без строк
+        self._ts, self._status, self._ping = ts, status, ping
+        self._msg, self._important = msg, important
+        self._count = count
+
+    def _row(self, mid: int) -> int:
+        row = self._rows.get(mid)
+        if row is None:
+            if not self._free:
+                self._allocate(2 * len(self._count))
+            row = self._free.pop()
+            self._count[row] = 0
+            self._rows = {**self._rows, mid: row}
+        return row
+
+    def _write(self, row: int, beat: Dict[str, Any]) -> None:
+        size = self._size
+        pos = int(self._count[row] % size)
+        ts = beat_time(beat.get("time"))
+        status = beat.get("status")
+        ping = beat.get("ping")
+        values = (
+            (self._ts, ts if ts is not None else np.nan),
+            (self._status, status if isinstance(status, int) else -1),
+            (self._ping, ping if isinstance(ping, (int, float)) else np.nan),
+            (self._msg, self.messages.intern(beat.get("msg"))),
+            (self._important, bool(beat.get("important"))),
+        )
+        for column, value in values:
+            column[row, pos] = value
+            column[row, pos + size] = value
+        self._count[row] += 1
+
+    def append(self, mid: int, beat: Dict[str, Any]) -> None:
+        with self._lock:
+            self._write(self._row(mid), beat)
+            self.messages.maybe_compact()
+
+    def extend(self, mid: int, beats: Iterable[Dict[str, Any]], overwrite: bool = False) -> None:
+        """Дописывает heartbeat'ы (старые первыми); overwrite — сначала очищает кольцо."""
+        with self._lock:
+            row = self._row(mid)
+            if overwrite:
+                self._count[row] = 0
+            for beat in beats:
+                self._write(row, beat)
+            self.messages.maybe_compact()
+
+    def drop(self, mid: int) -> None:
+        with self._lock:
+            rows = dict(self._rows)
+            row = rows.pop(mid, None)
+            if row is None:
+                return
+            self._rows = rows
+            self._count[row] = 0
+            self._free.append(row)
+
+    def __contains__(self, mid: int) -> bool:
+        return mid in self._rows
+
+    def monitors(self) -> List[int]:
+        return list(self._rows)
+
+    def count(self, mid: int) -> int:
+        row = self._rows.get(mid)
+        return 0 if row is None else int(min(self._count[row], self.capacity))
+
+    def window(self, mid: int, n: Optional[int] = None) -> Window:
+        """Последние n heartbeat'ов (все — по умолчанию) как view, без копирования."""
+        row = self._rows.get(mid)
+        count = self._count
+        total = 0 if row is None else int(min(count[row], self.capacity))
+        n = total if n is None else max(0, min(int(n), total))
+        if row is None:
+            row, start = 0, 0
+        else:
+            start = int((count[row] - n) % self._size)
+        end = start + n
+        return Window(
+            self._ts[row, start:end],
+            self._status[row, start:end],
+            self._ping[row, start:end],
+            self._msg[row, start:end],
+            self._important[row, start:end],
+        )
+
+    def beats(self, mid: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Последние heartbeat'ы в формате Kuma (time в UTC, как у Kuma)."""
+        get = self.messages.get
+        with self._lock:
+            w = self.window(mid, limit)
+            msgs = [get(m) for m in w.msg.tolist()]
+        beats = []
+        for ts, status, ping, msg, important in zip(
+            w.ts.tolist(), w.status.tolist(), w.ping.tolist(), msgs, w.important.tolist()
+        ):
+            beats.append({
+                "monitorID": mid,
+                "status": status if status >= 0 else None,
+                "time": _format_time(ts),
+                "msg": msg,
+                "ping": None if ping != ping else round(ping, 3),
+                "important": important,
+            })
+        return beats
+
+    def latest(self, mid: int) -> Optional[Dict[str, Any]]:
+        beats = self.beats(mid, 1)
+        return beats[0] if beats else None
+
+    def stats(self, mid: int) -> Dict[str, Any]:
+        """total/up/down/uptime% по кольцу — без прохода по словарям."""
+        status = self.window(mid).status
+        total = len(status)
+        if not total:
+            return {}
+        up = int(np.count_nonzero(status == 1))
+        return {
+            "total_heartbeats": total,
+            "up_count": up,
+            "down_count": total - up,
+            "uptime_percentage": round(up / total * 100, 2),
+        }
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self._ts, self._status, self._ping, self._msg, self._important, self._count)
+        return sum(a.nbytes for a in arrays)
+
+
+def _format_time(ts: float) -> Optional[str]:
+    if ts != ts:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
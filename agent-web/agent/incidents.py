@@ -0,0 +1,409 @@
+"""
+Структурированная история инцидентов (таблица Incident).
+
+Вебхук Uptime Kuma ведёт инцидент по состояниям
+open → analyzing → notified → resolved: DOWN открывает (повторный DOWN при
+открытом инциденте новый не создаёт и повторно не анализируется), UP
+закрывает, считает длительность и обновляет накопительные агрегаты монитора (MonitorStats) за O(1).
+Статистика за период — агрегаты SQL по индексу (opened_at).
+
+Каждая запись инцидента в той же транзакции прибавляет счётчики в часовую
+корзину MonitorHourly (upsert), так что счётчики за любое окно — сумма
+корзин, а не скан истории.
+
+Функции принимают sync Session: из async-обработчиков они вызываются через
+AsyncSession.run_sync, из инструментов агента — с Session(get_engine()).
+"""
+
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from db import dialect_insert
+from models import Incident, MonitorHourly, MonitorStats, now_tz
+
+_VOLATILE_RE = re.compile(r"\d+")
+
+STATES = ("open", "analyzing", "notified", "resolved")
+TRANSITIONS = {
+    "open": {"analyzing", "notified", "resolved"},
+    "analyzing": {"notified", "resolved"},
+    "notified": {"resolved"},
+    "resolved": set(),
+}
+# Анализ не удался: ошибка Cursor CLI или откат на базовый анализ
+CURSOR_FAILURE_TYPES = {"cursor_cli_error", "basic"}
+COUNTERS = ("down_events", "up_events", "analyses", "analysis_ms_total", "cursor_failures")
+
+
+class P2Quantile:
+    """
+    Потоковая оценка квантиля (Jain & Chlamtac, P²): пять маркеров, O(1) память
+    и время на наблюдение. Состояние сериализуется в dict для MonitorStats.
+    """
+
+    def __init__(self, p: float = 0.95, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.p = p
+        self.q: List[float] = list(state.get("q", []))
+        self.n: List[int] = list(state.get("n", [0, 1, 2, 3, 4]))
+        self.np: List[float] = list(state.get("np", [0, 2 * p, 4 * p, 2 + 2 * p, 4]))
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float) -> None:
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            # Пока наблюдений мало — квантиль по рангу
+            return self.q[min(len(self.q) - 1, int(round(self.p * (len(self.q) - 1))))]
+        return self.q[2]
+
+    def state(self) -> Dict[str, Any]:
+        return {"q": self.q, "n": self.n, "np": self.np}
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(round(seconds))
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days:
+        return f"{days} д {hours} ч"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {secs} с"
+    return f"{secs} с"
+
+
+def fingerprint(monitor_name: str, message: Optional[str]) -> str:
+    """Отпечаток причины: монитор + сообщение без чисел (порты, IP, таймауты)."""
+    normalized = _VOLATILE_RE.sub("#", (message or "").strip().lower())
+    return hashlib.sha1(f"{monitor_name}\0{normalized}".encode("utf-8")).hexdigest()[:16]
+
+
+def hour_bucket(at: datetime) -> datetime:
+    if at.tzinfo is None:
+        at = at.astimezone()
+    return at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def bump_counters(
+    session: Session,
+    monitor_name: str,
+    at: Optional[datetime] = None,
+    **deltas: float,
+) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE: прибавляет deltas к корзине (monitor, час)."""
+    deltas = {k: v for k, v in deltas.items() if k in COUNTERS and v}
+    if not deltas:
+        return
+    stmt = dialect_insert(session.get_bind())(MonitorHourly).values(
+        monitor_name=monitor_name, bucket=hour_bucket(at or now_tz()), **deltas
+    )
+    table = MonitorHourly.__table__
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.monitor_name, table.c.bucket],
+        set_={k: table.c[k] + stmt.excluded[k] for k in deltas},
+    ))
+
+
+def _unresolved(session: Session, monitor_name: str, lock: bool = False) -> List[Incident]:
+    stmt = select(Incident).where(
+        Incident.monitor_name == monitor_name, Incident.resolved_at.is_(None)
+    ).order_by(Incident.opened_at)
+    if lock:
+        stmt = stmt.with_for_update()
+    return list(session.exec(stmt).all())
+
+
+def open_incident(
+    session: Session,
+    details: Dict[str, Any],
+    analysis_type: Optional[str] = None,
+    report_path: Optional[str] = None,
+) -> Tuple[Incident, bool]:
+    """
+    Открывает инцидент или возвращает уже открытый по этому монитору;
+    второе значение — True, если инцидент новый (анализ и уведомление нужны).
+
+    INSERT ... ON CONFLICT DO NOTHING по частичному уникальному индексу
+    incident_monitor_unresolved: два параллельных DOWN не откроют два инцидента.
+    """
+    monitor_name = details.get("monitor_name") or "unknown"
+    bump_counters(session, monitor_name, down_events=1)
+    table = Incident.__table__
+    stmt = dialect_insert(session.get_bind())(Incident).values(
+        monitor_name=monitor_name,
+        monitor_type=details.get("monitor_type"),
+        status=details.get("status") or "down",
+        state="open",
+        opened_at=now_tz(),
+        analysis_type=analysis_type,
+        fingerprint=fingerprint(monitor_name, details.get("message")),
+        report_path=report_path,
+        details={k: v for k, v in details.items() if k != "container_logs"},
+    ).on_conflict_do_nothing(
+        index_elements=[table.c.monitor_name],
+        index_where=table.c.resolved_at.is_(None),
+    )
+    created = session.execute(stmt).rowcount == 1
+    return _unresolved(session, monitor_name)[-1], created
+
+
+def advance_incident(
+    session: Session,
+    incident_id: int,
+    state: Optional[str] = None,
+    **fields: Any,
+) -> bool:
+    """Переводит инцидент в state (если переход допустим) и обновляет поля."""
+    incident = session.get(Incident, incident_id)
+    if incident is None:
+        return False
+    if state and state != incident.state:
+        if state not in TRANSITIONS.get(incident.state, ()):
+            print(f"⚠️ Incident {incident_id}: переход {incident.state} → {state} недопустим")
+            return False
+        incident.state = state
+    for key, value in fields.items():
+        setattr(incident, key, value)
+    session.add(incident)
+    return True
+
+
+def record_analysis(
+    session: Session,
+    incident_id: int,
+    analysis_type: str,
+    analysis_ms: float,
+    report_path: Optional[str] = None,
+) -> bool:
+    """Результат анализа в инциденте + счётчики анализов/сбоев Cursor."""
+    incident = session.get(Incident, incident_id)
+    if incident is None:
+        return False
+    incident.analysis_type = analysis_type
+    incident.report_path = report_path
+    session.add(incident)
+    bump_counters(
+        session,
+        incident.monitor_name,
+        analyses=1,
+        analysis_ms_total=analysis_ms,
+        cursor_failures=1 if analysis_type in CURSOR_FAILURE_TYPES else 0,
+    )
+    return True
+
+
+def _record_resolution(session: Session, monitor_name: str, duration: float, at: datetime) -> MonitorStats:
+    """Обновляет агрегаты монитора одним закрытым инцидентом — без перечитывания истории."""
+    stats = session.exec(
+        select(MonitorStats).where(MonitorStats.monitor_name == monitor_name).with_for_update()
+    ).first()
+    if stats is None:
+        stats = MonitorStats(monitor_name=monitor_name)
+    estimator = P2Quantile(0.95, stats.p95_state)
+    estimator.add(duration)
+    stats.incidents += 1
+    stats.total_downtime_s += duration
+    stats.mttr_s = stats.total_downtime_s / stats.incidents
+    stats.max_duration_s = max(stats.max_duration_s, duration)
+    stats.p95_duration_s = estimator.value()
+    # Новый dict, чтобы ORM увидел изменение JSON-колонки
+    stats.p95_state = estimator.state()
+    stats.last_resolved_at = at
+    session.add(stats)
+    return stats
+
+
+def resolve_incident(
+    session: Session,
+    monitor_name: str,
+    at: Optional[datetime] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Закрывает открытые инциденты монитора (UP). Возвращает длительность
+    самого раннего из них — это и есть простой сервиса.
+    """
+    at = at or now_tz()
+    bump_counters(session, monitor_name, at, up_events=1)
+    open_incidents = _unresolved(session, monitor_name, lock=True)
+    if not open_incidents:
+        return None
+    for incident in open_incidents:
+        opened = incident.opened_at
+        if opened.tzinfo is None and at.tzinfo is not None:
+            # SQLite возвращает время без пояса
+            opened = opened.replace(tzinfo=at.tzinfo)
+        duration = max(0.0, (at - opened).total_seconds())
+        incident.state = "resolved"
+        incident.resolved_at = at
+        incident.duration_s = duration
+        session.add(incident)
+    first = open_incidents[0]
+    stats = _record_resolution(session, monitor_name, first.duration_s, at)
+    return {
+        "incident_id": first.id,
+        "opened_at": first.opened_at.isoformat(),
+        "duration_s": first.duration_s,
+        "mttr_s": stats.mttr_s,
+        "incidents": stats.incidents,
+    }
+
+
+def monitor_stats(session: Session, monitor_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    stmt = select(MonitorStats).order_by(MonitorStats.total_downtime_s.desc())
+    if monitor_name:
+        stmt = stmt.where(MonitorStats.monitor_name == monitor_name)
+    return [
+        {
+            "monitor_name": row.monitor_name,
+            "incidents": row.incidents,
+            "total_downtime_s": round(row.total_downtime_s, 1),
+            "mttr_s": round(row.mttr_s, 1),
+            "p95_duration_s": round(row.p95_duration_s, 1) if row.p95_duration_s is not None else None,
+            "max_duration_s": round(row.max_duration_s, 1),
+            "last_resolved_at": row.last_resolved_at.isoformat() if row.last_resolved_at else None,
+        }
+        for row in session.exec(stmt).all()
+    ]
+
+
+def _duration_seconds(session: Session):
+    """resolved_at - opened_at в секундах для текущего диалекта."""
+    if session.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", Incident.resolved_at - Incident.opened_at)
+    return (func.julianday(Incident.resolved_at) - func.julianday(Incident.opened_at)) * 86400
+
+
+def incident_statistics(
+    session: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    monitor_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Агрегаты по инцидентам, открытым в [since, until)."""
+    until = until or now_tz()
+    since = since or until - timedelta(days=7)
+    window = [Incident.opened_at >= since, Incident.opened_at < until]
+    if monitor_name:
+        window.append(Incident.monitor_name == monitor_name)
+    duration = _duration_seconds(session)
+
+    def grouped(column) -> List[Dict[str, Any]]:
+        rows = session.execute(
+            select(
+                column,
+                func.count(),
+                func.count(Incident.resolved_at),
+                func.avg(duration),
+            )
+            .where(*window)
+            .group_by(column)
+            .order_by(func.count().desc())
+        ).all()
+        return [
+            {
+                "key": key or "unknown",
+                "count": count,
+                "resolved": resolved,
+                "avg_duration_s": round(avg, 1) if avg is not None else None,
+            }
+            for key, count, resolved, avg in rows
+        ]
+
+    total, resolved, avg_duration = session.execute(
+        select(func.count(), func.count(Incident.resolved_at), func.avg(duration)).where(*window)
+    ).one()
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "total": total,
+        "resolved": resolved,
+        "open": total - resolved,
+        "recovery_rate": round(resolved / total, 4) if total else None,
+        "avg_duration_s": round(avg_duration, 1) if avg_duration is not None else None,
+        "by_monitor": grouped(Incident.monitor_name),
+        "by_monitor_type": grouped(Incident.monitor_type),
+        "by_analysis_type": grouped(Incident.analysis_type),
+        "top_fingerprints": grouped(Incident.fingerprint)[:10],
+    }
+
+
+def window_counters(
+    session: Session,
+    since: datetime,
+    until: Optional[datetime] = None,
+    monitor_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Счётчики за [since, until) — сумма часовых корзин (границы округляются до часа)."""
+    until = until or now_tz()
+    table = MonitorHourly.__table__
+    where = [table.c.bucket >= hour_bucket(since), table.c.bucket < hour_bucket(until) + timedelta(hours=1)]
+    if monitor_name:
+        where.append(table.c.monitor_name == monitor_name)
+    sums = [func.coalesce(func.sum(table.c[name]), 0) for name in COUNTERS]
+    rows = session.execute(
+        select(table.c.monitor_name, *sums)
+        .where(*where)
+        .group_by(table.c.monitor_name)
+        .order_by(table.c.monitor_name)
+    ).all()
+
+    def pack(values) -> Dict[str, Any]:
+        data = dict(zip(COUNTERS, values))
+        data["analysis_ms_avg"] = (
+            round(data["analysis_ms_total"] / data["analyses"], 1) if data["analyses"] else None
+        )
+        return data
+
+    monitors = {row[0]: pack(row[1:]) for row in rows}
+    totals = pack([sum(m[name] for m in monitors.values()) for name in COUNTERS])
+    return {
+        "since": hour_bucket(since).isoformat(),
+        "until": (hour_bucket(until) + timedelta(hours=1)).isoformat(),
+        "totals": totals,
+        "monitors": monitors,
+    }
@@ -0,0 +1,359 @@
+"""
+Чтение базы Uptime Kuma (kuma.db, SQLite) напрямую — только на чтение.
+
+/metrics отдаёт лишь текущее состояние, socket.io требует веб-логина; в
+kuma.db лежат все heartbeat'ы, мониторы и окна обслуживания. Агент видит
+каталог Kuma через volume /srv:/srv:ro, так что история доступна без
+учётных данных, а запросы идут по индексам Kuma (monitor_id, time) и
+(monitor_id, important, time) — миллисекунды даже на годах истории.
+
+Режимы (KUMA_DB_MODE):
+- ro — file:...?mode=ro + query_only: Kuma пишет в WAL, читатель видит
+  последнее зафиксированное состояние и ничего не блокирует;
+- snapshot — копия kuma.db (+ -wal) в KUMA_DB_SNAPSHOT_DIR, обновляется не
+  чаще KUMA_DB_SNAPSHOT_MAX_AGE секунд (каталог Kuma недоступен даже для
+  чтения -shm, Kuma остановлена и т.п.);
+- auto (по умолчанию) — ro, при ошибке открытия — snapshot.
+
+SQL — константы с параметрами: sqlite3 кэширует подготовленные выражения
+соединения по тексту запроса (cached_statements). Столбцы monitor
+отбираются по белому списку: в таблице лежат пароли и токены проверок.
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+KUMA_DB_PATH = os.environ.get("KUMA_DB_PATH", "/srv/homelab/uptime-kuma/kuma.db")
+KUMA_DB_MODE = os.environ.get("KUMA_DB_MODE", "auto").lower()
+KUMA_DB_SNAPSHOT_DIR = os.environ.get("KUMA_DB_SNAPSHOT_DIR", "./data/kuma_snapshot")
+KUMA_DB_SNAPSHOT_MAX_AGE = float(os.environ.get("KUMA_DB_SNAPSHOT_MAX_AGE", "60"))
+KUMA_DB_BUSY_TIMEOUT_MS = int(os.environ.get("KUMA_DB_BUSY_TIMEOUT_MS", "2000"))
+
+MODES = ("auto", "ro", "snapshot")
+STATUS_TEXT = {0: "DOWN", 1: "UP", 2: "PENDING", 3: "MAINTENANCE"}
+
+# Безопасные столбцы monitor (остальные — учётные данные, заголовки, тела запросов)
+MONITOR_COLUMNS = (
+    "id", "name", "type", "url", "hostname", "port", "interval", "retry_interval",
+    "maxretries", "active", "parent", "description", "keyword", "method",
+    "upside_down", "created_date",
+)
+MAINTENANCE_COLUMNS = (
+    "id", "title", "description", "active", "strategy", "start_date", "end_date",
+    "start_time", "end_time", "weekdays", "days_of_month", "interval_day", "cron",
+    "timezone", "duration",
+)
+_BEAT_COLUMNS = "id, monitor_id, status, msg, time, ping, important, duration"
+
+# Индекс monitor_time_index (monitor_id, time)
+SQL_HEARTBEATS = (
+    f"SELECT {_BEAT_COLUMNS} FROM heartbeat "
+    "WHERE monitor_id = ? AND time >= ? AND time < ? ORDER BY time DESC LIMIT ?"
+)
+# Индекс monitor_important_time_index (monitor_id, important, time)
+SQL_IMPORTANT = (
+    f"SELECT {_BEAT_COLUMNS} FROM heartbeat "
+    "WHERE monitor_id = ? AND important = 1 AND time >= ? ORDER BY time DESC LIMIT ?"
+)
+SQL_SUMMARY = (
+    "SELECT status, COUNT(*), AVG(ping), MAX(ping), MIN(time), MAX(time) FROM heartbeat "
+    "WHERE monitor_id = ? AND time >= ? AND time < ? GROUP BY status"
+)
+SQL_MONITOR_MAINTENANCE = "SELECT maintenance_id, monitor_id FROM monitor_maintenance"
+
+
+def kuma_time(ts: float) -> str:
+    """unix → формат столбца heartbeat.time ("2024-05-01 12:00:00.000", UTC)."""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _beat(row: sqlite3.Row) -> Dict[str, Any]:
+    # Формат как у heartbeat'ов socket.io — инструменты работают с обоими
+    return {
+        "id": row["id"],
+        "monitorID": row["monitor_id"],
+        "status": row["status"],
+        "time": row["time"],
+        "msg": row["msg"] or "",
+        "ping": row["ping"],
+        "important": bool(row["important"]),
+        "duration": row["duration"],
+    }
+
+
+class KumaDB:
+    """Соединение с kuma.db только на чтение; запросы сериализуются блокировкой."""
+
+    def __init__(
+        self,
+        path: str = KUMA_DB_PATH,
+        mode: str = KUMA_DB_MODE,
+        snapshot_dir: str = KUMA_DB_SNAPSHOT_DIR,
+        snapshot_max_age: float = KUMA_DB_SNAPSHOT_MAX_AGE,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"KUMA_DB_MODE: одно из {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.snapshot_dir = Path(snapshot_dir)
+        self.snapshot_max_age = snapshot_max_age
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.source: Optional[str] = None  # "ro" | "snapshot"
+        self.snapshot_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.queries = 0
+        self.total_ms = 0.0
+        self._columns: Dict[str, List[str]] = {}
+
+    # --- соединение ---
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        uri = f"file:{quote(os.path.abspath(path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=64)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only = ON")
+            conn.execute(f"PRAGMA busy_timeout = {KUMA_DB_BUSY_TIMEOUT_MS}")
+            # Первое чтение открывает WAL/-shm: ошибки доступа всплывают здесь
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _take_snapshot(self) -> str:
+        """Копирует kuma.db и -wal во временные файлы и атомарно подменяет снимок."""
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        target = self.snapshot_dir / "kuma.db"
+        tmp = self.snapshot_dir / "kuma.db.tmp"
+        # Копия не атомарна: checkpoint Kuma посреди копирования может дать битый
+        # снимок — запрос упадёт с DatabaseError, и _query переснимет базу
+        shutil.copyfile(self.path, tmp)
+        wal = Path(self.path + "-wal")
+        for suffix in ("-wal", "-shm"):
+            Path(str(target) + suffix).unlink(missing_ok=True)
+        if wal.exists() and wal.stat().st_size:
+            shutil.copyfile(wal, str(target) + "-wal")
+        os.replace(tmp, target)
+        self.snapshot_at = time.time()
+        return str(target)
+
+    def _connect(self) -> sqlite3.Connection:
+        stale = (
+            self.source == "snapshot"
+            and self.snapshot_at is not None
+            and time.time() - self.snapshot_at > self.snapshot_max_age
+        )
+        if self._conn is not None and not stale:
+            return self._conn
+        self._close()
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"нет базы Uptime Kuma: {self.path} (KUMA_DB_PATH)")
+        if self.mode in ("auto", "ro"):
+            try:
+                self._conn, self.source = self._open(self.path), "ro"
+            except sqlite3.Error as e:
+                if self.mode == "ro":
+                    raise
+                print(f"⚠️ kuma.db только на чтение не открылась ({e}), читаю снимок", flush=True)
+        if self._conn is None:
+            self._conn, self.source = self._open(self._take_snapshot()), "snapshot"
+        self._columns = {}
+        return self._conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+        self._conn = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                rows = self._connect().execute(sql, params).fetchall()
+            except sqlite3.DatabaseError as e:
+                # Повреждённый снимок (копия поймала запись на середине) или
+                # пропавший WAL — переоткрываем один раз
+                self.last_error = str(e)
+                self._close()
+                if self.source == "snapshot":
+                    self.snapshot_at = None
+                rows = self._connect().execute(sql, params).fetchall()
+            self.queries += 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+            return rows
+
+    def _table_columns(self, table: str, allowed: tuple) -> List[str]:
+        columns = self._columns.get(table)
+        if columns is None:
+            present = {row["name"] for row in self._query(f"PRAGMA table_info({table})")}
+            # Набор столбцов зависит от версии Kuma
+            columns = self._columns[table] = [c for c in allowed if c in present]
+        return columns
+
+    # --- запросы ---
+
+    def monitors(self) -> Dict[int, Dict[str, Any]]:
+        columns = self._table_columns("monitor", MONITOR_COLUMNS)
+        rows = self._query(f"SELECT {', '.join(columns)} FROM monitor ORDER BY id")
+        return {row["id"]: dict(row) for row in rows}
+
+    def monitor_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        key = (name or "").strip().lower()
+        for monitor in self.monitors().values():
+            if (monitor.get("name") or "").strip().lower() == key:
+                return monitor
+        return None
+
+    def heartbeats(
+        self,
+        monitor_id: int,
+        hours: float = 24,
+        limit: int = 1000,
+        until: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Heartbeat'ы монитора за hours часов до until (старые первыми)."""
+        until = until or time.time()
+        rows = self._query(
+            SQL_HEARTBEATS, (int(monitor_id), kuma_time(until - hours * 3600), kuma_time(until), int(limit))
+        )
+        return [_beat(row) for row in reversed(rows)]
+
+    def important(self, monitor_id: int, days: float = 30, limit: int = 50) -> List[Dict[str, Any]]:
+        """Смены статуса (important) монитора за days дней (старые первыми)."""
+        rows = self._query(SQL_IMPORTANT, (int(monitor_id), kuma_time(time.time() - days * 86400), int(limit)))
+        return [_beat(row) for row in reversed(rows)]
+
+    def summary(self, monitor_id: int, hours: float = 24, until: Optional[float] = None) -> Dict[str, Any]:
+        """Счётчики по статусам, доступность и ping за окно — агрегатом в SQLite."""
+        until = until or time.time()
+        rows = self._query(SQL_SUMMARY, (int(monitor_id), kuma_time(until - hours * 3600), kuma_time(until)))
+        counts = {STATUS_TEXT.get(row[0], str(row[0])): row[1] for row in rows}
+        total = sum(counts.values())
+        counted = total - counts.get("MAINTENANCE", 0)
+        up = next((row for row in rows if row[0] == 1), None)
+        return {
+            "hours": hours,
+            "total": total,
+            "counts": counts,
+            "availability_pct": round(counts.get("UP", 0) / counted * 100, 3) if counted else None,
+            "avg_ping_ms": round(up[2], 1) if up is not None and up[2] is not None else None,
+            "max_ping_ms": up[3] if up is not None else None,
+            "first": min((row[4] for row in rows), default=None),
+            "last": max((row[5] for row in rows), default=None),
+        }
+
+    def maintenances(self) -> List[Dict[str, Any]]:
+        """Окна обслуживания с id мониторов (monitor_maintenance)."""
+        columns = self._table_columns("maintenance", MAINTENANCE_COLUMNS)
+        if not columns:
+            return []
+        windows = {row["id"]: {**dict(row), "monitor_ids": []} for row in self._query(
+            f"SELECT {', '.join(columns)} FROM maintenance ORDER BY id"
+        )}
+        for maintenance_id, monitor_id in self._query(SQL_MONITOR_MAINTENANCE):
+            if maintenance_id in windows:
+                windows[maintenance_id]["monitor_ids"].append(monitor_id)
+        return list(windows.values())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "mode": self.mode,
+            "source": self.source,
+            "snapshot_age_s": round(time.time() - self.snapshot_at, 1) if self.snapshot_at else None,
+            "queries": self.queries,
+            "avg_ms": round(self.total_ms / self.queries, 2) if self.queries else None,
+            "last_error": self.last_error,
+        }
+
+
+_db: Optional[KumaDB] = None
+_db_lock = threading.Lock()
+
+
+def get_kuma_db() -> Optional[KumaDB]:
+    """Общий экземпляр; None — KUMA_DB_PATH пуст или файла нет."""
+    global _db
+    if not KUMA_DB_PATH or not os.path.exists(KUMA_DB_PATH):
+        return None
+    with _db_lock:
+        if _db is None:
+            _db = KumaDB()
+        return _db
+
+
+def kuma_db_status() -> Optional[Dict[str, Any]]:
+    return _db.status() if _db is not None else None
+
+
+def monitor_report(monitor_name: str, hours: float = 24, limit: int = 50) -> Optional[Dict[str, Any]]:
+    """Монитор, сводка за hours, последние heartbeat'ы и смены статуса; None — нет базы или монитора."""
+    db = get_kuma_db()
+    if db is None:
+        return None
+    monitor = db.monitor_by_name(monitor_name)
+    if monitor is None:
+        return None
+    mid = monitor["id"]
+    return {
+        "monitor": monitor,
+        "summary": db.summary(mid, hours),
+        "important": db.important(mid),
+        "heartbeats": db.heartbeats(mid, hours, limit),
+    }
+
+
+def enrich_from_kuma_db(details: Dict[str, Any], important_limit: int = 5) -> bool:
+    """
+    Как uptime_kuma_live.enrich_details, но из kuma.db — когда постоянного
+    подключения нет. False — базы нет, монитор не найден или ошибка чтения.
+    """
+    db = get_kuma_db()
+    if db is None:
+        return False
+    try:
+        monitor = db.monitor_by_name(details.get("monitor_name") or "")
+        if monitor is None:
+            return False
+        if details.get("monitor_url") in (None, "", "N/A") and monitor.get("url"):
+            details["monitor_url"] = monitor["url"]
+        if details.get("monitor_type") in (None, "", "unknown") and monitor.get("type"):
+            details["monitor_type"] = monitor["type"]
+        for key in ("hostname", "port"):
+            if not details.get(key) and monitor.get(key):
+                details[key] = monitor[key]
+        mid = monitor["id"]
+        details["kuma_monitor_id"] = mid
+        details["kuma_interval"] = monitor.get("interval")
+        details["kuma_recent_changes"] = [
+            {"time": hb["time"], "status": hb["status"], "msg": hb["msg"]}
+            for hb in db.important(mid, limit=important_limit)
+        ]
+        uptime = {}
+        for label, hours in (("24h", 24), ("720h", 720)):
+            availability = db.summary(mid, hours)["availability_pct"]
+            if availability is not None:
+                uptime[label] = round(availability, 2)
+        if uptime:
+            details["kuma_uptime"] = uptime
+        return True
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️ kuma.db: {e}", flush=True)
+        return False
@@ -0,0 +1,387 @@
+"""
+Окна обслуживания Uptime Kuma: алерты внутри окна (и grace после него)
+записываются без логов, Cursor и Telegram.
+
+Расписания читаются из kuma.db (agent.kuma_db, только чтение) раз в
+MAINT_SYNC_INTERVAL секунд и разворачиваются в конкретные интервалы на
+[сейчас − MAINT_LOOKBACK_S, сейчас + MAINT_HORIZON_S]:
+- manual — активное окно без конца;
+- single — start_date … end_date;
+- cron (и recurring-* Kuma 1.23+, которая хранит их как cron + duration) —
+  минуты, подходящие под выражение, + duration минут;
+- recurring-weekday / recurring-day-of-month / recurring-interval старых версий —
+  start_time … end_time в подходящие дни.
+Время — в часовом поясе окна (SAME_AS_SERVER и пусто — MAINT_TIMEZONE).
+
+Интервалы монитора (± grace) сливаются и сортируются; проверка алерта —
+bisect по началам, O(log n). Индекс заменяется целиком (copy-on-write),
+вебхук читает его без блокировок. Дополнительно: если постоянное подключение
+видит последний heartbeat монитора в статусе MAINTENANCE, это тоже окно.
+"""
+
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_right
+from calendar import monthrange
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+MAINT_ENABLED = os.environ.get("MAINT_ENABLED", "true").lower() in ("1", "true", "yes")
+MAINT_SYNC_INTERVAL = float(os.environ.get("MAINT_SYNC_INTERVAL", "300"))
+MAINT_GRACE_S = float(os.environ.get("MAINT_GRACE_S", "600"))
+MAINT_GRACE_BEFORE_S = float(os.environ.get("MAINT_GRACE_BEFORE_S", "60"))
+MAINT_LOOKBACK_S = float(os.environ.get("MAINT_LOOKBACK_S", "86400"))
+MAINT_HORIZON_S = float(os.environ.get("MAINT_HORIZON_S", "86400"))
+MAINT_TIMEZONE = os.environ.get("MAINT_TIMEZONE") or os.environ.get("TZ") or "UTC"
+
+_CRON_NAMES = {
+    name: i for i, name in enumerate(("sun", "mon", "tue", "wed", "thu", "fri", "sat"))
+}
+_CRON_NAMES.update({
+    name: i + 1 for i, name in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+    )
+})
+# minute, hour, day of month, month, day of week
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+class MaintenanceWindow(NamedTuple):
+    start: float
+    end: float
+    titles: Tuple[str, ...]
+
+
+class IntervalIndex:
+    """Непересекающиеся интервалы, отсортированные по началу; find — bisect."""
+
+    def __init__(self, intervals: Iterable[Tuple[float, float, str]]):
+        merged: List[List[Any]] = []
+        for start, end, title in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                last = merged[-1]
+                last[1] = max(last[1], end)
+                if title not in last[2]:
+                    last[2].append(title)
+            else:
+                merged.append([start, end, [title]])
+        self.starts = [m[0] for m in merged]
+        self.ends = [m[1] for m in merged]
+        self.titles = [tuple(m[2]) for m in merged]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find(self, at: float) -> Optional[MaintenanceWindow]:
+        i = bisect_right(self.starts, at) - 1
+        if i >= 0 and at <= self.ends[i]:
+            return MaintenanceWindow(self.starts[i], self.ends[i], self.titles[i])
+        return None
+
+
+# --- разбор расписаний ---
+
+
+def _zone(name: Optional[str]) -> ZoneInfo:
+    if not name or name.upper() == "SAME_AS_SERVER":
+        name = MAINT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def _local(value: Any, tz: ZoneInfo) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+
+def _clock(value: Any) -> Optional[Tuple[int, int]]:
+    """"HH:MM[:SS]" или {"hours": H, "minutes": M} → (H, M)."""
+    if isinstance(value, str) and value.startswith("{"):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        return int(value.get("hours", 0)), int(value.get("minutes", 0))
+    if isinstance(value, str) and ":" in value:
+        hours, minutes = value.split(":")[:2]
+        return int(hours), int(minutes)
+    return None
+
+
+def _json_list(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    try:
+        parsed = json.loads(value) if value else []
+    except (TypeError, ValueError):
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def _cron_value(token: str) -> int:
+    return _CRON_NAMES[token] if token in _CRON_NAMES else int(token)
+
+
+def _cron_field(spec: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in spec.lower().split(","):
+        part, _, step = part.partition("/")
+        if part in ("*", "?"):
+            first, last = low, high
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            first, last = _cron_value(a), _cron_value(b)
+        else:
+            first = _cron_value(part)
+            last = high if step else first
+        values.update(range(first, last + 1, int(step) if step else 1))
+    return values
+
+
+def cron_starts(expr: str, since: datetime, until: datetime) -> Iterable[datetime]:
+    """Минуты в [since, until), подходящие под 5-польное cron-выражение (L — последний день)."""
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron: ожидается 5 полей, получено {expr!r}")
+    last_day = "l" in fields[2].lower()
+    dom_spec = ",".join(p for p in fields[2].lower().split(",") if p != "l") or ("*" if not last_day else "")
+    minutes, hours, months, dows = (
+        _cron_field(fields[i], *_CRON_RANGES[i]) for i in (0, 1, 3, 4)
+    )
+    doms = _cron_field(dom_spec, 1, 31) if dom_spec else set()
+    if 7 in dows:
+        dows.add(0)
+    dom_any, dow_any = fields[2] in ("*", "?"), fields[4] in ("*", "?")
+
+    day = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < until:
+        if day.month in months:
+            in_dom = day.day in doms or (last_day and day.day == monthrange(day.year, day.month)[1])
+            in_dow = (day.isoweekday() % 7) in dows
+            # Как в cron: ограничены оба поля — достаточно любого
+            if (in_dom and in_dow) if (dom_any or dow_any) else (in_dom or in_dow):
+                for hour in sorted(hours):
+                    for minute in sorted(minutes):
+                        start = day.replace(hour=hour, minute=minute)
+                        if since <= start < until:
+                            yield start
+        day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+
+
+def _daily(days: Iterable[date], start: Tuple[int, int], end: Tuple[int, int], tz: ZoneInfo):
+    for day in days:
+        begin = datetime(day.year, day.month, day.day, *start, tzinfo=tz)
+        finish = datetime(day.year, day.month, day.day, *end, tzinfo=tz)
+        if finish <= begin:  # окно через полночь
+            finish += timedelta(days=1)
+        yield begin, finish
+
+
+def expand(maintenance: Dict[str, Any], since: float, until: float) -> List[Tuple[float, float]]:
+    """Интервалы (unix) окна обслуживания, пересекающие [since, until]."""
+    if not maintenance.get("active"):
+        return []
+    strategy = maintenance.get("strategy") or "single"
+    if strategy == "manual":
+        return [(float("-inf"), float("inf"))]
+
+    tz = _zone(maintenance.get("timezone"))
+    range_start = _local(maintenance.get("start_date"), tz)
+    range_end = _local(maintenance.get("end_date"), tz)
+    if strategy == "single":
+        if range_start is None or range_end is None:
+            return []
+        return [(range_start.timestamp(), range_end.timestamp())]
+
+    duration = timedelta(minutes=float(maintenance.get("duration") or 0))
+    # Окна, начавшиеся до since, но ещё идущие, тоже нужны
+    lookback = max(duration, timedelta(days=1))
+    low = datetime.fromtimestamp(since, tz) - lookback
+    high = datetime.fromtimestamp(until, tz)
+    if range_start is not None:
+        low = max(low, range_start)
+    if range_end is not None:
+        high = min(high, range_end)
+    if low >= high:
+        return []
+
+    windows: Iterable[Tuple[datetime, datetime]] = ()
+    cron = (maintenance.get("cron") or "").strip()
+    start_clock, end_clock = _clock(maintenance.get("start_time")), _clock(maintenance.get("end_time"))
+    if cron and duration:
+        windows = ((start, start + duration) for start in cron_starts(cron, low, high))
+    elif start_clock and end_clock:
+        days = [(low + timedelta(days=i)).date() for i in range((high - low).days + 2)]
+        if strategy == "recurring-weekday":
+            weekdays = {int(d) % 7 for d in _json_list(maintenance.get("weekdays"))}
+            days = [d for d in days if d.isoweekday() % 7 in weekdays]
+        elif strategy == "recurring-day-of-month":
+            wanted = _json_list(maintenance.get("days_of_month"))
+            days = [
+                d for d in days
+                if d.day in wanted
+                or (f"lastDay{monthrange(d.year, d.month)[1] - d.day + 1}" in wanted)
+            ]
+        elif strategy == "recurring-interval":
+            every = max(1, int(maintenance.get("interval_day") or 1))
+            origin = (range_start or low).date()
+            days = [d for d in days if (d - origin).days % every == 0]
+        windows = _daily(days, start_clock, end_clock, tz)
+
+    first = range_start.timestamp() if range_start is not None else float("-inf")
+    last = range_end.timestamp() if range_end is not None else float("inf")
+    return [
+        (begin.timestamp(), finish.timestamp())
+        for begin, finish in windows
+        if finish.timestamp() >= since and begin.timestamp() <= until and first <= begin.timestamp() <= last
+    ]
+
+
+# --- индекс и синхронизация ---
+
+
+class MaintenanceIndex:
+    def __init__(self, by_monitor: Optional[Dict[str, IntervalIndex]] = None, synced_at: Optional[float] = None):
+        self.by_monitor = by_monitor or {}
+        self.synced_at = synced_at
+
+    def find(self, monitor_name: str, at: Optional[float] = None) -> Optional[MaintenanceWindow]:
+        index = self.by_monitor.get((monitor_name or "").strip().lower())
+        return index.find(at or time.time()) if index is not None else None
+
+
+_index = MaintenanceIndex()
+_last_error: Optional[str] = None
+_windows: List[Dict[str, Any]] = []
+
+
+def build_index(
+    maintenances: List[Dict[str, Any]],
+    monitor_names: Dict[int, str],
+    now: Optional[float] = None,
+) -> MaintenanceIndex:
+    now = now or time.time()
+    since, until = now - MAINT_LOOKBACK_S, now + MAINT_HORIZON_S
+    intervals: Dict[str, List[Tuple[float, float, str]]] = {}
+    for maintenance in maintenances:
+        title = maintenance.get("title") or f"maintenance #{maintenance.get('id')}"
+        try:
+            spans = expand(maintenance, since, until)
+        except (ValueError, KeyError) as e:
+            print(f"⚠️ Окно обслуживания «{title}»: {e}", flush=True)
+            continue
+        for monitor_id in maintenance.get("monitor_ids") or []:
+            name = monitor_names.get(monitor_id)
+            if not name:
+                continue
+            bucket = intervals.setdefault(name.strip().lower(), [])
+            for start, end in spans:
+                bucket.append((start - MAINT_GRACE_BEFORE_S, end + MAINT_GRACE_S, title))
+    return MaintenanceIndex({name: IntervalIndex(spans) for name, spans in intervals.items()}, now)
+
+
+def sync_maintenance() -> MaintenanceIndex:
+    """Перечитывает окна из kuma.db и атомарно заменяет индекс."""
+    global _index, _last_error, _windows
+    from .kuma_db import get_kuma_db
+
+    db = get_kuma_db()
+    if db is None:
+        _last_error = "kuma.db недоступна (KUMA_DB_PATH)"
+        return _index
+    try:
+        maintenances = db.maintenances()
+        names = {mid: m.get("name") for mid, m in db.monitors().items()}
+    except Exception as e:
+        _last_error = str(e)
+        print(f"⚠️ Синхронизация окон обслуживания: {e}", flush=True)
+        return _index
+    _index = build_index(maintenances, names)
+    _windows = [
+        {"id": m.get("id"), "title": m.get("title"), "strategy": m.get("strategy"), "active": bool(m.get("active")),
+         "monitors": [names.get(mid) for mid in m.get("monitor_ids") or []]}
+        for m in maintenances
+    ]
+    _last_error = None
+    return _index
+
+
+def _live_maintenance(monitor_name: str) -> Optional[MaintenanceWindow]:
+    from .uptime_kuma_live import live_view
+
+    view = live_view()
+    if view is None:
+        return None
+    mid = view.by_name.get(monitor_name)
+    latest = view.heartbeats.latest(mid) if mid is not None else None
+    if latest is None or latest.get("status") != 3:
+        return None
+    now = time.time()
+    return MaintenanceWindow(now, now, ("Uptime Kuma: MAINTENANCE",))
+
+
+def maintenance_window(monitor_name: str, at: Optional[float] = None) -> Optional[MaintenanceWindow]:
+    """Окно обслуживания (с grace), в которое попадает алерт монитора, или None."""
+    if not MAINT_ENABLED:
+        return None
+    return _index.find(monitor_name, at) or _live_maintenance(monitor_name)
+
+
+def maintenance_status() -> Dict[str, Any]:
+    index, now = _index, time.time()
+    active = {}
+    for name, intervals in index.by_monitor.items():
+        window = intervals.find(now)
+        if window is not None:
+            active[name] = {
+                "titles": list(window.titles),
+                "until": (
+                    datetime.fromtimestamp(window.end, timezone.utc).isoformat(timespec="seconds")
+                    if window.end != float("inf") else None
+                ),
+            }
+    return {
+        "enabled": MAINT_ENABLED,
+        "synced_at": datetime.fromtimestamp(index.synced_at).isoformat(timespec="seconds") if index.synced_at else None,
+        "grace_s": {"before": MAINT_GRACE_BEFORE_S, "after": MAINT_GRACE_S},
+        "windows": _windows,
+        "intervals": {name: len(intervals) for name, intervals in index.by_monitor.items()},
+        "active": active,
+        "last_error": _last_error,
+    }
+
+
+def record_suppressed_alert(session, details: Dict[str, Any], window: MaintenanceWindow) -> None:
+    """Запись алерта в окне обслуживания (LogDoc kind=webhook) — вместо анализа."""
+    from models import LogDoc
+
+    session.add(LogDoc(
+        kind="webhook",
+        source="uptime_kuma_maintenance",
+        monitor_name=details.get("monitor_name"),
+        status=details.get("status"),
+        content=json.dumps({
+            "monitor_name": details.get("monitor_name"),
+            "status": details.get("status"),
+            "message": details.get("message"),
+            "maintenance": list(window.titles),
+            "datetime": details.get("datetime"),
+        }, ensure_ascii=False),
+    ))
+
+
+async def maintenance_loop() -> None:
+    """Синхронизация окон из kuma.db раз в MAINT_SYNC_INTERVAL."""
+    if not MAINT_ENABLED:
+        return
+    while True:
+        await asyncio.to_thread(sync_maintenance)
+        await asyncio.sleep(MAINT_SYNC_INTERVAL)
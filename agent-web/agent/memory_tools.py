@@ -3,32 +3,93 @@
 Позволяют сохранять и извлекать информацию из памяти в рамках сессии
 """
 
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
 from langchain_core.tools import tool
-from sqlmodel import create_engine, Session, select
-from models import LogDoc
+from sqlmodel import Session, select
+from db import dialect_insert, get_engine
+from models import LogDoc, MemoryEntry, now_tz
 import os
-import json
-from datetime import datetime
 
-# Настройки базы данных
-DB_TYPE = os.environ.get("DB_TYPE", "postgres")
-if DB_TYPE == "postgres":
-    DB_PATH = os.environ.get("AGENT_DB") or ""
-else:
-    DB_PATH = os.environ.get("AGENT_DB", "sqlite:///./agent.db")
+# session_id текущего запуска графа: ContextVar изолирует параллельные
+# запуски (asyncio-задачи и потоки) вместо общего глобального значения
+_session_id: ContextVar[str] = ContextVar("memory_session_id", default="default")
 
-# Глобальное хранилище для session_id (временное решение)
-_current_session_id = None
+# LRU-кэш (session_id, category, key) → (value, updated_at), write-through
+MEMORY_CACHE_SIZE = int(os.environ.get("MEMORY_CACHE_SIZE", "1024"))
+_cache: "OrderedDict[Tuple[str, str, str], Tuple[str, str]]" = OrderedDict()
+_cache_lock = Lock()
 
-def set_session_id(session_id: str):
-    """Устанавливает текущий session_id для инструментов памяти"""
-    global _current_session_id
-    _current_session_id = session_id
+def set_session_id(session_id: str) -> Token:
+    """Устанавливает session_id для инструментов памяти в текущем контексте"""
+    return _session_id.set(session_id or "default")
 
 def get_session_id() -> str:
     """Получает текущий session_id"""
-    return _current_session_id or "default"
+    return _session_id.get()
+
+def _cache_get(cache_key: Tuple[str, str, str]) -> Optional[Tuple[str, str]]:
+    with _cache_lock:
+        item = _cache.get(cache_key)
+        if item is not None:
+            _cache.move_to_end(cache_key)
+        return item
+
+def _cache_put(cache_key: Tuple[str, str, str], item: Tuple[str, str]) -> None:
+    with _cache_lock:
+        _cache[cache_key] = item
+        _cache.move_to_end(cache_key)
+        while len(_cache) > MEMORY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def memory_put(session_id: str, category: str, key: str, value: str) -> str:
+    """Upsert по уникальному (session_id, category, key); возвращает updated_at."""
+    updated_at = now_tz()
+    with Session(get_engine()) as session:
+        stmt = dialect_insert(session.get_bind())(MemoryEntry).values(
+            session_id=session_id, category=category, key=key, value=value, updated_at=updated_at,
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["session_id", "category", "key"],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        ))
+        session.commit()
+    item = (value, updated_at.isoformat())
+    _cache_put((session_id, category, key), item)
+    return item[1]
+
+def memory_get(session_id: str, category: str, key: str) -> Optional[Tuple[str, str]]:
+    """(value, updated_at) из кэша или одной выборкой по уникальному индексу."""
+    cache_key = (session_id, category, key)
+    item = _cache_get(cache_key)
+    if item is not None:
+        return item
+    with Session(get_engine()) as session:
+        entry = session.exec(select(MemoryEntry).where(
+            MemoryEntry.session_id == session_id,
+            MemoryEntry.category == category,
+            MemoryEntry.key == key,
+        )).first()
+    if entry is None:
+        return None
+    item = (entry.value, entry.updated_at.isoformat())
+    _cache_put(cache_key, item)
+    return item
+
+def memory_keys(session_id: str, category: str) -> List[Dict[str, Any]]:
+    """Ключи категории сессии (без значений), новые первыми."""
+    with Session(get_engine()) as session:
+        rows = session.exec(
+            select(MemoryEntry.key, MemoryEntry.updated_at)
+            .where(MemoryEntry.session_id == session_id, MemoryEntry.category == category)
+            .order_by(MemoryEntry.updated_at.desc())
+        ).all()
+    return [
+        {"key": key, "category": category, "timestamp": updated_at.isoformat()}
+        for key, updated_at in rows
+    ]
 
 @tool
 def save_to_memory(key: str, value: str, category: str = "general") -> Dict[str, Any]:
@@ -46,36 +107,14 @@ def save_to_memory(key: str, value: str, category: str = "general") -> Dict[str,
     session_id = get_session_id()
     
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        
-        with Session(engine) as session:
-            # Создаем запись в памяти
-            memory_entry = LogDoc(
-                kind="memory",
-                source=f"{session_id}_{category}",
-                content=json.dumps({
-                    "key": key,
-                    "value": value,
-                    "category": category,
-                    "timestamp": datetime.now().isoformat()
-                })
-            )
-            session.add(memory_entry)
-            session.commit()
-            
-            return {
-                "success": True,
-                "message": f"✅ Информация '{key}' успешно сохранена в память",
-                "key": key,
-                "category": category,
-                "session_id": session_id
-            }
+        memory_put(session_id, category, key, value)
+        return {
+            "success": True,
+            "message": f"✅ Информация '{key}' успешно сохранена в память",
+            "key": key,
+            "category": category,
+            "session_id": session_id
+        }
             
     except Exception as e:
         return {
@@ -99,47 +138,26 @@ def get_from_memory(key: str, category: str = "general") -> Dict[str, Any]:
     session_id = get_session_id()
     
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        
-        with Session(engine) as session:
-            # Ищем записи в памяти
-            query_stmt = select(LogDoc).where(
-                LogDoc.kind == "memory",
-                LogDoc.source == f"{session_id}_{category}"
-            ).order_by(LogDoc.id.desc())
-            
-            memory_entries = session.exec(query_stmt).all()
-            
-            # Ищем нужный ключ
-            for entry in memory_entries:
-                try:
-                    data = json.loads(entry.content)
-                    if data.get("key") == key:
-                        return {
-                            "success": True,
-                            "found": True,
-                            "key": key,
-                            "value": data.get("value"),
-                            "category": data.get("category"),
-                            "timestamp": data.get("timestamp"),
-                            "message": f"✅ Найдена информация: {data.get('value')}"
-                        }
-                except json.JSONDecodeError:
-                    continue
-            
+        item = memory_get(session_id, category, key)
+        if item is not None:
+            value, timestamp = item
             return {
                 "success": True,
-                "found": False,
-                "message": f"❌ Информация с ключом '{key}' не найдена в памяти",
+                "found": True,
                 "key": key,
-                "category": category
+                "value": value,
+                "category": category,
+                "timestamp": timestamp,
+                "message": f"✅ Найдена информация: {value}"
             }
+        
+        return {
+            "success": True,
+            "found": False,
+            "message": f"❌ Информация с ключом '{key}' не найдена в памяти",
+            "key": key,
+            "category": category
+        }
             
     except Exception as e:
         return {
@@ -162,43 +180,15 @@ def list_memory_keys(category: str = "general") -> Dict[str, Any]:
     session_id = get_session_id()
     
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        
-        with Session(engine) as session:
-            # Ищем записи в памяти
-            query_stmt = select(LogDoc).where(
-                LogDoc.kind == "memory",
-                LogDoc.source == f"{session_id}_{category}"
-            ).order_by(LogDoc.id.desc())
-            
-            memory_entries = session.exec(query_stmt).all()
-            
-            keys = []
-            for entry in memory_entries:
-                try:
-                    data = json.loads(entry.content)
-                    keys.append({
-                        "key": data.get("key"),
-                        "category": data.get("category"),
-                        "timestamp": data.get("timestamp")
-                    })
-                except json.JSONDecodeError:
-                    continue
-            
-            return {
-                "success": True,
-                "keys": keys,
-                "count": len(keys),
-                "session_id": session_id,
-                "category": category,
-                "message": f"📋 Найдено {len(keys)} ключей в памяти"
-            }
+        keys = memory_keys(session_id, category)
+        return {
+            "success": True,
+            "keys": keys,
+            "count": len(keys),
+            "session_id": session_id,
+            "category": category,
+            "message": f"📋 Найдено {len(keys)} ключей в памяти"
+        }
             
     except Exception as e:
         return {
@@ -221,15 +211,7 @@ def get_conversation_history(limit: int = 10) -> Dict[str, Any]:
     session_id = get_session_id()
     
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        
-        with Session(engine) as session:
+        with Session(get_engine()) as session:
             # Ищем записи чата для данной сессии
             query_stmt = select(LogDoc).where(
                 LogDoc.source == session_id,
@@ -244,7 +226,7 @@ def get_conversation_history(limit: int = 10) -> Dict[str, Any]:
                 history.append({
                     "type": entry.kind,
                     "content": entry.content,
-                    "timestamp": entry.timestamp
+                    "timestamp": entry.timestamp.isoformat() if entry.timestamp else None
                 })
             
             # Сортируем по времени (от старых к новым)
@@ -0,0 +1,200 @@
+"""
+Потоковый парсер текстового формата Prometheus (exposition format 0.0.4).
+
+Строки читаются по одной (подходит requests.iter_lines), семейства метрик
+собираются в dataclass'ы. Метки разбираются регулярным выражением с учётом
+экранирования (\\\\, \\", \\n) и в любом порядке; значения — float, включая
+NaN и ±Inf.
+"""
+
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+_SAMPLE_RE = re.compile(
+    r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?[ \t]+(\S+)(?:[ \t]+(-?\d+))?[ \t]*$"
+)
+_LABEL_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"([^"\\]*(?:\\.[^"\\]*)*)"\s*,?')
+# Весь набор меток целиком — проверка одним fullmatch вместо цикла по меткам
+_LABELS_RE = re.compile(r'(?:\s*[a-zA-Z_][a-zA-Z0-9_]*\s*=\s*"[^"\\]*(?:\\.[^"\\]*)*"\s*,?)*\s*')
+_UNESCAPE_RE = re.compile(r"\\(.)")
+_UNESCAPE = {"n": "\n", "\\": "\\", '"': '"'}
+# Суффиксы сэмплов, относящихся к семейству histogram/summary
+_SUFFIXES = ("_bucket", "_count", "_sum", "_created", "_total")
+
+
+@dataclass
+class Sample:
+    name: str
+    labels: Dict[str, str]
+    value: float
+    timestamp_ms: Optional[int] = None
+
+
+@dataclass
+class MetricFamily:
+    name: str
+    type: str = "untyped"
+    help: str = ""
+    samples: List[Sample] = field(default_factory=list)
+
+
+class ParseError(ValueError):
+    pass
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    return _UNESCAPE_RE.sub(lambda m: _UNESCAPE.get(m.group(1), m.group(0)), value)
+
+
+def _split_labels(text: str) -> Optional[Dict[str, str]]:
+    """
+    Метки без обратных слэшей: кавычек внутри значений быть не может, поэтому
+    split('"') даёт чередование «имя=» / значение. None — формат не тот.
+    """
+    parts = text.split('"')
+    if len(parts) % 2 == 0:
+        return None
+    labels: Dict[str, str] = {}
+    for i in range(1, len(parts), 2):
+        key = parts[i - 1].strip()
+        if i > 1:
+            if key[:1] != ",":
+                return None
+            key = key[1:].lstrip()
+        if key[-1:] != "=":
+            return None
+        key = key[:-1].rstrip()
+        if not key.isidentifier():
+            return None
+        labels[key] = parts[i]
+    if parts[-1].strip() not in ("", ","):
+        return None
+    return labels
+
+
+def parse_labels(text: str) -> Dict[str, str]:
+    if "\\" not in text:
+        labels = _split_labels(text)
+        if labels is None:
+            raise ParseError(f"Некорректные метки: {text!r}")
+        return labels
+    if _LABELS_RE.fullmatch(text) is None:
+        raise ParseError(f"Некорректные метки: {text!r}")
+    return {name: _unescape(value) for name, value in _LABEL_RE.findall(text)}
+
+
+def parse_value(text: str) -> float:
+    lowered = text.lower()
+    if lowered in ("nan",):
+        return math.nan
+    if lowered in ("+inf", "inf"):
+        return math.inf
+    if lowered == "-inf":
+        return -math.inf
+    return float(text)
+
+
+def parse_sample(line: str) -> Sample:
+    match = _SAMPLE_RE.match(line)
+    if match is None:
+        raise ParseError(f"Некорректная строка: {line!r}")
+    name, labels, value, timestamp = match.groups()
+    return Sample(
+        name=name,
+        labels=parse_labels(labels) if labels else {},
+        value=parse_value(value),
+        timestamp_ms=int(timestamp) if timestamp else None,
+    )
+
+
+def _family_name(sample_name: str, known: Dict[str, MetricFamily]) -> str:
+    if sample_name in known:
+        return sample_name
+    for suffix in _SUFFIXES:
+        if sample_name.endswith(suffix) and sample_name[: -len(suffix)] in known:
+            return sample_name[: -len(suffix)]
+    return sample_name
+
+
+def _iter_families(
+    lines: Iterable[str],
+    only: Optional[Set[str]] = None,
+) -> Iterator[MetricFamily]:
+    """
+    Семейства по мере чтения строк (часть семейства отдаётся, когда начинается
+    следующее). only — имена нужных семейств: строки остальных не разбираются.
+
+    Каждый сэмпл отдаётся ровно один раз. Семейство, разорванное другими,
+    приходит несколькими частями — отдельными MetricFamily с тем же именем и
+    только своими сэмплами; склеивает их parse_families.
+    """
+    meta: Dict[str, MetricFamily] = {}
+    current: Optional[MetricFamily] = None
+
+    for raw in lines:
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == "#":
+            parts = line.split(None, 3)
+            if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                name = parts[2]
+                if only is not None and name not in only:
+                    continue
+                info = meta.get(name)
+                if info is None:
+                    info = meta[name] = MetricFamily(name)
+                text = parts[3] if len(parts) > 3 else ""
+                if parts[1] == "TYPE":
+                    info.type = text.strip()
+                else:
+                    info.help = _unescape(text)
+                if current is not None and current.name != name:
+                    if current.samples:
+                        yield current
+                    current = None
+                if current is not None:
+                    current.type, current.help = info.type, info.help
+            continue
+
+        # Быстрый отсев ненужных семейств до разбора меток
+        if only is not None:
+            cut = line.find("{")
+            if cut < 0:
+                cut = line.find(" ")
+            name = line[:cut]
+            if name not in only and _family_name(name, meta) not in only:
+                continue
+        sample = parse_sample(line)
+        name = _family_name(sample.name, meta)
+        if current is None or current.name != name:
+            if current is not None and current.samples:
+                yield current
+            info = meta.get(name)
+            if info is None:
+                info = meta[name] = MetricFamily(name)
+            current = MetricFamily(name, info.type, info.help)
+        current.samples.append(sample)
+
+    if current is not None and current.samples:
+        yield current
+
+
+def parse_families(
+    lines: Iterable[str],
+    only: Optional[Set[str]] = None,
+) -> Dict[str, MetricFamily]:
+    result: Dict[str, MetricFamily] = {}
+    for family in _iter_families(lines, only):
+        # Семейство, разорванное другими, дополняется, а не перезаписывается
+        existing = result.get(family.name)
+        if existing is None:
+            result[family.name] = family
+        else:
+            existing.samples.extend(family.samples)
+    return result
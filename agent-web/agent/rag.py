@@ -1,85 +1,599 @@
 """
 RAG модуль для Homelab Agent
 Интегрирован с базой данных логов для контекстного поиска
+
+Векторное хранилище выбирается через RAG_BACKEND:
+- chroma   — встроенный chromadb.PersistentClient в RAG_DB_DIR (по умолчанию)
+- pgvector — таблица rag_vectors в agent-db (PostgreSQL + vector, индекс HNSW)
+
+Каждый документ пишется в LogDoc; id вектора = log_<LogDoc.id>.
+Для pgvector строка LogDoc и вектор пишутся одной транзакцией (вектор — в savepoint:
+ошибка эмбеддингов или индекса не откатывает LogDoc).
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
 import os
-import chromadb
+import json
+import threading
+import uuid
 from datetime import datetime
-from sqlmodel import create_engine, Session, select
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session, select
+from db import async_session, get_engine, logdoc_partitioned
 from models import LogDoc
+from .embeddings import embed
 
-# Настройки базы данных
-DB_PATH = os.environ.get("AGENT_DB", "sqlite:///./agent.db")
+# Настройки RAG
 RAG_DB_DIR = os.environ.get("RAG_DB_DIR", "./data/index")
+RAG_BACKEND = os.environ.get("RAG_BACKEND", "chroma").strip().lower()
 COLLECTION = "homelab_docs"
+PGVECTOR_TABLE = os.environ.get("PGVECTOR_TABLE", "rag_vectors")
+EMBEDDING_DIM = int(os.environ.get("RAG_EMBEDDING_DIM", "384"))
+PGVECTOR_EF_SEARCH = int(os.environ.get("PGVECTOR_EF_SEARCH", "100"))
+# pgvector >= 0.8: дочитывать HNSW, если фильтр WHERE отсеял кандидатов ("" — выключить)
+PGVECTOR_ITERATIVE_SCAN = os.environ.get("PGVECTOR_ITERATIVE_SCAN", "relaxed_order").strip()
 
-# Инициализация ChromaDB (отложенная)
-client = None
-coll = None
+# Поля метаданных, по которым возможна фильтрация
+FILTER_FIELDS = ("monitor_name", "status", "kind", "source")
 
-def _init_chromadb():
-    """Отложенная инициализация ChromaDB"""
-    global client, coll
-    if client is None:
-        try:
-            client = chromadb.PersistentClient(path=RAG_DB_DIR)
-            if COLLECTION not in [c.name for c in client.list_collections()]:
-                coll = client.create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
-            else:
-                coll = client.get_collection(COLLECTION)
-        except Exception as e:
-            print(f"Ошибка инициализации ChromaDB: {e}")
-            client = None
-            coll = None
 
-def add_docs(docs: List[str], metadatas: List[Dict[str, Any]]):
-    """Добавление документов в RAG индекс"""
-    _init_chromadb()
-    if coll is None:
-        return []
+def parse_ts(value: Any) -> Optional[datetime]:
+    """datetime | ISO-строка | epoch → datetime (None, если не распознано)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
     try:
-        ids = [f"doc_{i}_{abs(hash(d))}" for i, d in enumerate(docs)]
-        coll.add(documents=docs, metadatas=metadatas, ids=ids)
-        return ids
-    except Exception as e:
-        print(f"Ошибка добавления документов в RAG: {e}")
-        return []
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
 
-def query(q: str, k: int = 5):
-    """Поиск в RAG индексе"""
-    try:
-        res = coll.query(query_texts=[q], n_results=k)
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Оставляет только поддерживаемые фильтры: FILTER_FIELDS + since/until."""
+    if not filters:
+        return {}
+    result: Dict[str, Any] = {}
+    for key in FILTER_FIELDS:
+        if filters.get(key):
+            result[key] = str(filters[key])
+    for key in ("since", "until"):
+        ts = parse_ts(filters.get(key))
+        if ts is not None:
+            result[key] = ts
+    return result
+
+
+class VectorStore:
+    """Интерфейс векторного хранилища RAG."""
+
+    name = "base"
+    # True — add() пишет в переданную session, вместе с LogDoc в одной транзакции
+    transactional = False
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[List[List[float]]] = None,
+        session: Optional[Session] = None,
+    ) -> None:
+        raise NotImplementedError
+
+    def query(
+        self,
+        q: str,
+        k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        embedding: Optional[List[float]] = None,
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def size_bytes(self) -> Optional[int]:
+        """Размер индекса на диске (None, если неизвестен)."""
+        return None
+
+    def dead_ratio(self) -> Optional[float]:
+        """Доля мёртвых записей, если хранилище её знает (None — считает вызывающий)."""
+        return None
+
+    def compact(self) -> None:
+        """Освобождает место удалённых векторов (пересборка / VACUUM + REINDEX)."""
+        raise NotImplementedError
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def _chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Chroma принимает только скаляры; ts (epoch) нужен для фильтра по времени."""
+    result = {
+        k: v for k, v in metadata.items()
+        if isinstance(v, (str, int, float, bool))
+    }
+    ts = parse_ts(metadata.get("timestamp"))
+    if ts is not None:
+        result["ts"] = ts.timestamp()
+    return result
+
+
+def _chroma_where(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    clauses: List[Dict[str, Any]] = [
+        {key: filters[key]} for key in FILTER_FIELDS if key in filters
+    ]
+    if "since" in filters:
+        clauses.append({"ts": {"$gte": filters["since"].timestamp()}})
+    if "until" in filters:
+        clauses.append({"ts": {"$lte": filters["until"].timestamp()}})
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class ChromaVectorStore(VectorStore):
+    """Встроенный Chroma (отдельный процессный индекс на диске)."""
+
+    name = "chroma"
+
+    def __init__(self, path: str = RAG_DB_DIR, collection: str = COLLECTION):
+        import chromadb
+
+        self.path = path
+        self.collection_name = collection
+        # add/delete/подмена коллекции в compact() — под одной блокировкой
+        self._lock = threading.Lock()
+        self.client = chromadb.PersistentClient(path=path)
+        self._recover()
+        self.coll = self.client.get_or_create_collection(
+            collection, metadata={"hnsw:space": "cosine"}
+        )
+
+    def add(self, ids, documents, metadatas, embeddings=None, session=None):
+        # Эмбеддинги считаем сами (кэш + локальная модель), встроенная функция Chroma не используется
+        if embeddings is None:
+            embeddings = embed(documents)
+        with self._lock:
+            self.coll.add(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=[_chroma_metadata(m) for m in metadatas],
+            )
+
+    def query(self, q, k=5, filters=None, embedding=None):
+        if embedding is None:
+            embedding = embed([q])[0]
+        kwargs: Dict[str, Any] = {"n_results": k, "query_embeddings": [embedding]}
+        where = _chroma_where(normalize_filters(filters))
+        if where:
+            kwargs["where"] = where
+        res = self.coll.query(**kwargs)
         items = []
         for i in range(len(res["documents"][0])):
             items.append({
                 "document": res["documents"][0][i],
                 "metadata": res["metadatas"][0][i],
-                "id": res["ids"][0][i]
+                "id": res["ids"][0][i],
+                "distance": res["distances"][0][i] if res.get("distances") else None,
             })
         return items
+
+    def delete(self, ids):
+        if ids:
+            with self._lock:
+                self.coll.delete(ids=ids)
+
+    def count(self):
+        return self.coll.count()
+
+    def size_bytes(self):
+        return _dir_size(self.path)
+
+    def compact(self, batch: int = 1000):
+        """
+        HNSW Chroma не отдаёт место удалённых векторов — копируем живые в новую коллекцию.
+
+        Копирование идёт без блокировки — вебхуки пишут как обычно. Под блокировкой
+        (add/delete ждут) новая коллекция догоняет живую: докопируются id,
+        добавленные за время копирования, удаляются удалённые. Затем подмена без
+        окна потери данных: старая коллекция сначала переименовывается в *_old и
+        удаляется только после того, как новая получила рабочее имя. Обрыв
+        посередине чинит _recover() при следующем открытии.
+        """
+        tmp_name = f"{self.collection_name}_rebuild"
+        old_name = f"{self.collection_name}_old"
+        for name in (tmp_name, old_name):
+            try:
+                self.client.delete_collection(name)
+            except Exception:
+                pass
+        fresh = self.client.create_collection(tmp_name, metadata={"hnsw:space": "cosine"})
+        offset = 0
+        while True:
+            page = self.coll.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            fresh.add(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+            )
+            offset += len(page["ids"])
+        with self._lock:
+            live = set(self.coll.get(include=[])["ids"])
+            copied = set(fresh.get(include=[])["ids"])
+            missing = sorted(live - copied)
+            for start in range(0, len(missing), batch):
+                page = self.coll.get(
+                    ids=missing[start:start + batch],
+                    include=["embeddings", "documents", "metadatas"],
+                )
+                fresh.add(
+                    ids=page["ids"],
+                    embeddings=page["embeddings"],
+                    documents=page["documents"],
+                    metadatas=page["metadatas"],
+                )
+            stale = list(copied - live)
+            if stale:
+                fresh.delete(ids=stale)
+            self.coll.modify(name=old_name)
+            try:
+                fresh.modify(name=self.collection_name)
+            except Exception:
+                self.coll.modify(name=self.collection_name)
+                raise
+            self.coll = fresh
+            self.client.delete_collection(old_name)
+
+    def _recover(self) -> None:
+        """Доводит прерванный compact(): рабочей коллекции нет, а отложенная *_old есть."""
+        names = {getattr(c, "name", c) for c in self.client.list_collections()}
+        old_name = f"{self.collection_name}_old"
+        if self.collection_name not in names and old_name in names:
+            self.client.get_collection(old_name).modify(name=self.collection_name)
+            print(f"⚠️ Chroma: восстановлена коллекция {self.collection_name} после прерванного compact")
+
+
+def _vector_literal(embedding: List[float]) -> str:
+    return "[" + ",".join(f"{x:.7g}" for x in embedding) + "]"
+
+
+class PgVectorStore(VectorStore):
+    """Векторы в agent-db: HNSW (cosine) + фильтры метаданных как SQL WHERE."""
+
+    name = "pgvector"
+    transactional = True
+
+    def __init__(self, engine=None, table: str = PGVECTOR_TABLE, dim: int = EMBEDDING_DIM):
+        self.engine = engine or get_engine()
+        self.table = table
+        self.dim = dim
+
+    def ensure_schema(self) -> None:
+        t = self.table
+        SQLModel.metadata.create_all(self.engine, tables=[LogDoc.__table__])
+        with self.engine.begin() as conn:
+            # На партиционированную logdoc внешний ключ по одному id не сослаться
+            log_ref = "" if logdoc_partitioned(conn) else " REFERENCES logdoc(id) ON DELETE CASCADE"
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {t} (
+                    id TEXT PRIMARY KEY,
+                    log_id INTEGER{log_ref},
+                    document TEXT NOT NULL,
+                    embedding vector({self.dim}) NOT NULL,
+                    monitor_name TEXT,
+                    status TEXT,
+                    kind TEXT,
+                    source TEXT,
+                    ts TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    metadata JSONB NOT NULL DEFAULT '{{}}'::jsonb
+                )
+            """))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {t}_embedding_hnsw ON {t} "
+                "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {t}_monitor_ts ON {t} (monitor_name, ts DESC)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {t}_kind_ts ON {t} (kind, ts DESC)"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {t}_log_id ON {t} (log_id)"))
+
+    def add(self, ids, documents, metadatas, embeddings=None, session=None):
+        if embeddings is None:
+            embeddings = embed(documents)
+        rows = []
+        for id_, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            rows.append({
+                "id": id_,
+                "log_id": meta.get("log_id"),
+                "document": doc,
+                "embedding": _vector_literal(emb),
+                "monitor_name": meta.get("monitor_name"),
+                "status": meta.get("status"),
+                "kind": meta.get("kind"),
+                "source": meta.get("source"),
+                "ts": parse_ts(meta.get("timestamp")) or datetime.now(),
+                "metadata": json.dumps(meta, ensure_ascii=False, default=str),
+            })
+        stmt = text(f"""
+            INSERT INTO {self.table}
+                (id, log_id, document, embedding, monitor_name, status, kind, source, ts, metadata)
+            VALUES
+                (:id, :log_id, :document, CAST(:embedding AS vector), :monitor_name,
+                 :status, :kind, :source, :ts, CAST(:metadata AS jsonb))
+            ON CONFLICT (id) DO NOTHING
+        """)
+        if session is not None:
+            session.connection().execute(stmt, rows)
+        else:
+            with self.engine.begin() as conn:
+                conn.execute(stmt, rows)
+
+    def _where(self, filters: Dict[str, Any]):
+        clauses, params = [], {}
+        for key in FILTER_FIELDS:
+            if key in filters:
+                clauses.append(f"{key} = :{key}")
+                params[key] = filters[key]
+        if "since" in filters:
+            clauses.append("ts >= :since")
+            params["since"] = filters["since"]
+        if "until" in filters:
+            clauses.append("ts <= :until")
+            params["until"] = filters["until"]
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    def query(self, q, k=5, filters=None, embedding=None):
+        if embedding is None:
+            embedding = embed([q])[0]
+        where, params = self._where(normalize_filters(filters))
+        params.update({"q": _vector_literal(embedding), "k": k})
+        stmt = text(f"""
+            SELECT id, document, metadata, embedding <=> CAST(:q AS vector) AS distance
+            FROM {self.table}
+            {where}
+            ORDER BY embedding <=> CAST(:q AS vector)
+            LIMIT :k
+        """)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL hnsw.ef_search = {max(PGVECTOR_EF_SEARCH, k)}"))
+            if PGVECTOR_ITERATIVE_SCAN:
+                conn.execute(text(f"SET LOCAL hnsw.iterative_scan = {PGVECTOR_ITERATIVE_SCAN}"))
+            rows = conn.execute(stmt, params).all()
+        return [
+            {
+                "document": row.document,
+                "metadata": row.metadata if isinstance(row.metadata, dict) else json.loads(row.metadata),
+                "id": row.id,
+                "distance": float(row.distance),
+            }
+            for row in rows
+        ]
+
+    def delete(self, ids):
+        if ids:
+            with self.engine.begin() as conn:
+                conn.execute(text(f"DELETE FROM {self.table} WHERE id = ANY(:ids)"), {"ids": list(ids)})
+
+    def count(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text(f"SELECT count(*) FROM {self.table}")).scalar_one()
+
+    def size_bytes(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": self.table}
+            ).scalar_one()
+
+    def dead_ratio(self):
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT n_live_tup, n_dead_tup FROM pg_stat_user_tables WHERE relname = :t"),
+                {"t": self.table},
+            ).first()
+        if not row or not (row.n_live_tup + row.n_dead_tup):
+            return 0.0
+        return row.n_dead_tup / (row.n_live_tup + row.n_dead_tup)
+
+    def compact(self):
+        # VACUUM и REINDEX CONCURRENTLY не работают внутри транзакции
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"VACUUM (ANALYZE) {self.table}"))
+            conn.execute(text(f"REINDEX INDEX CONCURRENTLY {self.table}_embedding_hnsw"))
+
+
+# Инициализация хранилища (отложенная)
+_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> Optional[VectorStore]:
+    """Векторное хранилище по RAG_BACKEND (None, если инициализация не удалась)."""
+    global _store
+    if _store is None:
+        try:
+            if RAG_BACKEND == "pgvector":
+                store = PgVectorStore()
+                store.ensure_schema()
+            else:
+                store = ChromaVectorStore()
+            _store = store
+        except Exception as e:
+            print(f"Ошибка инициализации векторного хранилища ({RAG_BACKEND}): {e}")
+    return _store
+
+
+def _log_rows(docs: List[str], metadatas: List[Dict[str, Any]]) -> List[LogDoc]:
+    rows = []
+    for doc, meta in zip(docs, metadatas):
+        row = LogDoc(
+            kind=meta.get("kind") or "rag",
+            source=meta.get("source") or "rag",
+            content=doc,
+            monitor_name=meta.get("monitor_name") or None,
+            status=meta.get("status") or None,
+        )
+        ts = parse_ts(meta.get("timestamp"))
+        if ts is not None:
+            row.timestamp = ts
+        rows.append(row)
+    return rows
+
+
+def add_docs(docs: List[str], metadatas: List[Dict[str, Any]]):
+    """
+    Добавление документов в LogDoc и RAG индекс.
+
+    LogDoc пишется всегда, даже если модель эмбеддингов или хранилище недоступны:
+    история инцидентов не зависит от индекса. Эмбеддинги считаются до транзакции;
+    вектор pgvector пишется в ней же, но в savepoint — его ошибка не откатывает LogDoc.
+    """
+    store = get_vector_store()
+    metadatas = [dict(m) for m in metadatas]
+    embeddings = _embed_docs(store, docs)
+
+    try:
+        with Session(get_engine()) as session:
+            rows = _log_rows(docs, metadatas)
+            session.add_all(rows)
+            session.flush()
+            ids = _attach_log_ids(rows, metadatas)
+            if store is not None and store.transactional and embeddings is not None:
+                try:
+                    with session.begin_nested():
+                        store.add(ids, docs, metadatas, embeddings=embeddings, session=session)
+                except Exception as e:
+                    print(f"⚠️ Вектор не записан, документ только в LogDoc: {e}")
+            session.commit()
+    except Exception as db_error:
+        ids = _logdoc_failed(store, docs, db_error)
+        if ids is None:
+            return []
+
+    # Chroma вне транзакции БД: индексируем после commit LogDoc
+    if store is not None and not store.transactional and embeddings is not None:
+        try:
+            store.add(ids, docs, metadatas, embeddings=embeddings)
+        except Exception as e:
+            print(f"Ошибка добавления документов в RAG: {e}")
+    return ids
+
+
+async def add_docs_async(docs: List[str], metadatas: List[Dict[str, Any]]):
+    """
+    add_docs для обработчиков запросов: LogDoc пишется через async_session,
+    в потоки уходят только эмбеддинги и запись в Chroma.
+    """
+    store = await asyncio.to_thread(get_vector_store)
+    metadatas = [dict(m) for m in metadatas]
+    embeddings = await asyncio.to_thread(_embed_docs, store, docs)
+
+    try:
+        async with async_session() as session:
+            rows = _log_rows(docs, metadatas)
+            session.add_all(rows)
+            await session.flush()
+            ids = _attach_log_ids(rows, metadatas)
+            if store is not None and store.transactional and embeddings is not None:
+                try:
+                    async with session.begin_nested():
+                        await session.run_sync(
+                            lambda sync_session: store.add(
+                                ids, docs, metadatas, embeddings=embeddings, session=sync_session
+                            )
+                        )
+                except Exception as e:
+                    print(f"⚠️ Вектор не записан, документ только в LogDoc: {e}")
+            await session.commit()
+    except Exception as db_error:
+        ids = _logdoc_failed(store, docs, db_error)
+        if ids is None:
+            return []
+
+    if store is not None and not store.transactional and embeddings is not None:
+        try:
+            await asyncio.to_thread(store.add, ids, docs, metadatas, embeddings=embeddings)
+        except Exception as e:
+            print(f"Ошибка добавления документов в RAG: {e}")
+    return ids
+
+
+def _embed_docs(store: Optional[VectorStore], docs: List[str]):
+    """Эмбеддинги до транзакции LogDoc; None — хранилища нет или модель недоступна."""
+    if store is None:
+        return None
+    try:
+        return embed(docs)
+    except Exception as e:
+        print(f"⚠️ Эмбеддинги недоступны, документ только в LogDoc: {e}")
+        return None
+
+
+def _attach_log_ids(rows: List[LogDoc], metadatas: List[Dict[str, Any]]) -> List[str]:
+    for row, meta in zip(rows, metadatas):
+        meta["log_id"] = row.id
+    return [f"log_{row.id}" for row in rows]
+
+
+def _logdoc_failed(store: Optional[VectorStore], docs: List[str], db_error: Exception) -> Optional[List[str]]:
+    """Ошибка записи LogDoc: id для индекса без LogDoc (только Chroma) или None."""
+    if store is None or store.transactional:
+        print(f"Ошибка добавления документов в LogDoc: {db_error}")
+        return None
+    # Chroma живёт отдельно от БД — документ хотя бы попадёт в индекс
+    print(f"⚠️ LogDoc недоступна, документ только в индексе: {db_error}")
+    return [f"doc_{uuid.uuid4().hex}" for _ in docs]
+
+
+def query(q: str, k: int = 5, filters: Optional[Dict[str, Any]] = None):
+    """Поиск в RAG индексе (filters: monitor_name, status, kind, source, since, until)"""
+    try:
+        store = get_vector_store()
+        if store is None:
+            return [{"error": "Векторное хранилище недоступно"}]
+        return store.query(q, k=k, filters=filters)
     except Exception as e:
         return [{"error": f"Ошибка RAG поиска: {str(e)}"}]
 
+
 def query_logs(q: str, k: int = 5):
     """Поиск в базе данных логов"""
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        with Session(engine) as session:
+        with Session(get_engine()) as session:
             # Простой поиск по содержимому логов
-            query_stmt = select(LogDoc).where(LogDoc.content.contains(q))
+            query_stmt = select(LogDoc).where(LogDoc.content.contains(q)).limit(k)
             logs = session.exec(query_stmt).all()
-            
-            # Ограничиваем количество результатов
-            logs = logs[:k]
-            
+
             items = []
             for log in logs:
                 items.append({
@@ -91,7 +605,7 @@ def query_logs(q: str, k: int = 5):
                     },
                     "id": f"log_{log.id}"
                 })
-            
+
             return items
     except Exception as e:
         return [{"error": f"Ошибка поиска в логах: {str(e)}"}]
@@ -99,8 +613,16 @@ def query_logs(q: str, k: int = 5):
 def add_log_to_rag(log_content: str, log_metadata: Dict[str, Any]):
     """Добавление лога в RAG индекс"""
     try:
-        add_docs([log_content], [log_metadata])
-        return True
+        return bool(add_docs([log_content], [log_metadata]))
+    except Exception as e:
+        print(f"Ошибка добавления лога в RAG: {e}")
+        return False
+
+
+async def add_log_to_rag_async(log_content: str, log_metadata: Dict[str, Any]):
+    """add_log_to_rag для вебхука (см. add_docs_async)"""
+    try:
+        return bool(await add_docs_async([log_content], [log_metadata]))
     except Exception as e:
         print(f"Ошибка добавления лога в RAG: {e}")
         return False
@@ -108,17 +630,10 @@ def add_log_to_rag(log_content: str, log_metadata: Dict[str, Any]):
 def get_recent_context(k: int = 10):
     """Получение недавнего контекста из логов"""
     try:
-        # Определяем параметры подключения в зависимости от типа БД
-        if DB_PATH.startswith('sqlite'):
-            connect_args = {"check_same_thread": False}
-        else:
-            connect_args = {}
-        
-        engine = create_engine(DB_PATH, connect_args=connect_args)
-        with Session(engine) as session:
+        with Session(get_engine()) as session:
             query_stmt = select(LogDoc).order_by(LogDoc.id.desc()).limit(k)
             logs = session.exec(query_stmt).all()
-            
+
             context = []
             for log in logs:
                 context.append({
@@ -126,7 +641,7 @@ def get_recent_context(k: int = 10):
                     "source": log.source,
                     "content": log.content[:500] + "..." if len(log.content) > 500 else log.content
                 })
-            
+
             return context
     except Exception as e:
         return [{"error": f"Ошибка получения контекста: {str(e)}"}]
@@ -0,0 +1,326 @@
+"""
+Хранение истории: политики по kind, свёртка старых инцидентов в дневные сводки
+по монитору, удаление/архивирование LogDoc пачками и компакция векторного индекса.
+
+RETENTION_POLICIES — "kind=дни,..."; 0 — хранить всегда, "*" — остальные kind.
+Каждая пачка (RETENTION_BATCH строк) — отдельная короткая транзакция, между
+пачками пауза, так что вебхуки не ждут длинных блокировок. Работа с БД идёт
+через async_session в цикле событий; в потоки уходят только векторный индекс,
+BM25 и запись архива.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, text
+from sqlmodel import Session, select
+
+from db import async_session, create_logdoc_partitions, get_async_engine
+from models import LogDoc
+from .rag import get_vector_store
+from .retrieval import doc_meta, get_bm25_index
+
+RETENTION_POLICIES = os.environ.get(
+    "RETENTION_POLICIES",
+    "incident_analysis=90,webhook=30,rag=90,memory=0,incident_rollup=0,*=180",
+)
+RETENTION_ROLLUP_KINDS = {
+    k.strip() for k in os.environ.get("RETENTION_ROLLUP_KINDS", "incident_analysis").split(",") if k.strip()
+}
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", "500"))
+RETENTION_BATCH_PAUSE = float(os.environ.get("RETENTION_BATCH_PAUSE", "0.2"))
+# Пустая строка — удалять без архива
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR", "./data/archive")
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "24"))
+# Пересобрать векторный индекс, когда мёртвых записей больше этой доли
+RETENTION_COMPACT_RATIO = float(os.environ.get("RETENTION_COMPACT_RATIO", "0.3"))
+RETENTION_STATE_PATH = os.environ.get("RETENTION_STATE_PATH", "./data/retention_state.json")
+
+ROLLUP_KIND = "incident_rollup"
+_ANALYSIS_RE = re.compile(r"^Анализ \((\w+)\)", re.MULTILINE)
+
+
+def parse_policies(spec: str = RETENTION_POLICIES) -> Dict[str, int]:
+    policies: Dict[str, int] = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        kind, days = part.split("=", 1)
+        try:
+            policies[kind.strip()] = int(days)
+        except ValueError:
+            print(f"⚠️ RETENTION_POLICIES: неверное значение {part!r}")
+    return policies
+
+
+def _load_state() -> Dict[str, Any]:
+    try:
+        with open(RETENTION_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state: Dict[str, Any]) -> None:
+    try:
+        Path(RETENTION_STATE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        with open(RETENTION_STATE_PATH, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, default=str)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить состояние retention: {e}")
+
+
+async def _db_size_bytes(engine) -> Optional[int]:
+    try:
+        async with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                return (await conn.execute(
+                    text("SELECT pg_total_relation_size('logdoc')")
+                )).scalar_one()
+            page_count = (await conn.execute(text("PRAGMA page_count"))).scalar_one()
+            page_size = (await conn.execute(text("PRAGMA page_size"))).scalar_one()
+            return page_count * page_size
+    except Exception:
+        return None
+
+
+def _archive_lines(rows: List[LogDoc]) -> Dict[str, List[str]]:
+    """Строки архива по файлам logdoc_<kind>_<YYYYMM>.ndjson.gz (пусто — архив выключен)."""
+    by_file: Dict[str, List[str]] = {}
+    if not RETENTION_ARCHIVE_DIR:
+        return by_file
+    for row in rows:
+        ts = row.timestamp or datetime.now()
+        name = f"logdoc_{re.sub(r'[^a-zA-Z0-9_-]+', '_', row.kind)}_{ts:%Y%m}.ndjson.gz"
+        by_file.setdefault(name, []).append(json.dumps({
+            "id": row.id,
+            "kind": row.kind,
+            "source": row.source,
+            "content": row.content,
+            "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        }, ensure_ascii=False))
+    return by_file
+
+
+def _archive(by_file: Dict[str, List[str]]) -> None:
+    """Дописывает подготовленные строки в data/archive (после commit удаления)."""
+    if not by_file:
+        return
+    Path(RETENTION_ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    for name, lines in by_file.items():
+        # gzip в режиме "a" дописывает новый member — файл остаётся валидным .gz
+        with gzip.open(os.path.join(RETENTION_ARCHIVE_DIR, name), "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _rollup(session: Session, rows: List[LogDoc]) -> int:
+    """
+    Сворачивает инциденты в сводки по (монитор, день); возвращает число
+    обновлённых сводок. Вызывается через AsyncSession.run_sync.
+    """
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        meta = doc_meta(row)
+        ts = row.timestamp or datetime.now()
+        key = (meta.get("monitor_name") or "unknown", ts.date().isoformat())
+        group = groups.setdefault(key, {
+            "total": 0, "by_status": Counter(), "analysis_types": Counter(),
+            "first": ts, "last": ts,
+        })
+        group["total"] += 1
+        group["by_status"][meta.get("status") or "unknown"] += 1
+        analysis = _ANALYSIS_RE.search(row.content or "")
+        if analysis:
+            group["analysis_types"][analysis.group(1)] += 1
+        group["first"] = min(group["first"], ts)
+        group["last"] = max(group["last"], ts)
+
+    for (monitor, day), group in groups.items():
+        source = f"{monitor}:{day}"
+        existing = session.exec(
+            select(LogDoc).where(LogDoc.kind == ROLLUP_KIND, LogDoc.source == source)
+        ).first()
+        summary = {
+            "monitor_name": monitor,
+            "day": day,
+            "total": 0,
+            "by_status": {},
+            "analysis_types": {},
+            "first": group["first"].isoformat(),
+            "last": group["last"].isoformat(),
+        }
+        if existing:
+            try:
+                summary.update(json.loads(existing.content))
+            except ValueError:
+                pass
+        summary["total"] += group["total"]
+        summary["by_status"] = dict(Counter(summary["by_status"]) + group["by_status"])
+        summary["analysis_types"] = dict(Counter(summary["analysis_types"]) + group["analysis_types"])
+        summary["first"] = min(summary["first"], group["first"].isoformat())
+        summary["last"] = max(summary["last"], group["last"].isoformat())
+        content = json.dumps(summary, ensure_ascii=False)
+        if existing:
+            existing.content = content
+            session.add(existing)
+        else:
+            session.add(LogDoc(
+                kind=ROLLUP_KIND,
+                source=source,
+                content=content,
+                timestamp=datetime.fromisoformat(day).astimezone(),
+            ))
+    return len(groups)
+
+
+async def _expire_kind(
+    kind_clause,
+    cutoff: datetime,
+    rollup: bool,
+    dry_run: bool,
+) -> Dict[str, Any]:
+    stats = {"deleted": 0, "archived": 0, "rollups": 0, "vector_ids": []}
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            rows = (await session.exec(
+                select(LogDoc)
+                .where(kind_clause, LogDoc.timestamp < cutoff, LogDoc.id > last_id)
+                .order_by(LogDoc.id)
+                .limit(RETENTION_BATCH)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            ids = [row.id for row in rows]
+            if dry_run:
+                stats["deleted"] += len(ids)
+                continue
+            if rollup:
+                stats["rollups"] += await session.run_sync(_rollup, rows)
+            # Строки архива готовятся до commit, а пишутся только после: откат
+            # пачки не оставит в архиве дубликатов
+            lines = _archive_lines(rows)
+            await session.exec(delete(LogDoc).where(LogDoc.id.in_(ids)))
+            await session.commit()
+        await asyncio.to_thread(_archive, lines)
+        stats["archived"] += len(ids) if RETENTION_ARCHIVE_DIR else 0
+        stats["deleted"] += len(ids)
+        stats["vector_ids"].extend(f"log_{i}" for i in ids)
+        await asyncio.to_thread(get_bm25_index().remove, ids)
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+    return stats
+
+
+def _compact_vectors(store, vector_ids: List[str], deleted_total: int) -> Dict[str, Any]:
+    """Удаление векторов и компакция индекса — в потоке (CPU и файлы индекса)."""
+    # pgvector без партиций удалит их и каскадом — повторное удаление безвредно
+    for i in range(0, len(vector_ids), RETENTION_BATCH):
+        store.delete(vector_ids[i:i + RETENTION_BATCH])
+    deleted_total += len(vector_ids)
+    ratio = store.dead_ratio()
+    if ratio is None:
+        live = store.count()
+        ratio = deleted_total / (live + deleted_total) if (live + deleted_total) else 0.0
+    report = {"deleted": len(vector_ids), "dead_ratio": round(ratio, 3), "compacted": False}
+    if ratio >= RETENTION_COMPACT_RATIO:
+        store.compact()
+        deleted_total = 0
+        report["compacted"] = True
+    report["deleted_since_compact"] = deleted_total
+    return report
+
+
+async def run_compaction(dry_run: bool = False, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Один проход retention: удаление/свёртка по политикам + компакция векторов."""
+    started = time.perf_counter()
+    now = now or datetime.now().astimezone()
+    engine = get_async_engine()
+    store = get_vector_store()
+    policies = parse_policies()
+    explicit = [k for k in policies if k != "*"]
+
+    db_before = await _db_size_bytes(engine)
+    vec_before = await asyncio.to_thread(store.size_bytes) if store else None
+    report: Dict[str, Any] = {"dry_run": dry_run, "kinds": {}, "started_at": now.isoformat()}
+    vector_ids: List[str] = []
+
+    for kind, days in policies.items():
+        if days <= 0:
+            continue
+        clause = LogDoc.kind.not_in(explicit) if kind == "*" else LogDoc.kind == kind
+        stats = await _expire_kind(
+            clause, now - timedelta(days=days),
+            rollup=kind in RETENTION_ROLLUP_KINDS, dry_run=dry_run,
+        )
+        vector_ids.extend(stats.pop("vector_ids"))
+        report["kinds"][kind] = {"retention_days": days, **stats}
+
+    state = _load_state()
+    vector_report: Dict[str, Any] = {"backend": store.name if store else None}
+    if store and not dry_run:
+        vector_report.update(await asyncio.to_thread(
+            _compact_vectors, store, vector_ids, state.get("vector_deleted_since_compact", 0)
+        ))
+        state["vector_deleted_since_compact"] = vector_report.pop("deleted_since_compact")
+
+    deleted = sum(k["deleted"] for k in report["kinds"].values())
+    if not dry_run:
+        async with engine.begin() as conn:
+            await conn.run_sync(create_logdoc_partitions)
+    if not dry_run and deleted:
+        # Без VACUUM удалённые страницы остаются в файле/таблице
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(
+                "VACUUM (ANALYZE) logdoc" if engine.dialect.name == "postgresql" else "VACUUM"
+            ))
+
+    db_after = await _db_size_bytes(engine)
+    vec_after = await asyncio.to_thread(store.size_bytes) if store else None
+    report["vector"] = vector_report
+    report["bytes"] = {
+        "db_before": db_before,
+        "db_after": db_after,
+        "vector_before": vec_before,
+        "vector_after": vec_after,
+        "reclaimed": sum(
+            (b or 0) - (a or 0) for b, a in ((db_before, db_after), (vec_before, vec_after))
+        ),
+    }
+    report["duration_s"] = round(time.perf_counter() - started, 2)
+
+    if not dry_run:
+        state["last_report"] = report
+        _save_state(state)
+    print(
+        f"🧹 Retention{' (dry-run)' if dry_run else ''}: удалено {deleted}, "
+        f"освобождено {report['bytes']['reclaimed']} байт за {report['duration_s']}s"
+    )
+    return report
+
+
+def last_report() -> Optional[Dict[str, Any]]:
+    return _load_state().get("last_report")
+
+
+async def retention_loop() -> None:
+    """Фоновая задача приложения: проход retention раз в RETENTION_INTERVAL_HOURS."""
+    if RETENTION_INTERVAL_HOURS <= 0:
+        return
+    # Первый проход не сразу после старта — сначала обслуживаем алерты
+    await asyncio.sleep(600)
+    while True:
+        try:
+            await run_compaction()
+        except Exception as e:
+            print(f"⚠️ Retention: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
@@ -0,0 +1,424 @@
+"""
+Гибридный поиск по истории инцидентов: BM25 по LogDoc + векторный индекс RAG,
+объединение через reciprocal-rank fusion (RRF).
+
+Фильтры (monitor_name, status, kind, source, since, until) применяются внутри
+каждого индекса до ранжирования: в BM25 — через инвертированные индексы
+метаданных, в векторном хранилище — через where Chroma / SQL WHERE pgvector.
+Стадии выполняются параллельно в пределах бюджета задержки; всё, что не
+успело, отбрасывается и попадает в timed_out.
+
+BM25 индекс строится целиком из LogDoc в фоне при старте (build_bm25_index из
+lifespan app); запрос только догружает новые строки. Пока индекс не построен,
+лексическая стадия попадает в errors, а не съедает бюджет полным сканом.
+
+hybrid_search_async — для обработчиков запросов: LogDoc читается через
+async_session, в потоки уходят только BM25 и векторный поиск. hybrid_search —
+синхронный вариант для инструментов агента и бенчмарков.
+"""
+
+import asyncio
+
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlmodel import Session, select
+
+from db import async_session, get_engine
+from models import LogDoc
+from .rag import normalize_filters, parse_ts, get_vector_store
+
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "5"))
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "50"))
+RETRIEVAL_BUDGET_MS = float(os.environ.get("RETRIEVAL_BUDGET_MS", "1500"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+def doc_meta(log: LogDoc) -> Dict[str, Any]:
+    """Метаданные для фильтров — из колонок LogDoc (их пишет add_docs), не из текста."""
+    ts = parse_ts(log.timestamp)
+    return {
+        "kind": log.kind,
+        "source": log.source,
+        "monitor_name": log.monitor_name,
+        "status": log.status.lower() if log.status else None,
+        "ts": ts.timestamp() if ts else None,
+    }
+
+
+class BM25Index:
+    """Инвертированный индекс BM25 по LogDoc с индексами метаданных для фильтров."""
+
+    FIELDS = ("monitor_name", "status", "kind", "source")
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_len: Dict[int, int] = {}
+        self.doc_ts: Dict[int, Optional[float]] = {}
+        self.fields: Dict[str, Dict[str, Set[int]]] = {f: {} for f in self.FIELDS}
+        self.total_len = 0
+        self.last_id = 0
+        self.built = False
+        self._lock = threading.RLock()
+        # Один refresh за раз: параллельные вызовы не повторяют один и тот же скан
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, doc_id: int, content: str, meta: Dict[str, Any]) -> None:
+        tokens = tokenize(content)
+        with self._lock:
+            if doc_id in self.doc_len:
+                return
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            self.doc_len[doc_id] = len(tokens)
+            self.doc_ts[doc_id] = meta.get("ts")
+            self.total_len += len(tokens)
+            for field in self.FIELDS:
+                value = meta.get(field)
+                if value:
+                    self.fields[field].setdefault(str(value), set()).add(doc_id)
+            self.last_id = max(self.last_id, doc_id)
+
+    def remove(self, doc_ids: List[int]) -> None:
+        with self._lock:
+            removed = {d for d in doc_ids if d in self.doc_len}
+            if not removed:
+                return
+            for term in list(self.postings):
+                plist = self.postings[term]
+                for d in removed.intersection(plist):
+                    del plist[d]
+                if not plist:
+                    del self.postings[term]
+            for values in self.fields.values():
+                for value in list(values):
+                    values[value] -= removed
+                    if not values[value]:
+                        del values[value]
+            for d in removed:
+                self.total_len -= self.doc_len.pop(d)
+                self.doc_ts.pop(d, None)
+
+    def refresh(self, batch: int = 5000, wait: bool = True) -> int:
+        """
+        Догружает новые строки LogDoc (id > last_id); возвращает их число.
+        wait=False — если refresh уже идёт в другом потоке, сразу 0.
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return 0
+        try:
+            added = 0
+            with Session(get_engine()) as session:
+                while True:
+                    rows = session.exec(self._new_rows(batch)).all()
+                    if not rows:
+                        break
+                    self._add_rows(rows)
+                    added += len(rows)
+                    if len(rows) < batch:
+                        break
+            self.built = True
+            return added
+        finally:
+            self._refresh_lock.release()
+
+    async def refresh_async(self, batch: int = 5000, wait: bool = True) -> int:
+        """refresh через async_session; токенизация пачки — в потоке."""
+        if wait:
+            acquired = await asyncio.to_thread(self._refresh_lock.acquire)
+        else:
+            acquired = self._refresh_lock.acquire(blocking=False)
+        if not acquired:
+            return 0
+        try:
+            added = 0
+            async with async_session() as session:
+                while True:
+                    rows = (await session.exec(self._new_rows(batch))).all()
+                    if not rows:
+                        break
+                    await asyncio.to_thread(self._add_rows, rows)
+                    added += len(rows)
+                    if len(rows) < batch:
+                        break
+            self.built = True
+            return added
+        finally:
+            self._refresh_lock.release()
+
+    def _new_rows(self, batch: int):
+        return select(LogDoc).where(LogDoc.id > self.last_id).order_by(LogDoc.id).limit(batch)
+
+    def _add_rows(self, rows: List[LogDoc]) -> None:
+        for log in rows:
+            self.add(log.id, log.content or "", doc_meta(log))
+
+    def _allowed(self, filters: Dict[str, Any]) -> Optional[Set[int]]:
+        """Множество документов, прошедших фильтр метаданных (None — без ограничений)."""
+        sets = []
+        for field in self.FIELDS:
+            if field in filters:
+                sets.append(self.fields[field].get(filters[field], set()))
+        allowed: Optional[Set[int]] = None
+        if sets:
+            sets.sort(key=len)
+            allowed = set(sets[0])
+            for s in sets[1:]:
+                allowed &= s
+        since = filters.get("since")
+        until = filters.get("until")
+        if since or until:
+            lo = since.timestamp() if since else -math.inf
+            hi = until.timestamp() if until else math.inf
+            pool = allowed if allowed is not None else self.doc_ts.keys()
+            allowed = {
+                d for d in pool
+                if self.doc_ts.get(d) is not None and lo <= self.doc_ts[d] <= hi
+            }
+        return allowed
+
+    def search(self, q: str, k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        terms = set(tokenize(q))
+        with self._lock:
+            n = len(self.doc_len)
+            if not n or not terms:
+                return []
+            allowed = self._allowed(normalize_filters(filters))
+            if allowed is not None and not allowed:
+                return []
+            avg_len = self.total_len / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                if allowed is not None and len(allowed) < len(plist):
+                    pairs = ((d, plist[d]) for d in allowed if d in plist)
+                else:
+                    pairs = (
+                        (d, tf) for d, tf in plist.items()
+                        if allowed is None or d in allowed
+                    )
+                for d, tf in pairs:
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_len[d] / avg_len)
+                    scores[d] = scores.get(d, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+_bm25: Optional[BM25Index] = None
+_bm25_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+def get_bm25_index() -> BM25Index:
+    """Общий BM25 индекс (пустой, пока его не построит build_bm25_index)."""
+    global _bm25
+    with _bm25_lock:
+        if _bm25 is None:
+            _bm25 = BM25Index()
+    return _bm25
+
+
+async def build_bm25_index() -> int:
+    """Полная загрузка LogDoc в BM25 — фоновая задача lifespan app; возвращает число строк."""
+    started = time.perf_counter()
+    index = get_bm25_index()
+    added = await index.refresh_async()
+    print(f"🔎 BM25: {len(index)} документов за {time.perf_counter() - started:.1f} с", flush=True)
+    return added
+
+
+def _lexical_hits(q: str, n: int, filters: Dict[str, Any]) -> List[Tuple[int, float]]:
+    index = get_bm25_index()
+    if not index.built:
+        raise RuntimeError("BM25 индекс ещё строится")
+    return index.search(q, k=n, filters=filters)
+
+
+def _hits_select(hits: List[Tuple[int, float]]):
+    return select(LogDoc).where(LogDoc.id.in_([d for d, _ in hits]))
+
+
+def _lexical_stage(q: str, n: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    index = get_bm25_index()
+    # Только догрузка новых строк; если её уже делает другой запрос — ищем по текущему
+    if index.built:
+        index.refresh(wait=False)
+    hits = _lexical_hits(q, n, filters)
+    if not hits:
+        return []
+    with Session(get_engine()) as session:
+        rows = session.exec(_hits_select(hits)).all()
+    return _lexical_items(hits, rows)
+
+
+async def _lexical_stage_async(q: str, n: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    index = get_bm25_index()
+    if index.built:
+        await index.refresh_async(wait=False)
+    hits = await asyncio.to_thread(_lexical_hits, q, n, filters)
+    if not hits:
+        return []
+    async with async_session() as session:
+        rows = (await session.exec(_hits_select(hits))).all()
+    return _lexical_items(hits, rows)
+
+
+def _lexical_items(hits: List[Tuple[int, float]], rows: List[LogDoc]) -> List[Dict[str, Any]]:
+    by_id = {row.id: row for row in rows}
+    items = []
+    for doc_id, score in hits:
+        row = by_id.get(doc_id)
+        if row is None:
+            continue
+        meta = doc_meta(row)
+        meta.update(id=row.id, timestamp=row.timestamp.isoformat() if row.timestamp else None)
+        items.append({
+            "id": f"log_{doc_id}",
+            "document": row.content,
+            "metadata": {k: v for k, v in meta.items() if v is not None and k != "ts"},
+            "bm25": round(score, 4),
+        })
+    return items
+
+
+def _vector_stage(q: str, n: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    store = get_vector_store()
+    if store is None:
+        raise RuntimeError("Векторное хранилище недоступно")
+    return store.query(q, k=n, filters=filters)
+
+
+def _timed(fn, *args) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def _timed_async(fn, *args) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = await fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def rrf_fuse(ranked_lists: Dict[str, List[Dict[str, Any]]], k: int, rrf_k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Reciprocal-rank fusion: score(d) = Σ 1 / (rrf_k + rank)."""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for stage, items in ranked_lists.items():
+        for rank, item in enumerate(items, start=1):
+            entry = fused.setdefault(item["id"], {
+                "id": item["id"],
+                "document": item.get("document"),
+                "metadata": item.get("metadata") or {},
+                "score": 0.0,
+                "ranks": {},
+            })
+            entry["score"] += 1.0 / (rrf_k + rank)
+            entry["ranks"][stage] = rank
+    top = heapq.nlargest(k, fused.values(), key=lambda e: e["score"])
+    for entry in top:
+        entry["score"] = round(entry["score"], 6)
+    return top
+
+
+def hybrid_search(
+    q: str,
+    k: int = RETRIEVAL_K,
+    filters: Optional[Dict[str, Any]] = None,
+    budget_ms: float = RETRIEVAL_BUDGET_MS,
+    candidates: int = RETRIEVAL_CANDIDATES,
+) -> Dict[str, Any]:
+    """
+    Гибридный поиск. Возвращает items (top-k после RRF), timings_ms по стадиям,
+    timed_out / errors для стадий, не уложившихся в бюджет или упавших.
+    """
+    started = time.perf_counter()
+    norm = normalize_filters(filters)
+    n = max(k, candidates)
+    futures = {
+        "lexical": _executor.submit(_timed, _lexical_stage, q, n, norm),
+        "vector": _executor.submit(_timed, _vector_stage, q, n, norm),
+    }
+    done, _ = wait(futures.values(), timeout=budget_ms / 1000)
+    return _fuse_stages(futures, done, k, norm, budget_ms, started)
+
+
+async def hybrid_search_async(
+    q: str,
+    k: int = RETRIEVAL_K,
+    filters: Optional[Dict[str, Any]] = None,
+    budget_ms: float = RETRIEVAL_BUDGET_MS,
+    candidates: int = RETRIEVAL_CANDIDATES,
+) -> Dict[str, Any]:
+    """hybrid_search для обработчиков запросов: не занимает поток на ожидание стадий и БД."""
+    started = time.perf_counter()
+    norm = normalize_filters(filters)
+    n = max(k, candidates)
+    tasks = {
+        "lexical": asyncio.ensure_future(_timed_async(_lexical_stage_async, q, n, norm)),
+        "vector": asyncio.ensure_future(asyncio.to_thread(_timed, _vector_stage, q, n, norm)),
+    }
+    done, pending = await asyncio.wait(tasks.values(), timeout=budget_ms / 1000)
+    # Не успевшая стадия отменяется и освобождает соединение с БД (поток
+    # векторного поиска доработает сам, результат отбросится)
+    for task in pending:
+        task.cancel()
+    return _fuse_stages(tasks, done, k, norm, budget_ms, started)
+
+
+def _fuse_stages(
+    futures: Dict[str, Any],
+    done: Set[Any],
+    k: int,
+    norm: Dict[str, Any],
+    budget_ms: float,
+    started: float,
+) -> Dict[str, Any]:
+    """Результаты стадий (concurrent.futures или asyncio) → ответ гибридного поиска."""
+    ranked: Dict[str, List[Dict[str, Any]]] = {}
+    timings: Dict[str, float] = {}
+    timed_out: List[str] = []
+    errors: Dict[str, str] = {}
+    for stage, future in futures.items():
+        if future not in done:
+            timed_out.append(stage)
+            continue
+        try:
+            items, elapsed = future.result()
+            ranked[stage] = items
+            timings[stage] = round(elapsed, 2)
+        except Exception as e:
+            errors[stage] = str(e)
+
+    fusion_started = time.perf_counter()
+    items = rrf_fuse(ranked, k)
+    timings["fusion"] = round((time.perf_counter() - fusion_started) * 1000, 2)
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    return {
+        "items": items,
+        "k": k,
+        "filters": {key: str(value) for key, value in norm.items()},
+        "timings_ms": timings,
+        "budget_ms": budget_ms,
+        "timed_out": timed_out,
+        "errors": errors,
+    }
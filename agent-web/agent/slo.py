@@ -0,0 +1,363 @@
+"""
+SLO и error budget по истории heartbeat'ов Uptime Kuma.
+
+HeartbeatHistory хранит heartbeat'ы всех мониторов столбцами numpy (время,
+id монитора, статус, ping) за SLO_RETENTION_DAYS; пополняется push-событиями
+постоянного подключения (uptime_kuma_live) и сохраняется в SLO_HISTORY_PATH.
+
+compute_slo() считает за один проход по всем мониторам сразу:
+- доступность за 1h/24h/7d/30d (MAINTENANCE не учитывается, PENDING — не отказ);
+- перцентили ping UP-heartbeat'ов по тем же окнам — по гистограмме с
+  логарифмическими корзинами (как DDSketch: ширина корзины ≤ 1% значения), без сортировки;
+- остаток error budget за 30d и burn rate по окнам 5m…3d с алертами
+  multi-window multi-burn-rate (пары окон и пороги — SRE Workbook, гл. 5).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+SLO_TARGET = float(os.environ.get("SLO_TARGET", "0.999"))
+# Переопределения по монитору: "имя=0.99,имя2=0.995"
+SLO_TARGETS = os.environ.get("SLO_TARGETS", "")
+SLO_RETENTION_DAYS = float(os.environ.get("SLO_RETENTION_DAYS", "31"))
+SLO_HISTORY_PATH = os.environ.get("SLO_HISTORY_PATH", "./data/slo_heartbeats.npz")
+SLO_SAVE_INTERVAL = float(os.environ.get("SLO_SAVE_INTERVAL", "300"))
+
+DOWN, UP, PENDING, MAINTENANCE = 0, 1, 2, 3
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+BUDGET_WINDOW = "30d"
+BURN_WINDOWS = {"5m": 300, "30m": 1800, "1h": 3600, "2h": 7200, "6h": 21600, "24h": 86400, "3d": 259200}
+# (длинное окно, короткое окно, порог burn rate, важность)
+BURN_ALERTS = (
+    ("1h", "5m", 14.4, "page"),
+    ("6h", "30m", 6.0, "page"),
+    ("24h", "2h", 3.0, "ticket"),
+    ("3d", "6h", 1.0, "ticket"),
+)
+PERCENTILES = (50, 95, 99)
+# Корзины ping: i = ceil(log_γ(ping)), оценка 2γ^i/(γ+1) — ошибка ≤ (γ-1)/(γ+1) ≈ 1%
+_GAMMA = 1.02
+_LOG_GAMMA = np.log(_GAMMA)
+_PING_BINS = int(np.ceil(np.log(600_000) / _LOG_GAMMA)) + 2  # до 10 минут; 0 — ping ≤ 1 мс
+
+
+def parse_targets(spec: str = SLO_TARGETS) -> Dict[str, float]:
+    targets: Dict[str, float] = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        name, value = part.rsplit("=", 1)
+        try:
+            targets[name.strip()] = float(value)
+        except ValueError:
+            print(f"⚠️ SLO_TARGETS: неверное значение {part!r}")
+    return targets
+
+
+def beat_time(value: Any) -> Optional[float]:
+    """Время heartbeat'а Kuma ("2024-05-01 12:00:00.123", UTC) → unix, с."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class HeartbeatHistory:
+    """
+    Столбцы heartbeat'ов всех мониторов. Запись — под блокировкой; снимок для
+    чтения — срезы [:n] без копирования: запись идёт только за n, а рост и
+    очистка старых строк создают новые массивы.
+    """
+
+    def __init__(self, retention_days: float = SLO_RETENTION_DAYS, capacity: int = 4096):
+        self.retention_s = retention_days * 86400
+        self._lock = threading.Lock()
+        self._n = 0
+        self._alloc(capacity)
+        self._last: Dict[int, float] = {}
+
+    def _alloc(self, capacity: int) -> None:
+        self._ts = np.empty(capacity, dtype=np.float64)
+        self._monitor = np.empty(capacity, dtype=np.int32)
+        self._status = np.empty(capacity, dtype=np.int8)
+        self._ping = np.empty(capacity, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _compact(self, keep: np.ndarray, capacity: int) -> None:
+        n = self._n
+        columns = [col[:n][keep] for col in (self._ts, self._monitor, self._status, self._ping)]
+        self._alloc(capacity)
+        kept = len(columns[0])
+        for target, source in zip((self._ts, self._monitor, self._status, self._ping), columns):
+            target[:kept] = source
+        self._n = kept
+
+    def _reserve(self, extra: int) -> None:
+        if self._n + extra <= len(self._ts):
+            return
+        # Место кончилось — сначала выбросить строки старше retention, потом расти
+        keep = self._ts[:self._n] >= time.time() - self.retention_s
+        self._compact(keep, max(len(self._ts), 2 * (int(keep.sum()) + extra)))
+
+    def extend(self, monitor_id: int, beats: Iterable[Dict[str, Any]]) -> int:
+        """Добавляет heartbeat'ы монитора новее уже записанных; возвращает число добавленных."""
+        last = self._last.get(monitor_id, float("-inf"))
+        rows: List[Tuple[float, int, float]] = []
+        for beat in beats:
+            ts = beat_time(beat.get("time"))
+            status = beat.get("status")
+            if ts is None or ts <= last or not isinstance(status, int):
+                continue
+            ping = beat.get("ping")
+            rows.append((ts, status, float(ping) if isinstance(ping, (int, float)) else np.nan))
+            last = ts
+        if not rows:
+            return 0
+        with self._lock:
+            self._reserve(len(rows))
+            n, k = self._n, len(rows)
+            ts, status, ping = zip(*rows)
+            self._ts[n:n + k] = ts
+            self._monitor[n:n + k] = monitor_id
+            self._status[n:n + k] = status
+            self._ping[n:n + k] = ping
+            self._n = n + k
+            self._last[monitor_id] = last
+        return k
+
+    def add(self, monitor_id: int, beat: Dict[str, Any]) -> int:
+        return self.extend(monitor_id, (beat,))
+
+    def drop_monitor(self, monitor_id: int) -> None:
+        with self._lock:
+            self._compact(self._monitor[:self._n] != monitor_id, len(self._ts))
+            self._last.pop(monitor_id, None)
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            n = self._n
+            return self._ts[:n], self._monitor[:n], self._status[:n], self._ping[:n]
+
+    def save(self, path: str = SLO_HISTORY_PATH) -> None:
+        ts, monitor, status, ping = self.snapshot()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, ts=ts, monitor=monitor, status=status, ping=ping)
+        os.replace(tmp, path)
+
+    def load(self, path: str = SLO_HISTORY_PATH) -> int:
+        try:
+            with np.load(path) as data:
+                ts, monitor = data["ts"], data["monitor"]
+                status, ping = data["status"], data["ping"]
+        except (OSError, KeyError, ValueError):
+            return 0
+        keep = ts >= time.time() - self.retention_s
+        with self._lock:
+            self._alloc(max(4096, 2 * int(keep.sum())))
+            self._n = 0
+            kept = int(keep.sum())
+            self._ts[:kept] = ts[keep]
+            self._monitor[:kept] = monitor[keep]
+            self._status[:kept] = status[keep]
+            self._ping[:kept] = ping[keep]
+            self._n = kept
+            self._last = {}
+            if kept:
+                order = np.lexsort((self._ts[:kept], self._monitor[:kept]))
+                ends = np.r_[np.flatnonzero(np.diff(self._monitor[:kept][order])), kept - 1]
+                for pos in order[ends]:
+                    self._last[int(self._monitor[pos])] = float(self._ts[pos])
+        return kept
+
+
+def _histogram_percentiles(hist: np.ndarray, q: Iterable[float]) -> np.ndarray:
+    """hist [..., корзины] → перцентили [..., len(q)]; NaN, где пусто."""
+    cum = np.cumsum(hist, axis=-1)
+    count = cum[..., -1:]
+    q = np.asarray(list(q), dtype=np.float64) / 100
+    # Ранг как у np.percentile (nearest-rank на q·(n-1)), ищется по накопленной сумме
+    rank = np.floor(q * np.maximum(count - 1, 0)) + 1
+    index = (cum[..., None, :] < rank[..., :, None]).sum(axis=-1)
+    values = np.where(index == 0, 1.0, 2 * _GAMMA ** index / (_GAMMA + 1))
+    return np.where(count > 0, values, np.nan)
+
+
+def compute_slo(
+    history: HeartbeatHistory,
+    names: Optional[Dict[int, str]] = None,
+    now: Optional[float] = None,
+    target: float = SLO_TARGET,
+    targets: Optional[Dict[str, float]] = None,
+    monitor_ids: Optional[Iterable[int]] = None,
+) -> Dict[str, Any]:
+    """SLO всех мониторов (или monitor_ids) за один проход по столбцам истории."""
+    started = time.perf_counter()
+    now = time.time() if now is None else now
+    names = names or {}
+    targets = parse_targets() if targets is None else targets
+    ts, monitor, status, ping = history.snapshot()
+    if monitor_ids is not None:
+        wanted = np.isin(monitor, np.fromiter(monitor_ids, dtype=np.int32))
+        ts, monitor, status, ping = ts[wanted], monitor[wanted], status[wanted], ping[wanted]
+
+    # id мониторов Kuma — небольшие целые: индекс через таблицу вместо np.unique
+    seen = np.bincount(monitor) if len(monitor) else np.zeros(0, dtype=np.int64)
+    ids = np.flatnonzero(seen)
+    lookup = np.zeros(len(seen), dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    owner = lookup[monitor]
+    n = len(ids)
+    spans_by_label = {**WINDOWS, **BURN_WINDOWS}
+    labels = sorted(spans_by_label, key=spans_by_label.get)
+    spans = np.array([spans_by_label[label] for label in labels], dtype=np.float64)
+    w = len(spans)
+
+    # Строка попадает в наименьшее окно, которое её содержит; накопленная сумма
+    # по оси окон даёт счётчики для всех вложенных окон сразу
+    # Часы Kuma могут спешить на секунды — такие heartbeat'ы считаются «сейчас»
+    age = np.maximum(now - ts, 0)
+    bucket = np.searchsorted(spans, age, side="left")
+    use = (bucket < w) & (status != MAINTENANCE)
+    key = owner[use] * w + bucket[use]
+    total = np.bincount(key, minlength=n * w).reshape(n, w).cumsum(axis=1)
+    bad = np.bincount(key, weights=status[use] == DOWN, minlength=n * w).reshape(n, w).cumsum(axis=1)
+    col = {label: i for i, label in enumerate(labels)}
+
+    # Перцентили ping: гистограмма (монитор × наименьшее окно × корзина) одним
+    # bincount, вложенные окна — накопленной суммой по оси окон
+    lat_labels = list(WINDOWS)
+    lat_spans = np.array([WINDOWS[label] for label in lat_labels], dtype=np.float64)
+    lw = len(lat_spans)
+    lat_bucket = np.searchsorted(lat_spans, age, side="left")
+    has_ping = (status == UP) & ~np.isnan(ping) & (lat_bucket < lw)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bins = np.ceil(np.log(ping[has_ping].astype(np.float64)) / _LOG_GAMMA)
+    bins = np.clip(np.nan_to_num(bins, neginf=0), 0, _PING_BINS - 1).astype(np.int64)
+    lat_key = (owner[has_ping] * lw + lat_bucket[has_ping]) * _PING_BINS + bins
+    hist = np.bincount(lat_key, minlength=n * lw * _PING_BINS).reshape(n, lw, _PING_BINS).cumsum(axis=1)
+    lat_values = _histogram_percentiles(hist, PERCENTILES)
+    latency = {label: lat_values[:, j, :] for j, label in enumerate(lat_labels)}
+
+    target_of = np.array([targets.get(names.get(int(mid), ""), target) for mid in ids], dtype=np.float64)
+    allowed = np.maximum(1 - target_of, 1e-9)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        error_rate = np.where(total > 0, bad / np.maximum(total, 1), np.nan)
+    burn = error_rate / allowed[:, None]
+
+    monitors = []
+    for i, mid in enumerate(ids):
+        availability = {
+            label: (round(float(100 * (1 - error_rate[i, col[label]])), 4) if total[i, col[label]] else None)
+            for label in WINDOWS
+        }
+        budget_total = total[i, col[BUDGET_WINDOW]]
+        budget_allowed = allowed[i] * budget_total
+        burn_rate = {
+            label: (round(float(burn[i, col[label]]), 2) if total[i, col[label]] else None)
+            for label in BURN_WINDOWS
+        }
+        alerts = [
+            {"severity": severity, "long": long_w, "short": short_w, "threshold": threshold}
+            for long_w, short_w, threshold, severity in BURN_ALERTS
+            if total[i, col[long_w]] and total[i, col[short_w]]
+            and burn[i, col[long_w]] >= threshold and burn[i, col[short_w]] >= threshold
+        ]
+        monitors.append({
+            "monitor_id": int(mid),
+            "name": names.get(int(mid)),
+            "target": float(target_of[i]),
+            "availability": availability,
+            "beats": {label: int(total[i, col[label]]) for label in WINDOWS},
+            "latency_ms": {
+                label: {
+                    f"p{p}": (round(float(v), 1) if not np.isnan(v) else None)
+                    for p, v in zip(PERCENTILES, latency[label][i])
+                }
+                for label in WINDOWS
+            },
+            "error_budget": {
+                "window": BUDGET_WINDOW,
+                "bad": int(bad[i, col[BUDGET_WINDOW]]),
+                "allowed": round(float(budget_allowed), 2),
+                "remaining_pct": (
+                    round(float(100 * (1 - bad[i, col[BUDGET_WINDOW]] / budget_allowed)), 2)
+                    if budget_total else None
+                ),
+            },
+            "burn_rate": burn_rate,
+            "alerts": alerts,
+        })
+
+    return {
+        "now": now,
+        "target": target,
+        "history_from": float(ts.min()) if len(ts) else None,
+        "heartbeats": int(len(ts)),
+        "monitors": monitors,
+        "alerting": [m["name"] or m["monitor_id"] for m in monitors if m["alerts"]],
+        "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+_history: Optional[HeartbeatHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> HeartbeatHistory:
+    """Общая история процесса; при первом обращении читается из SLO_HISTORY_PATH."""
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                history = HeartbeatHistory()
+                if SLO_HISTORY_PATH:
+                    history.load(SLO_HISTORY_PATH)
+                _history = history
+    return _history
+
+
+def save_history() -> None:
+    if _history is not None and SLO_HISTORY_PATH:
+        try:
+            _history.save(SLO_HISTORY_PATH)
+        except OSError as e:
+            print(f"⚠️ SLO: не удалось сохранить историю: {e}", flush=True)
+
+
+def slo_report(monitor_name: Optional[str] = None, now: Optional[float] = None) -> Dict[str, Any]:
+    """SLO по истории общего подключения к Kuma; имена мониторов — из live view."""
+    from .uptime_kuma_live import live_view
+
+    view = live_view()
+    names = {mid: m.get("name") for mid, m in view.monitors.items()} if view is not None else {}
+    monitor_ids = None
+    if monitor_name:
+        mid = view.by_name.get(monitor_name) if view is not None else None
+        monitor_ids = [mid] if mid is not None else []
+    return compute_slo(get_history(), names=names, now=now, monitor_ids=monitor_ids)
+
+
+async def save_loop() -> None:
+    """Фоновая задача приложения: история heartbeat'ов на диск раз в SLO_SAVE_INTERVAL."""
+    if SLO_SAVE_INTERVAL <= 0 or not SLO_HISTORY_PATH:
+        return
+    while True:
+        await asyncio.sleep(SLO_SAVE_INTERVAL)
+        await asyncio.to_thread(save_history)
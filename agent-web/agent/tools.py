@@ -741,22 +741,30 @@ URL: {monitor_url}
         return f"❌ Ошибка анализа инцидента: {str(e)}"
 
 @tool
-def search_incident_history(query: str) -> str:
-    """Поиск по истории инцидентов в базе данных.
+def search_incident_history(query: str, monitor_name: str = "", status: str = "", days: int = 0) -> str:
+    """Поиск по истории инцидентов в базе данных (BM25 + векторный поиск).
     
     Args:
-        query: Поисковый запрос
+        query: Поисковый запрос (например, текст лога)
+        monitor_name: Только инциденты этого монитора (опционально)
+        status: Только инциденты с этим статусом: down, up (опционально)
+        days: Только за последние N дней (0 — за всё время)
     
     Returns:
         Результаты поиска по истории инцидентов
     """
     try:
-        from .rag import query_logs
+        from datetime import timedelta
+        from .retrieval import hybrid_search
+        
+        filters = {"monitor_name": monitor_name, "status": status}
+        if days:
+            filters["since"] = datetime.now() - timedelta(days=days)
         
-        # Поиск в логах
-        results = query_logs(query, k=5)
+        # Гибридный поиск с фильтрами внутри индексов
+        results = hybrid_search(query, k=5, filters=filters)["items"]
         
-        if not results or results[0].get('error'):
+        if not results:
             return f"🔍 По запросу '{query}' ничего не найдено."
         
         # Формируем результат
@@ -764,7 +772,7 @@ def search_incident_history(query: str) -> str:
         
         for i, result in enumerate(results, 1):
             metadata = result.get('metadata', {})
-            content = result.get('document', '')
+            content = result.get('document') or ''
             
             response += f"**{i}. {metadata.get('source', 'Unknown')}**\n"
             response += f"Тип: {metadata.get('kind', 'Unknown')}\n"
@@ -780,76 +788,50 @@ def search_incident_history(query: str) -> str:
         return f"❌ Ошибка поиска по истории: {str(e)}"
 
 @tool
-def get_incident_statistics() -> str:
+def get_incident_statistics(days: int = 7, monitor_name: str = "") -> str:
     """Получение статистики по инцидентам.
-    
+
+    Args:
+        days: За сколько последних дней считать
+        monitor_name: Только этот монитор (пусто — все)
+
     Returns:
         Статистика по инцидентам из базы данных
     """
     try:
-        from .rag import get_recent_context
-        
-        # Получаем недавний контекст
-        recent_context = get_recent_context(k=20)
-        
-        if not recent_context or recent_context[0].get('error'):
-            return "📊 Статистика недоступна."
-        
-        # Анализируем контекст
-        incident_count = 0
-        down_count = 0
-        up_count = 0
-        monitor_types = {}
-        sources = {}
-        
-        for item in recent_context:
-            if item.get('kind') == 'incident_analysis':
-                incident_count += 1
-                
-                # Анализируем содержимое
-                content = item.get('content', '')
-                if 'Status: down' in content:
-                    down_count += 1
-                elif 'Status: up' in content:
-                    up_count += 1
-                
-                # Типы мониторов
-                if 'docker' in content.lower():
-                    monitor_types['docker'] = monitor_types.get('docker', 0) + 1
-                elif 'http' in content.lower():
-                    monitor_types['http'] = monitor_types.get('http', 0) + 1
-                elif 'tcp' in content.lower():
-                    monitor_types['tcp'] = monitor_types.get('tcp', 0) + 1
-                
-                # Источники
-                source = item.get('source', 'unknown')
-                sources[source] = sources.get(source, 0) + 1
-        
-        # Формируем статистику
-        stats = f"""
-📊 **СТАТИСТИКА ПО ИНЦИДЕНТАМ**
+        from datetime import timedelta
+        from sqlmodel import Session
+        from db import get_engine
+        from .incidents import incident_statistics
+
+        since = datetime.now().astimezone() - timedelta(days=days)
+        with Session(get_engine()) as session:
+            data = incident_statistics(session, since=since, monitor_name=monitor_name or None)
 
-🔢 **Общее количество:** {incident_count}
-🔴 **Падения (down):** {down_count}
-🟢 **Восстановления (up):** {up_count}
+        if not data["total"]:
+            return f"📊 За {days} дн. инцидентов нет."
+
+        stats = f"""
+📊 **СТАТИСТИКА ПО ИНЦИДЕНТАМ** (за {days} дн.)
 
-🖥️ **Типы мониторов:**
+🔢 **Общее количество:** {data['total']}
+🟢 **Восстановлено:** {data['resolved']}
+🔴 **Открыто:** {data['open']}
 """
-        
-        for monitor_type, count in monitor_types.items():
-            stats += f"   • {monitor_type}: {count}\n"
-        
-        stats += f"\n📡 **Источники:**\n"
-        
-        for source, count in sources.items():
-            stats += f"   • {source}: {count}\n"
-        
-        if incident_count > 0:
-            uptime_percentage = (up_count / incident_count) * 100
-            stats += f"\n📈 **Процент восстановлений:** {uptime_percentage:.1f}%"
-        
+        if data["avg_duration_s"] is not None:
+            stats += f"⏱️ **Средняя длительность:** {data['avg_duration_s'] / 60:.1f} мин\n"
+
+        stats += "\n🖥️ **По мониторам:**\n"
+        for row in data["by_monitor"][:10]:
+            stats += f"   • {row['key']}: {row['count']} (восстановлено {row['resolved']})\n"
+
+        stats += "\n🧩 **Типы мониторов:**\n"
+        for row in data["by_monitor_type"]:
+            stats += f"   • {row['key']}: {row['count']}\n"
+
+        stats += f"\n📈 **Процент восстановлений:** {data['recovery_rate'] * 100:.1f}%"
         return stats
-        
+
     except Exception as e:
         return f"❌ Ошибка получения статистики: {str(e)}"
 
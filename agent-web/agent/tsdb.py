@@ -0,0 +1,325 @@
+"""
+Встроенное хранилище временных рядов для метрик Uptime Kuma (/metrics).
+
+Ряд — пара (метрика, монитор). Все ряды лежат в одной матрице float32
+[TSDB_MAX_SERIES × ёмкость] поверх memmap-файла в TSDB_DIR; столбец — слот
+времени (tick = ts // TSDB_STEP, слот = tick % ёмкость), общий массив slot_ticks
+помнит, какому tick принадлежит слот. Кольцо перезаписывает самые старые слоты,
+поэтому размер фиксирован: при шаге 60 с и 365 днях ёмкость 525 600 слотов,
+100 рядов (50 мониторов × response_time_ms, status) ≈ 200 МиБ файла + 4 МиБ
+slot_ticks. В памяти — только страницы, которых касались запросы; строка ряда
+непрерывна, год одного ряда — 2 МиБ.
+
+Фоновая задача scrape_loop() раз в TSDB_SCRAPE_INTERVAL снимает /metrics и пишет
+слот; flush() на диск — раз в TSDB_FLUSH_INTERVAL и при остановке.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+TSDB_DIR = os.environ.get("TSDB_DIR", "./data/tsdb")
+TSDB_STEP = int(os.environ.get("TSDB_STEP", "60"))
+TSDB_RETENTION_DAYS = float(os.environ.get("TSDB_RETENTION_DAYS", "365"))
+TSDB_MAX_SERIES = int(os.environ.get("TSDB_MAX_SERIES", "100"))
+# 0 — не снимать /metrics
+TSDB_SCRAPE_INTERVAL = float(os.environ.get("TSDB_SCRAPE_INTERVAL", str(TSDB_STEP)))
+TSDB_FLUSH_INTERVAL = float(os.environ.get("TSDB_FLUSH_INTERVAL", "300"))
+TSDB_METRICS = tuple(
+    m.strip() for m in os.environ.get("TSDB_METRICS", "response_time_ms,status").split(",") if m.strip()
+)
+
+AGGREGATIONS = ("mean", "min", "max", "last", "count")
+
+SeriesKey = Tuple[str, str]
+
+
+class RingTSDB:
+    def __init__(
+        self,
+        path: Optional[str] = TSDB_DIR,
+        step: int = TSDB_STEP,
+        retention_days: float = TSDB_RETENTION_DAYS,
+        max_series: int = TSDB_MAX_SERIES,
+    ):
+        """path=None — без файлов, только в памяти (бенчмарки)."""
+        self.path = Path(path) if path else None
+        self.step = step
+        self.capacity = max(int(retention_days * 86400 // step), 1)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._rows: Dict[SeriesKey, int] = {}
+        self._dropped: set = set()
+        self._open()
+
+    # --- файлы -------------------------------------------------------------
+
+    def _open(self) -> None:
+        shape = (self.max_series, self.capacity)
+        if self.path is None:
+            self._values = np.full(shape, np.nan, dtype=np.float32)
+            self._ticks = np.zeros(self.capacity, dtype=np.int64)
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        values_path = self.path / "values.npy"
+        ticks_path = self.path / "slot_ticks.npy"
+        meta = self._load_meta()
+        if meta.get("step") == self.step and values_path.exists() and ticks_path.exists():
+            values = open_memmap(values_path, mode="r+")
+            ticks = open_memmap(ticks_path, mode="r+")
+            if values.shape == shape and ticks.shape == (self.capacity,):
+                self._values, self._ticks = values, ticks
+                self._rows = {(m, n): row for m, n, row in meta.get("series", [])}
+                return
+            del values, ticks
+        if values_path.exists():
+            print(f"⚠️ TSDB: параметры изменились, старые ряды в {self.path} пересоздаются", flush=True)
+        # Новый файл разреженный: нули не пишутся, строки NaN заполняются при регистрации ряда
+        self._values = open_memmap(values_path, mode="w+", dtype=np.float32, shape=shape)
+        self._ticks = open_memmap(ticks_path, mode="w+", dtype=np.int64, shape=(self.capacity,))
+        self._rows = {}
+        self._save_meta()
+
+    def _load_meta(self) -> dict:
+        try:
+            with open(self.path / "series.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self) -> None:
+        if self.path is None:
+            return
+        meta = {
+            "step": self.step,
+            "capacity": self.capacity,
+            "series": [[m, n, row] for (m, n), row in self._rows.items()],
+        }
+        tmp = self.path / "series.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, self.path / "series.json")
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            self._values.flush()
+            self._ticks.flush()
+
+    # --- запись ------------------------------------------------------------
+
+    def _row(self, key: SeriesKey) -> Optional[int]:
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if len(self._rows) >= self.max_series:
+            if key not in self._dropped:
+                self._dropped.add(key)
+                print(f"⚠️ TSDB: лимит TSDB_MAX_SERIES={self.max_series}, ряд {key} не пишется", flush=True)
+            return None
+        row = len(self._rows)
+        self._values[row, :] = np.nan
+        self._rows[key] = row
+        self._save_meta()
+        return row
+
+    def append(self, at: float, values: Dict[SeriesKey, Optional[float]]) -> None:
+        """Значения рядов в момент at (unix, с); повтор в том же шаге перезаписывает."""
+        tick = int(at) // self.step
+        slot = tick % self.capacity
+        with self._lock:
+            if self._ticks[slot] != tick:
+                self._values[:, slot] = np.nan
+                self._ticks[slot] = tick
+            for key, value in values.items():
+                if value is None:
+                    continue
+                row = self._row(key)
+                if row is not None:
+                    self._values[row, slot] = value
+
+    # --- чтение ------------------------------------------------------------
+
+    def series(self, monitor: Optional[str] = None) -> List[SeriesKey]:
+        return [key for key in self._rows if monitor is None or key[1] == monitor]
+
+    def _slots(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        last = int(end) // self.step
+        first = max(int(start) // self.step, last - self.capacity + 1)
+        if last < first:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        ticks = np.arange(first, last + 1, dtype=np.int64)
+        slots = ticks % self.capacity
+        valid = self._ticks[slots] == ticks
+        return ticks[valid] * self.step, slots[valid]
+
+    def range(self, metric: str, monitor: str, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Точки ряда в [start, end]: (ts, значения), пропуски отброшены."""
+        row = self._rows.get((metric, monitor))
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        with self._lock:
+            ts, slots = self._slots(start, end)
+            values = self._values[row, slots]
+        present = ~np.isnan(values)
+        return ts[present], values[present]
+
+    def downsample(
+        self,
+        metric: str,
+        monitor: str,
+        start: float,
+        end: float,
+        bucket: float,
+        agg: str = "mean",
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Агрегат по корзинам bucket секунд: (начало корзины, значение)."""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg: одно из {AGGREGATIONS}")
+        ts, values = self.range(metric, monitor, start, end)
+        if not len(ts):
+            return ts, values.astype(np.float64)
+        groups = ts // int(max(bucket, self.step))
+        # ts возрастают — корзины идут подряд, reduceat по их началам
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        counts = np.diff(np.r_[starts, len(ts)])
+        values = values.astype(np.float64)
+        if agg == "mean":
+            result = np.add.reduceat(values, starts) / counts
+        elif agg == "min":
+            result = np.minimum.reduceat(values, starts)
+        elif agg == "max":
+            result = np.maximum.reduceat(values, starts)
+        elif agg == "last":
+            result = values[starts + counts - 1]
+        else:
+            result = counts.astype(np.float64)
+        return groups[starts] * int(max(bucket, self.step)), result
+
+    def rate(self, metric: str, monitor: str, start: float, end: float) -> Optional[float]:
+        """Прирост в секунду за окно; падение значения считается сбросом счётчика."""
+        ts, values = self.range(metric, monitor, start, end)
+        if len(ts) < 2:
+            return None
+        values = values.astype(np.float64)
+        delta = np.diff(values)
+        delta = np.where(delta < 0, values[1:], delta)
+        return float(delta.sum() / (ts[-1] - ts[0]))
+
+    def percentile(
+        self,
+        metric: str,
+        monitor: str,
+        start: float,
+        end: float,
+        q: Sequence[float] = (50, 95, 99),
+    ) -> Dict[str, Optional[float]]:
+        _, values = self.range(metric, monitor, start, end)
+        if not len(values):
+            return {f"p{int(p)}": None for p in q}
+        result = np.percentile(values.astype(np.float64), q)
+        return {f"p{int(p)}": round(float(v), 2) for p, v in zip(q, result)}
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "path": str(self.path) if self.path else None,
+            "step_s": self.step,
+            "capacity": self.capacity,
+            "series": len(self._rows),
+            "max_series": self.max_series,
+            "budget_bytes": int(self._values.nbytes + self._ticks.nbytes),
+        }
+
+
+_tsdb: Optional[RingTSDB] = None
+_tsdb_lock = threading.Lock()
+
+
+def get_tsdb() -> RingTSDB:
+    global _tsdb
+    if _tsdb is None:
+        with _tsdb_lock:
+            if _tsdb is None:
+                _tsdb = RingTSDB()
+    return _tsdb
+
+
+def loaded_tsdb() -> Optional[RingTSDB]:
+    """Хранилище, если уже открыто (без создания файлов)."""
+    return _tsdb
+
+
+def history(
+    monitor: str,
+    metric: str = "response_time_ms",
+    hours: float = 1.0,
+    bucket: Optional[float] = None,
+    agg: str = "mean",
+    until: Optional[float] = None,
+) -> Dict[str, object]:
+    """Ряд монитора за последние hours: точки (с прореживанием) и перцентили."""
+    db = get_tsdb()
+    end = until or time.time()
+    start = end - hours * 3600
+    if bucket is None:
+        # Не больше ~120 точек в ответе
+        bucket = max(db.step, hours * 3600 / 120)
+    ts, values = db.downsample(metric, monitor, start, end, bucket, agg)
+    return {
+        "monitor": monitor,
+        "metric": metric,
+        "bucket_s": int(max(bucket, db.step)),
+        "agg": agg,
+        "points": [[int(t), round(float(v), 2)] for t, v in zip(ts, values)],
+        **db.percentile(metric, monitor, start, end),
+    }
+
+
+def scrape_once(db: Optional[RingTSDB] = None, metrics: Iterable[str] = TSDB_METRICS) -> int:
+    """Снимает /metrics и пишет слот; возвращает число записанных значений."""
+    from .uptime_kuma_api import get_uptime_kuma_api
+
+    db = db or get_tsdb()
+    monitors = get_uptime_kuma_api().get_monitor_metrics(max_age=0)
+    if not monitors:
+        return 0
+    values: Dict[SeriesKey, Optional[float]] = {}
+    for name, monitor in monitors.items():
+        for metric in metrics:
+            value = getattr(monitor, metric, None)
+            values[(metric, name)] = None if value is None else float(value)
+    db.append(time.time(), values)
+    # Без постоянного подключения детектор деградации питается снимками /metrics
+    from .uptime_kuma_live import live_view
+
+    if live_view() is None:
+        from .degradation import on_heartbeat
+
+        for name, monitor in monitors.items():
+            on_heartbeat(name, monitor.status, monitor.response_time_ms)
+    return sum(1 for v in values.values() if v is not None)
+
+
+async def scrape_loop() -> None:
+    """Фоновая задача приложения: /metrics → TSDB раз в TSDB_SCRAPE_INTERVAL."""
+    if TSDB_SCRAPE_INTERVAL <= 0 or not os.getenv("UPTIME_KUMA_API"):
+        return
+    db = await asyncio.to_thread(get_tsdb)
+    flushed_at = time.monotonic()
+    while True:
+        try:
+            await asyncio.to_thread(scrape_once, db)
+        except Exception as e:
+            print(f"⚠️ TSDB scrape: {e}", flush=True)
+        if time.monotonic() - flushed_at >= TSDB_FLUSH_INTERVAL:
+            await asyncio.to_thread(db.flush)
+            flushed_at = time.monotonic()
+        await asyncio.sleep(TSDB_SCRAPE_INTERVAL)
@@ -1,11 +1,173 @@
 import os
+import re
+import time
+import threading
 import requests
 import json
+from dataclasses import asdict, dataclass
+from math import isnan
+from operator import itemgetter
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
+from .prometheus import ParseError, parse_labels
+
 load_dotenv()
 
+# Разобранные /metrics кэшируются на интервал опроса Kuma, сек
+UPTIME_KUMA_SCRAPE_INTERVAL = float(os.getenv("UPTIME_KUMA_SCRAPE_INTERVAL", "30"))
+STATUS_TEXT = {0: "DOWN", 1: "UP", 2: "PENDING", 3: "MAINTENANCE"}
+
+
+def _label(value: Optional[str]) -> Optional[str]:
+    # prom-client Kuma пишет отсутствующие hostname/port как "null"
+    return None if value in (None, "", "null") else value
+
+
+@dataclass
+class MonitorMetrics:
+    """Метрики одного монитора из /metrics (семейства monitor_*)."""
+
+    name: str
+    type: Optional[str] = None
+    url: Optional[str] = None
+    hostname: Optional[str] = None
+    port: Optional[str] = None
+    status: Optional[int] = None
+    response_time_ms: Optional[float] = None
+    cert_days_remaining: Optional[float] = None
+    cert_is_valid: Optional[bool] = None
+
+    @property
+    def status_text(self) -> str:
+        return STATUS_TEXT.get(self.status, "UNKNOWN")
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["status_text"] = self.status_text
+        return data
+
+
+# Строка меток → (name, type, url, hostname, port) с прошлого разбора. Метки
+# монитора между опросами не меняются: разбирается только новое или изменённое.
+_label_cache: Dict[str, Optional[tuple]] = {}
+# Семейство → (блок строк с прошлого опроса, {строка меток: значение}). Статусы
+# и сертификаты между опросами обычно те же: блок сравнивается целиком, заново
+# разбирается только изменившийся (как правило, monitor_response_time).
+_family_cache: Dict[str, tuple] = {}
+_parse_lock = threading.Lock()
+
+# Семейство → поле MonitorMetrics; порядок совпадает с полями после port
+_FAMILY_VALUES = (
+    ("monitor_status", "status", int),
+    ("monitor_response_time", "response_time_ms", float),
+    ("monitor_cert_days_remaining", "cert_days_remaining", float),
+    ("monitor_cert_is_valid", "cert_is_valid", bool),
+)
+# Строка сэмпла: метки до последней «}», значение — первое поле после неё
+# (метка времени, если есть, отбрасывается)
+_FAMILY_RE = {
+    family: re.compile(r"\n%s\{(.*)\}[ \t]+(\S+)" % family)
+    for family, _, _ in _FAMILY_VALUES
+}
+
+
+def _monitor_labels(text: str) -> Optional[tuple]:
+    try:
+        labels = parse_labels(text)
+    except ParseError:
+        return None
+    name = labels.get("monitor_name")
+    if name is None:
+        return None
+    url = _label(labels.get("monitor_url"))
+    return (
+        name,
+        _label(labels.get("monitor_type")),
+        None if url == "https://" else url,
+        _label(labels.get("monitor_hostname")),
+        _label(labels.get("monitor_port")),
+    )
+
+
+def _family_values(text: str, family: str, convert) -> Dict[str, Any]:
+    """Значения семейства по строке меток (NaN → None); text начинается с «\\n»."""
+    marker = "\n" + family + "{"
+    start = text.find(marker)
+    if start < 0:
+        return {}
+    end = text.find("\n", text.rfind(marker) + 1)
+    block = text[start:] if end < 0 else text[start:end]
+    cached = _family_cache.get(family)
+    if cached is not None and cached[0] == block:
+        return cached[1]
+    rows = _FAMILY_RE[family].findall(block)
+    try:
+        # Обычный случай — все значения числа без NaN: преобразование без цикла
+        # на Python. float() понимает NaN/±Inf формата Prometheus.
+        numbers = list(map(float, map(itemgetter(1), rows)))
+        if any(map(isnan, numbers)):
+            raise ValueError("NaN")
+        values = dict(zip(map(itemgetter(0), rows), map(convert, numbers)))
+    except ValueError:
+        values = {}
+        for labels_text, raw in rows:
+            try:
+                value = float(raw)
+            except ValueError:
+                continue
+            values[labels_text] = None if value != value else convert(value)
+    _family_cache[family] = (block, values)
+    return values
+
+
+def monitors_from_text(text: str) -> Dict[str, MonitorMetrics]:
+    """
+    Ответ /metrics → MonitorMetrics по имени монитора.
+
+    Быстрый путь для четырёх семейств monitor_*: блок семейства находится через
+    str.find, строки сэмплов режутся одним регулярным выражением на «метки» и
+    «значение», без Sample и без разбора остальных семейств. Строка меток у всех
+    семейств монитора одна и та же; разбирается она (parse_labels, с учётом
+    экранирования) один раз и дальше берётся из _label_cache.
+    """
+    with _parse_lock:
+        return _monitors_from_text("\n" + text)
+
+
+def _monitors_from_text(text: str) -> Dict[str, MonitorMetrics]:
+    global _label_cache
+    status, response_time, cert_days, cert_valid = (
+        _family_values(text, family, convert) for family, _, convert in _FAMILY_VALUES
+    )
+    labels = {**status, **response_time, **cert_days, **cert_valid}
+    cache = _label_cache
+    if labels.keys() != cache.keys():
+        # Новые мониторы разбираются, удалённые уходят из кэша
+        cache = _label_cache = {
+            key: cache[key] if key in cache else _monitor_labels(key) for key in labels
+        }
+    monitors: Dict[str, MonitorMetrics] = {}
+    for labels_text, parsed in cache.items():
+        if parsed is None:
+            continue
+        monitor = MonitorMetrics(
+            *parsed,
+            status.get(labels_text),
+            response_time.get(labels_text),
+            cert_days.get(labels_text),
+            cert_valid.get(labels_text),
+        )
+        previous = monitors.setdefault(parsed[0], monitor)
+        if previous is not monitor:
+            # То же имя с другим набором меток: пустые значения не затирают прежние
+            for _, field, _ in _FAMILY_VALUES:
+                value = getattr(monitor, field)
+                if value is not None:
+                    setattr(previous, field, value)
+    return monitors
+
+
 class UptimeKumaAPI:
     """Класс для работы с API Uptime Kuma"""
     
@@ -26,6 +188,10 @@ class UptimeKumaAPI:
             self.session.auth = ("", self.api_key)
         else:
             print("⚠️ UPTIME_KUMA_API не установлен")
+
+        self._cache: Optional[Dict[str, MonitorMetrics]] = None
+        self._cache_at = 0.0
+        self._cache_lock = threading.Lock()
     
     def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None) -> Optional[Dict]:
         """Выполняет HTTP запрос к API Uptime Kuma"""
@@ -58,51 +224,34 @@ class UptimeKumaAPI:
             print(f"❌ Ошибка запроса к Uptime Kuma API: {str(e)}")
             return None
     
+    def _scrape_monitors(self) -> Optional[Dict[str, MonitorMetrics]]:
+        """GET /metrics целиком: быстрый путь сравнивает блоки семейств с прошлым опросом."""
+        try:
+            response = self.session.get(f"{self.base_url}/metrics", timeout=10)
+            response.raise_for_status()
+            return monitors_from_text(response.text)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Ошибка запроса к Uptime Kuma API: {str(e)}")
+            return None
+
+    def get_monitor_metrics(self, max_age: Optional[float] = None) -> Optional[Dict[str, MonitorMetrics]]:
+        """Метрики мониторов из /metrics; кэш на UPTIME_KUMA_SCRAPE_INTERVAL."""
+        max_age = UPTIME_KUMA_SCRAPE_INTERVAL if max_age is None else max_age
+        with self._cache_lock:
+            if self._cache is not None and time.monotonic() - self._cache_at < max_age:
+                return self._cache
+            monitors = self._scrape_monitors()
+            if monitors is not None:
+                self._cache = monitors
+                self._cache_at = time.monotonic()
+            return monitors
+
     def get_monitors(self) -> Optional[Dict]:
         """Получает список всех мониторов через метрики Prometheus"""
-        metrics_data = self._make_request("/metrics")
-        if not metrics_data or "content" not in metrics_data:
+        monitors = self.get_monitor_metrics()
+        if monitors is None:
             return None
-        
-        # Парсим метрики Prometheus для извлечения информации о мониторах
-        monitors = {}
-        lines = metrics_data["content"].split('\n')
-        
-        for line in lines:
-            if line.startswith('monitor_status{'):
-                # Извлекаем информацию о мониторе из метрики
-                # Формат: monitor_status{monitor_name="name",monitor_type="type",...} value
-                try:
-                    # Парсим имя монитора
-                    name_start = line.find('monitor_name="') + 14
-                    name_end = line.find('"', name_start)
-                    monitor_name = line[name_start:name_end]
-                    
-                    # Парсим тип монитора
-                    type_start = line.find('monitor_type="') + 14
-                    type_end = line.find('"', type_start)
-                    monitor_type = line[type_start:type_end]
-                    
-                    # Парсим URL монитора
-                    url_start = line.find('monitor_url="') + 13
-                    url_end = line.find('"', url_start)
-                    monitor_url = line[url_start:url_end]
-                    
-                    # Парсим статус
-                    status_start = line.rfind('} ') + 2
-                    status = int(line[status_start:].strip())
-                    
-                    monitors[monitor_name] = {
-                        "name": monitor_name,
-                        "type": monitor_type,
-                        "url": monitor_url if monitor_url != "https://" else "",
-                        "status": status,
-                        "status_text": {0: "DOWN", 1: "UP", 2: "PENDING", 3: "MAINTENANCE"}.get(status, "UNKNOWN")
-                    }
-                except (ValueError, IndexError):
-                    continue
-        
-        return monitors
+        return {name: monitor.to_dict() for name, monitor in monitors.items()}
     
     def get_metrics(self) -> Optional[str]:
         """Получает метрики в формате Prometheus"""
@@ -111,9 +260,14 @@ class UptimeKumaAPI:
             return response["content"]
         return None
 
+_api: Optional[UptimeKumaAPI] = None
+
 def get_uptime_kuma_api() -> UptimeKumaAPI:
-    """Получает экземпляр API Uptime Kuma"""
-    return UptimeKumaAPI()
+    """Получает общий экземпляр API Uptime Kuma (сессия и кэш метрик переиспользуются)"""
+    global _api
+    if _api is None:
+        _api = UptimeKumaAPI()
+    return _api
 
 def test_uptime_kuma_connection() -> Dict[str, Any]:
     """Тестирует подключение к Uptime Kuma API"""
@@ -127,16 +281,12 @@ def test_uptime_kuma_connection() -> Dict[str, Any]:
     }
     
     try:
-        # Тестируем базовое подключение через /metrics endpoint
-        response = api._make_request("/metrics")
-        if response:
+        # Тестируем базовое подключение через /metrics endpoint (без кэша)
+        monitors = api.get_monitor_metrics(max_age=0)
+        if monitors is not None:
             result["connected"] = True
             result["api_available"] = True
-            
-            # Получаем количество мониторов из метрик
-            monitors = api.get_monitors()
-            if monitors:
-                result["monitors_count"] = len(monitors)
+            result["monitors_count"] = len(monitors)
             
     except Exception as e:
         result["error"] = str(e)
@@ -0,0 +1,399 @@
+"""
+Постоянное async-подключение к Uptime Kuma (socket.io) и материализованное
+представление её состояния в памяти.
+
+LiveUptimeKuma стартует из lifespan app, сам переподключается и заново
+логинится (сначала по токену сессии, затем по паролю). KumaView обновляется
+push-событиями Kuma (monitorList, heartbeat, heartbeatList,
+importantHeartbeatList, uptime, notificationList), так что инструменты и
+обогащение инцидентов читают метаданные мониторов из словарей, без запросов.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .degradation import on_heartbeat
+from .heartbeat_ring import HeartbeatStore, MessageTable
+
+load_dotenv()
+
+UPTIME_KUMA_URL = os.getenv("UPTIME_KUMA_URL", "http://uptime-kuma:3001")
+# По умолчанию включено, если задан пароль веб-интерфейса Kuma
+UPTIME_KUMA_LIVE = os.getenv(
+    "UPTIME_KUMA_LIVE", "true" if os.getenv("UPTIME_KUMA_PASSWORD") else "false"
+).lower() in ("1", "true", "yes")
+CONNECT_TIMEOUT = float(os.getenv("UPTIME_KUMA_CONNECT_TIMEOUT", "10"))
+CALL_TIMEOUT = float(os.getenv("UPTIME_KUMA_CALL_TIMEOUT", "10"))
+RECONNECT_MAX_S = float(os.getenv("UPTIME_KUMA_RECONNECT_MAX", "60"))
+HEARTBEATS_KEPT = 100
+IMPORTANT_KEPT = 50
+
+
+def _monitor_id(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KumaView:
+    """
+    Мониторы, уведомления, heartbeat'ы по монитору — из push-событий Kuma.
+
+    Пишет только event loop; словари заменяются целиком (copy-on-write), так что
+    инструменты в потоках читают их без блокировок. Heartbeat'ы — в кольцевых
+    буферах (agent.heartbeat_ring) с общей таблицей сообщений.
+    """
+
+    def __init__(self, history=None):
+        # agent.slo.HeartbeatHistory — столбцы heartbeat'ов для SLO за 30 дней
+        self.history = history
+        self.monitors: Dict[int, Dict[str, Any]] = {}
+        self.by_name: Dict[str, int] = {}
+        self.notifications: List[Dict[str, Any]] = []
+        messages = MessageTable()
+        self.heartbeats = HeartbeatStore(HEARTBEATS_KEPT, messages)
+        self.important = HeartbeatStore(IMPORTANT_KEPT, messages)
+        self.uptime: Dict[int, Dict[int, float]] = {}
+        self.synced = False
+        self.updated_at: Optional[float] = None
+
+    def _touch(self) -> None:
+        self.updated_at = time.time()
+
+    def _reindex(self) -> None:
+        self.by_name = {m.get("name"): mid for mid, m in self.monitors.items() if m.get("name")}
+
+    def set_monitors(self, data: Dict[str, Any]) -> None:
+        monitors = {}
+        for key, monitor in (data or {}).items():
+            mid = _monitor_id(monitor.get("id", key))
+            if mid is not None:
+                monitors[mid] = monitor
+        self.monitors = monitors
+        self._reindex()
+        self.synced = True
+        self._touch()
+
+    def update_monitors(self, data: Dict[str, Any]) -> None:
+        """Частичное обновление (updateMonitorIntoList в Kuma 2.x)."""
+        monitors = dict(self.monitors)
+        for key, monitor in (data or {}).items():
+            mid = _monitor_id(monitor.get("id", key))
+            if mid is not None:
+                monitors[mid] = monitor
+        self.monitors = monitors
+        self._reindex()
+        self._touch()
+
+    def delete_monitor(self, monitor_id: Any) -> None:
+        mid = _monitor_id(monitor_id)
+        self.monitors = {k: v for k, v in self.monitors.items() if k != mid}
+        self.heartbeats.drop(mid)
+        self.important.drop(mid)
+        self.uptime = {k: v for k, v in self.uptime.items() if k != mid}
+        if self.history is not None and mid is not None:
+            self.history.drop_monitor(mid)
+        self._reindex()
+        self._touch()
+
+    def set_notifications(self, data: Any) -> None:
+        self.notifications = list(data.values()) if isinstance(data, dict) else list(data or [])
+        self._touch()
+
+    def add_heartbeat(self, beat: Dict[str, Any]) -> None:
+        mid = _monitor_id(beat.get("monitorID"))
+        if mid is None:
+            return
+        self.heartbeats.append(mid, beat)
+        if beat.get("important"):
+            self.important.append(mid, beat)
+        if self.history is not None:
+            self.history.add(mid, beat)
+        name = (self.monitors.get(mid) or {}).get("name")
+        if name:
+            on_heartbeat(name, beat.get("status"), beat.get("ping"))
+        self._touch()
+
+    def set_heartbeats(self, monitor_id: Any, beats: List[Dict[str, Any]], overwrite: bool = False) -> None:
+        mid = _monitor_id(monitor_id)
+        if mid is None:
+            return
+        ordered = sorted(beats or [], key=lambda hb: hb.get("time") or "")
+        self.heartbeats.extend(mid, ordered, overwrite=overwrite)
+        if self.history is not None:
+            # Повторно присланные после переподключения heartbeat'ы история пропускает
+            self.history.extend(mid, ordered)
+        self._touch()
+
+    def set_important(self, monitor_id: Any, beats: List[Dict[str, Any]], overwrite: bool = False) -> None:
+        mid = _monitor_id(monitor_id)
+        if mid is None:
+            return
+        self.important.extend(mid, sorted(beats or [], key=lambda hb: hb.get("time") or ""), overwrite=overwrite)
+        self._touch()
+
+    def set_uptime(self, monitor_id: Any, period: Any, percentage: float) -> None:
+        from .uptime_kuma_snapshot import period_label
+
+        # Kuma 1.x шлёт часы (24, 720), 2.x ещё и "1y": ключ — метка периода
+        mid, label = _monitor_id(monitor_id), period_label(period)
+        if mid is not None and label is not None:
+            self.uptime = {**self.uptime, mid: {**self.uptime.get(mid, {}), label: percentage}}
+
+    def monitor_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        mid = self.by_name.get(name)
+        return self.monitors.get(mid) if mid is not None else None
+
+    # Интерфейс чтения как у UptimeKumaSocketIO — инструменты работают с обоими
+
+    def get_monitors(self) -> Dict[str, Any]:
+        return {str(mid): monitor for mid, monitor in self.monitors.items()}
+
+    def get_monitor_by_id(self, monitor_id: int) -> Optional[Dict[str, Any]]:
+        return self.monitors.get(_monitor_id(monitor_id))
+
+    def get_monitor_heartbeats(self, monitor_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.heartbeats.beats(_monitor_id(monitor_id), limit)
+
+    def get_important_heartbeats(self, monitor_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.important.beats(_monitor_id(monitor_id), limit)
+
+    def get_notifications(self) -> List[Dict[str, Any]]:
+        return list(self.notifications)
+
+    def get_uptime_stats(self, monitor_id: int) -> Dict[str, Any]:
+        mid = _monitor_id(monitor_id)
+        stats = self.heartbeats.stats(mid)
+        if not stats:
+            return {}
+        for label, percentage in dict(self.uptime.get(mid, {})).items():
+            stats[f"uptime_{label}"] = round(percentage * 100, 2)
+        if self.history is not None and mid is not None:
+            from .slo import compute_slo
+
+            report = compute_slo(self.history, monitor_ids=[mid])
+            if report["monitors"]:
+                slo = report["monitors"][0]
+                for label, value in slo["availability"].items():
+                    if value is not None:
+                        stats[f"availability_{label}"] = value
+                stats["error_budget_remaining_pct"] = slo["error_budget"]["remaining_pct"]
+        return stats
+
+    def dashboard_snapshot(self, recent: int = 5, connected: bool = True) -> Dict[str, Any]:
+        """Все мониторы и их статистика одним проходом (см. uptime_kuma_snapshot)."""
+        from .uptime_kuma_snapshot import build_snapshot
+
+        return build_snapshot(
+            self.monitors,
+            self.heartbeats,
+            dict(self.uptime),
+            self.get_notifications(),
+            recent=recent,
+            connected=connected,
+        )
+
+
+class LiveUptimeKuma:
+    """Долгоживущий socketio.AsyncClient с переподключением и повторным логином."""
+
+    def __init__(self, url: str = UPTIME_KUMA_URL):
+        import socketio
+
+        self.base_url = url
+        self.username = os.getenv("UPTIME_KUMA_USERNAME", "admin")
+        self.password = os.getenv("UPTIME_KUMA_PASSWORD", "admin")
+        from .slo import get_history
+
+        self.view = KumaView(history=get_history())
+        self.sio = socketio.AsyncClient(
+            reconnection=True,
+            reconnection_delay=1,
+            reconnection_delay_max=RECONNECT_MAX_S,
+        )
+        self.authenticated = False
+        self.token: Optional[str] = None
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        self._stopping = False
+        self._setup_event_handlers()
+
+    def _setup_event_handlers(self) -> None:
+        sio, view = self.sio, self.view
+
+        @sio.event
+        async def connect():
+            print("✅ Uptime Kuma live: подключено", flush=True)
+            # Логин — отдельной задачей: call() внутри обработчика connect не получит ack
+            asyncio.create_task(self._login())
+
+        @sio.event
+        async def disconnect(*args):
+            self.authenticated = False
+            if not self._stopping:
+                self.reconnects += 1
+                print("⚠️ Uptime Kuma live: соединение потеряно, переподключение", flush=True)
+
+        @sio.event
+        async def connect_error(data):
+            self.last_error = str(data)
+
+        sio.on("monitorList", view.set_monitors)
+        sio.on("updateMonitorIntoList", view.update_monitors)
+        sio.on("deleteMonitorFromList", view.delete_monitor)
+        sio.on("notificationList", view.set_notifications)
+        sio.on("heartbeat", view.add_heartbeat)
+        sio.on("heartbeatList", view.set_heartbeats)
+        sio.on("importantHeartbeatList", view.set_important)
+        sio.on("uptime", view.set_uptime)
+
+    async def _login(self) -> bool:
+        try:
+            if self.token:
+                response = await self.sio.call("loginByToken", self.token, timeout=CALL_TIMEOUT)
+                if not (response or {}).get("ok"):
+                    self.token = None
+            if not self.token:
+                response = await self.sio.call(
+                    "login",
+                    {"username": self.username, "password": self.password, "token": ""},
+                    timeout=CALL_TIMEOUT,
+                )
+                if not (response or {}).get("ok"):
+                    self.last_error = (response or {}).get("msg") or "login failed"
+                    print(f"❌ Uptime Kuma live: ошибка аутентификации: {self.last_error}", flush=True)
+                    return False
+                self.token = response.get("token")
+            self.authenticated = True
+            self.last_error = None
+            print("✅ Uptime Kuma live: аутентификация, состояние из push-событий", flush=True)
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Uptime Kuma live: логин: {e}", flush=True)
+            return False
+
+    async def run(self) -> None:
+        """Первое подключение с backoff; дальше переподключается сам socketio."""
+        delay = 1.0
+        while not self._stopping:
+            try:
+                await self.sio.connect(self.base_url, wait_timeout=CONNECT_TIMEOUT)
+                await self.sio.wait()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Uptime Kuma live: {e}; повтор через {delay:.0f} с", flush=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_S)
+
+    # Чтение — из представления в памяти (интерфейс как у UptimeKumaSocketIO)
+
+    def get_monitors(self) -> Dict[str, Any]:
+        return self.view.get_monitors()
+
+    def get_monitor_by_id(self, monitor_id: int) -> Optional[Dict[str, Any]]:
+        return self.view.get_monitor_by_id(monitor_id)
+
+    def get_monitor_heartbeats(self, monitor_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.view.get_monitor_heartbeats(monitor_id, limit)
+
+    def get_notifications(self) -> List[Dict[str, Any]]:
+        return self.view.get_notifications()
+
+    def get_uptime_stats(self, monitor_id: int) -> Dict[str, Any]:
+        return self.view.get_uptime_stats(monitor_id)
+
+    def dashboard_snapshot(self, recent: int = 5) -> Dict[str, Any]:
+        return self.view.dashboard_snapshot(recent, connected=self.is_connected())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+    def is_connected(self) -> bool:
+        return self.sio.connected and self.authenticated
+
+    def status(self) -> Dict[str, Any]:
+        view = self.view
+        return {
+            "url": self.base_url,
+            "connected": self.sio.connected,
+            "authenticated": self.authenticated,
+            "synced": view.synced,
+            "monitors": len(view.monitors),
+            "notifications": len(view.notifications),
+            "reconnects": self.reconnects,
+            "updated_at": view.updated_at,
+            "last_error": self.last_error,
+        }
+
+
+_live: Optional[LiveUptimeKuma] = None
+
+
+def start_live_client() -> Optional[asyncio.Task]:
+    """Запускает общий клиент (из lifespan app); None, если выключен."""
+    global _live
+    if not UPTIME_KUMA_LIVE:
+        return None
+    if _live is None:
+        _live = LiveUptimeKuma()
+    return asyncio.create_task(_live.run())
+
+
+async def stop_live_client() -> None:
+    if _live is not None:
+        await _live.stop()
+
+
+def get_live_client() -> Optional[LiveUptimeKuma]:
+    return _live
+
+
+def get_synced_client() -> Optional[LiveUptimeKuma]:
+    """Общий клиент, если он запущен и уже получил список мониторов."""
+    if _live is not None and _live.view.synced:
+        return _live
+    return None
+
+
+def live_view() -> Optional[KumaView]:
+    client = get_synced_client()
+    return client.view if client is not None else None
+
+
+def enrich_details(details: Dict[str, Any], important_limit: int = 5) -> bool:
+    """Дополняет details вебхука метаданными монитора из памяти; False — нет данных."""
+    view = live_view()
+    if view is None:
+        return False
+    monitor = view.monitor_by_name(details.get("monitor_name") or "")
+    if monitor is None:
+        return False
+    if details.get("monitor_url") in (None, "", "N/A") and monitor.get("url"):
+        details["monitor_url"] = monitor["url"]
+    if details.get("monitor_type") in (None, "", "unknown") and monitor.get("type"):
+        details["monitor_type"] = monitor["type"]
+    for key in ("hostname", "port"):
+        if not details.get(key) and monitor.get(key):
+            details[key] = monitor[key]
+    mid = _monitor_id(monitor.get("id"))
+    details["kuma_monitor_id"] = mid
+    details["kuma_interval"] = monitor.get("interval")
+    details["kuma_recent_changes"] = [
+        {"time": hb.get("time"), "status": hb.get("status"), "msg": hb.get("msg")}
+        for hb in view.get_important_heartbeats(mid, important_limit)
+    ]
+    uptime = view.uptime.get(mid)
+    if uptime:
+        details["kuma_uptime"] = {label: round(pct * 100, 2) for label, pct in uptime.items()}
+    return True
@@ -0,0 +1,105 @@
+"""
+Снимок дашборда Uptime Kuma за один проход по всем мониторам.
+
+Heartbeat'ы всех мониторов (уже полученные подпиской socket.io и лежащие в
+кольцевых буферах agent.heartbeat_ring) склеиваются в плоские массивы numpy,
+статистика считается bincount'ами сразу для всех мониторов — без запроса и
+цикла статистики на каждый монитор.
+"""
+
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from .heartbeat_ring import HeartbeatStore
+
+STATUS_TEXT = {0: "DOWN", 1: "UP", 2: "PENDING", 3: "MAINTENANCE"}
+
+
+def period_label(period: Any) -> Optional[str]:
+    """
+    Период из события uptime → метка: 24 / "24" → "24h", "720" → "720h";
+    нечисловой период Kuma 2.x ("1y") остаётся как есть, пустой — None.
+    """
+    text = str(period).strip() if period is not None else ""
+    if not text:
+        return None
+    return f"{text}h" if text.isdigit() else text
+
+
+def build_snapshot(
+    monitors: Mapping[Any, Dict[str, Any]],
+    heartbeats: HeartbeatStore,
+    uptime: Mapping[Any, Mapping[Any, float]],
+    notifications: List[Dict[str, Any]],
+    recent: int = 5,
+    connected: bool = True,
+) -> Dict[str, Any]:
+    """
+    monitors: id → монитор; heartbeats: кольца по int id монитора;
+    uptime: id → {период: доля}, период — как в событии Kuma или period_label.
+    Ключи monitors и uptime — int или str.
+    """
+    ids = [int(mid) for mid in monitors]
+
+    # Плоские массивы: номер монитора, статус, ping (NaN, если нет)
+    windows = [heartbeats.window(mid) for mid in ids]
+    counts = np.array([len(w.status) for w in windows], dtype=np.int64)
+    owner = np.repeat(np.arange(len(ids)), counts)
+    status = np.concatenate([w.status for w in windows] or [np.empty(0, np.int8)])
+    ping = np.concatenate([w.ping for w in windows] or [np.empty(0, np.float32)]).astype(np.float64)
+    total = len(status)
+
+    n = len(ids)
+    up = np.bincount(owner, weights=status == 1, minlength=n)
+    has_ping = ~np.isnan(ping)
+    ping_n = np.bincount(owner[has_ping], minlength=n)
+    ping_sum = np.bincount(owner[has_ping], weights=ping[has_ping], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        uptime_pct = np.where(counts > 0, up / np.maximum(counts, 1) * 100, np.nan)
+        avg_ping = np.where(ping_n > 0, ping_sum / np.maximum(ping_n, 1), np.nan)
+    # Последний heartbeat монитора — конец его отрезка в плоских массивах
+    last_pos = np.cumsum(counts) - 1
+    last_status = np.where(counts > 0, status[np.clip(last_pos, 0, None)] if total else -1, -1)
+
+    result_monitors = []
+    for i, mid in enumerate(ids):
+        monitor = monitors.get(mid, monitors.get(str(mid))) or {}
+        stats: Dict[str, Any] = {}
+        if counts[i]:
+            stats = {
+                "total_heartbeats": int(counts[i]),
+                "up_count": int(up[i]),
+                "down_count": int(counts[i] - up[i]),
+                "uptime_percentage": round(float(uptime_pct[i]), 2),
+            }
+            if ping_n[i]:
+                stats["avg_ping_ms"] = round(float(avg_ping[i]), 1)
+        periods = uptime.get(mid, uptime.get(str(mid))) or {}
+        for period, percentage in dict(periods).items():
+            label = period_label(period)
+            if label is not None:
+                stats[f"uptime_{label}"] = round(percentage * 100, 2)
+        result_monitors.append({
+            "id": str(mid),
+            "name": monitor.get("name", "Unknown"),
+            "type": monitor.get("type", "Unknown"),
+            "url": monitor.get("url", "N/A"),
+            "active": monitor.get("active", False),
+            "tags": monitor.get("tags", []),
+            "status": STATUS_TEXT.get(int(last_status[i]), "UNKNOWN"),
+            "recent_heartbeats": heartbeats.beats(mid, recent) if recent else [],
+            "uptime_stats": stats,
+        })
+
+    return {
+        "summary": {
+            "total_monitors": n,
+            "total_notifications": len(notifications),
+            "connection_status": connected,
+            "up": int(np.count_nonzero(last_status == 1)),
+            "down": int(np.count_nonzero(last_status == 0)),
+        },
+        "monitors": result_monitors,
+        "notifications": notifications,
+    }
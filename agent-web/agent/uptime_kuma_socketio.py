@@ -1,198 +1,294 @@
 import os
 import json
 import time
+import threading
 import socketio
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
+from .heartbeat_ring import HeartbeatStore
+
 load_dotenv()
 
+# Запросы к Uptime Kuma — socket.io call() с ack: ответ возвращается сразу по
+# приходу, без emit + sleep. Списки (monitorList, heartbeatList, uptime)
+# Kuma присылает событиями; ack getMonitorList приходит после monitorList.
+CONNECT_TIMEOUT = float(os.getenv("UPTIME_KUMA_CONNECT_TIMEOUT", "10"))
+CALL_TIMEOUT = float(os.getenv("UPTIME_KUMA_CALL_TIMEOUT", "10"))
+# Период getMonitorBeats, часов
+BEATS_PERIOD_HOURS = int(os.getenv("UPTIME_KUMA_BEATS_PERIOD_HOURS", "24"))
+# Heartbeat'ов из push-событий на монитор (кольцевой буфер)
+HEARTBEATS_KEPT = 100
+
+
 class UptimeKumaSocketIO:
     """Socket.io клиент для Uptime Kuma API"""
-    
+
     def __init__(self):
         self.base_url = os.getenv("UPTIME_KUMA_URL", "http://uptime-kuma:3001")
         self.username = os.getenv("UPTIME_KUMA_USERNAME", "admin")
         self.password = os.getenv("UPTIME_KUMA_PASSWORD", "admin")
         self.api_key = os.getenv("UPTIME_KUMA_API")
-        
+
         # Создаем Socket.io клиент
         self.sio = socketio.Client()
         self.connected = False
         self.authenticated = False
         self.monitors = {}
         self.notifications = {}
-        self.heartbeats = {}
-        
+        self.heartbeats = HeartbeatStore(HEARTBEATS_KEPT)
+        # monitorID → {период (часы): процент} из push-события uptime
+        self.uptime = {}
+        # Событие → threading.Event: выставляется, когда данные пришли
+        self._received = {name: threading.Event() for name in ("monitorList", "notificationList")}
+        # Задержки call(): событие → calls / errors / timeouts / total_ms / max_ms / last_ms
+        self.metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+
         # Настраиваем обработчики событий
         self._setup_event_handlers()
-    
+
     def _setup_event_handlers(self):
         """Настраивает обработчики событий Socket.io"""
-        
+
         @self.sio.event
         def connect():
             print("✅ Подключен к Uptime Kuma Socket.io")
             self.connected = True
-        
+
         @self.sio.event
-        def disconnect():
+        def disconnect(*args):
             print("❌ Отключен от Uptime Kuma Socket.io")
             self.connected = False
             self.authenticated = False
-        
+            for event in self._received.values():
+                event.clear()
+
         @self.sio.event
         def connect_error(data):
             print(f"❌ Ошибка подключения к Uptime Kuma: {data}")
-        
-        @self.sio.event
-        def login(data):
-            if data.get("ok"):
-                print("✅ Успешная аутентификация в Uptime Kuma")
-                self.authenticated = True
-            else:
-                print(f"❌ Ошибка аутентификации: {data.get('msg', 'Неизвестная ошибка')}")
-        
+
         @self.sio.event
         def monitorList(data):
             print(f"📊 Получен список мониторов: {len(data)} мониторов")
             self.monitors = data
-        
+            self._received["monitorList"].set()
+
         @self.sio.event
         def notificationList(data):
             print(f"🔔 Получен список уведомлений: {len(data)} уведомлений")
             self.notifications = data
-        
+            self._received["notificationList"].set()
+
         @self.sio.event
         def heartbeat(data):
-            print(f"💓 Получен heartbeat для монитора {data.get('monitorID')}: {data.get('status')}")
-            monitor_id = data.get('monitorID')
-            if monitor_id not in self.heartbeats:
-                self.heartbeats[monitor_id] = []
-            self.heartbeats[monitor_id].append(data)
-            # Ограничиваем количество heartbeat'ов
-            if len(self.heartbeats[monitor_id]) > 100:
-                self.heartbeats[monitor_id] = self.heartbeats[monitor_id][-50:]
-    
+            self.heartbeats.append(self._monitor_key(data.get('monitorID')), data)
+
+        @self.sio.event
+        def heartbeatList(monitor_id, data, overwrite=False):
+            ordered = sorted(data or [], key=lambda hb: hb.get("time") or "")
+            self.heartbeats.extend(self._monitor_key(monitor_id), ordered, overwrite=overwrite)
+
+        @self.sio.event
+        def uptime(monitor_id, period, percentage):
+            self.uptime.setdefault(self._monitor_key(monitor_id), {})[period] = percentage
+
+    @staticmethod
+    def _monitor_key(monitor_id: Any) -> Any:
+        try:
+            return int(monitor_id)
+        except (TypeError, ValueError):
+            return monitor_id
+
+    def _record(self, event: str, started: float, outcome: str) -> None:
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            m = self.metrics.setdefault(
+                event, {"calls": 0, "errors": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+            )
+            m["calls"] += 1
+            if outcome == "timeout":
+                m["timeouts"] += 1
+            elif outcome == "error":
+                m["errors"] += 1
+            m["total_ms"] += elapsed
+            m["max_ms"] = max(m["max_ms"], elapsed)
+            m["last_ms"] = elapsed
+
+    def call(self, event: str, *args: Any, timeout: float = CALL_TIMEOUT) -> Any:
+        """emit с ack: ответ сервера или socketio.exceptions.TimeoutError."""
+        data = args[0] if len(args) == 1 else (tuple(args) if args else None)
+        started = time.perf_counter()
+        try:
+            response = self.sio.call(event, data, timeout=timeout)
+        except socketio.exceptions.TimeoutError:
+            self._record(event, started, "timeout")
+            raise
+        except Exception:
+            self._record(event, started, "error")
+            raise
+        ok = not isinstance(response, dict) or response.get("ok", True)
+        self._record(event, started, "ok" if ok else "error")
+        return response
+
+    def _wait_for(self, event: str, timeout: float = CALL_TIMEOUT) -> bool:
+        """Ждёт push-событие (без опроса); True сразу, если оно уже пришло."""
+        started = time.perf_counter()
+        received = self._received[event].wait(timeout)
+        self._record(event, started, "ok" if received else "timeout")
+        return received
+
+    def call_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Задержки запросов к Uptime Kuma по событиям (мс)."""
+        with self._metrics_lock:
+            return {
+                event: {
+                    "calls": int(m["calls"]),
+                    "errors": int(m["errors"]),
+                    "timeouts": int(m["timeouts"]),
+                    "avg_ms": round(m["total_ms"] / m["calls"], 2) if m["calls"] else None,
+                    "max_ms": round(m["max_ms"], 2),
+                    "last_ms": round(m["last_ms"], 2),
+                }
+                for event, m in self.metrics.items()
+            }
+
     def connect(self) -> bool:
         """Подключается к Uptime Kuma через Socket.io"""
-        try:
-            if not self.connected:
-                print(f"🔌 Подключаемся к {self.base_url}")
-                self.sio.connect(self.base_url)
-                
-                # Ждем подключения
-                timeout = 10
-                while not self.connected and timeout > 0:
-                    time.sleep(0.1)
-                    timeout -= 0.1
-                
+        with self._connect_lock:
+            if self.is_connected():
+                return True
+            try:
                 if not self.connected:
-                    print("❌ Таймаут подключения")
-                    return False
-                
+                    print(f"🔌 Подключаемся к {self.base_url}")
+                    started = time.perf_counter()
+                    # wait_timeout: connect() возвращается, как только namespace подключён
+                    self.sio.connect(self.base_url, wait_timeout=CONNECT_TIMEOUT)
+                    self._record("connect", started, "ok")
+
                 # Аутентификация - всегда используем логин/пароль
                 print("🔑 Аутентификация через логин/пароль...")
-                self.sio.emit('login', {
+                response = self.call('login', {
                     'username': self.username,
-                    'password': self.password
+                    'password': self.password,
+                    'token': '',
                 })
-                
-                # Ждем аутентификации
-                timeout = 30  # Увеличиваем таймаут до 30 секунд
-                while not self.authenticated and timeout > 0:
-                    time.sleep(0.5)
-                    timeout -= 0.5
-                    if timeout % 5 == 0:  # Каждые 5 секунд выводим статус
-                        print(f"⏳ Ожидание аутентификации... {timeout:.1f}s")
-                
-                if not self.authenticated:
-                    print("❌ Таймаут аутентификации")
+                if not response or not response.get("ok"):
+                    msg = (response or {}).get('msg', 'Неизвестная ошибка')
+                    print(f"❌ Ошибка аутентификации: {msg}")
                     return False
-                
-                # Запрашиваем данные
-                self.sio.emit('getMonitorList')
-                self.sio.emit('getNotificationList')
-                
+                print("✅ Успешная аутентификация в Uptime Kuma")
+                self.authenticated = True
                 return True
-            return True
-            
-        except Exception as e:
-            print(f"❌ Ошибка подключения: {str(e)}")
-            return False
-    
+
+            except socketio.exceptions.TimeoutError:
+                print("❌ Таймаут аутентификации")
+                return False
+            except Exception as e:
+                print(f"❌ Ошибка подключения: {str(e)}")
+                return False
+
     def disconnect(self):
         """Отключается от Uptime Kuma"""
         if self.connected:
             self.sio.disconnect()
-    
+
     def get_monitors(self) -> Dict[str, Any]:
         """Получает список мониторов"""
-        if not self.connected or not self.authenticated:
+        if not self.is_connected():
             if not self.connect():
                 return {}
-        
-        # Запрашиваем обновленный список
-        self.sio.emit('getMonitorList')
-        time.sleep(1)  # Ждем получения данных
-        
+
+        # Ack getMonitorList приходит после события monitorList с обновлённым списком
+        try:
+            self.call('getMonitorList')
+        except socketio.exceptions.TimeoutError:
+            print("⚠️ Таймаут getMonitorList — возвращаем последний полученный список")
+
         return self.monitors
-    
+
     def get_monitor_by_id(self, monitor_id: int) -> Optional[Dict[str, Any]]:
         """Получает монитор по ID"""
         monitors = self.get_monitors()
         return monitors.get(str(monitor_id))
-    
+
     def get_monitor_heartbeats(self, monitor_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Получает heartbeat данные для монитора"""
-        if not self.connected or not self.authenticated:
+        if not self.is_connected():
             if not self.connect():
                 return []
-        
-        # Запрашиваем heartbeat данные
-        self.sio.emit('getHeartbeatList', {'monitorID': monitor_id, 'limit': limit})
-        time.sleep(1)  # Ждем получения данных
-        
-        return self.heartbeats.get(monitor_id, [])[-limit:]
-    
+
+        try:
+            response = self.call('getMonitorBeats', monitor_id, BEATS_PERIOD_HOURS)
+        except socketio.exceptions.TimeoutError:
+            response = None
+        if isinstance(response, dict) and response.get("ok"):
+            beats = response.get("data") or []
+            return sorted(beats, key=lambda hb: hb.get("time") or "")[-limit:]
+
+        # Старые версии Kuma без getMonitorBeats: heartbeat'ы из push-событий
+        return self.heartbeats.beats(self._monitor_key(monitor_id), limit)
+
     def get_notifications(self) -> List[Dict[str, Any]]:
         """Получает список уведомлений"""
-        if not self.connected or not self.authenticated:
+        if not self.is_connected():
             if not self.connect():
                 return []
-        
-        # Запрашиваем обновленный список
-        self.sio.emit('getNotificationList')
-        time.sleep(1)  # Ждем получения данных
-        
+
+        # notificationList Kuma присылает после логина и при изменениях
+        self._wait_for('notificationList')
+
         return list(self.notifications.values()) if isinstance(self.notifications, dict) else self.notifications
-    
+
     def get_uptime_stats(self, monitor_id: int) -> Dict[str, Any]:
         """Получает статистику uptime для монитора"""
-        if not self.connected or not self.authenticated:
-            if not self.connect():
-                return {}
-        
-        # Запрашиваем статистику uptime
-        self.sio.emit('getUptime', {'monitorID': monitor_id})
-        time.sleep(1)  # Ждем получения данных
-        
-        # Возвращаем базовую статистику
         heartbeats = self.get_monitor_heartbeats(monitor_id, 100)
         if not heartbeats:
             return {}
-        
+
         total_heartbeats = len(heartbeats)
         up_count = sum(1 for hb in heartbeats if hb.get('status') == 1)
         uptime_percentage = (up_count / total_heartbeats * 100) if total_heartbeats > 0 else 0
-        
-        return {
+
+        stats = {
             'total_heartbeats': total_heartbeats,
             'up_count': up_count,
             'down_count': total_heartbeats - up_count,
             'uptime_percentage': round(uptime_percentage, 2)
         }
-    
+        # Uptime за 24 ч / 30 дней, посчитанный самой Kuma (push-событие uptime)
+        from .uptime_kuma_snapshot import period_label
+
+        for period, percentage in self.uptime.get(self._monitor_key(monitor_id), {}).items():
+            label = period_label(period)
+            if label is not None:
+                stats[f'uptime_{label}'] = round(percentage * 100, 2)
+        return stats
+
+    def dashboard_snapshot(self, recent: int = 5) -> Dict[str, Any]:
+        """
+        Дашборд по всем мониторам за один запрос: heartbeat'ы и uptime всех
+        мониторов Kuma присылает подпиской (после логина и по мере поступления),
+        статистика считается одним проходом numpy.
+        """
+        from .uptime_kuma_snapshot import build_snapshot
+
+        monitors = self.get_monitors()
+        if not self._received["notificationList"].is_set():
+            self._wait_for('notificationList')
+        notifications = (
+            list(self.notifications.values()) if isinstance(self.notifications, dict) else list(self.notifications)
+        )
+        return build_snapshot(
+            monitors,
+            self.heartbeats,
+            dict(self.uptime),
+            notifications,
+            recent=recent,
+            connected=self.is_connected(),
+        )
+
     def is_connected(self) -> bool:
         """Проверяет статус подключения"""
         return self.connected and self.authenticated
@@ -200,8 +296,16 @@ class UptimeKumaSocketIO:
 # Глобальный экземпляр клиента
 _uptime_kuma_client = None
 
-def get_uptime_kuma_client() -> UptimeKumaSocketIO:
-    """Получает глобальный экземпляр клиента Uptime Kuma"""
+def get_uptime_kuma_client():
+    """
+    Клиент Uptime Kuma для чтения: постоянный LiveUptimeKuma (данные из памяти),
+    если он запущен приложением, иначе глобальный sync-клиент с запросами.
+    """
+    from .uptime_kuma_live import get_synced_client
+
+    live = get_synced_client()
+    if live is not None:
+        return live
     global _uptime_kuma_client
     if _uptime_kuma_client is None:
         _uptime_kuma_client = UptimeKumaSocketIO()
@@ -209,35 +313,43 @@ def get_uptime_kuma_client() -> UptimeKumaSocketIO:
 
 def test_uptime_kuma_socketio() -> Dict[str, Any]:
     """Тестирует подключение к Uptime Kuma через Socket.io"""
-    client = get_uptime_kuma_client()
-    
+    from .uptime_kuma_live import get_live_client
+
+    # Отдельное соединение: тест не должен отключать общие клиенты
+    client = UptimeKumaSocketIO()
+
     result = {
         "connected": False,
         "authenticated": False,
         "monitors_count": 0,
         "notifications_count": 0,
+        "url": client.base_url,
         "error": None
     }
-    
+    live = get_live_client()
+    if live is not None:
+        result["live"] = live.status()
+
     try:
         if client.connect():
             result["connected"] = True
             result["authenticated"] = client.authenticated
-            
+
             monitors = client.get_monitors()
             if monitors:
                 result["monitors_count"] = len(monitors)
-            
+
             notifications = client.get_notifications()
             if notifications:
                 result["notifications_count"] = len(notifications)
-            
-            # Отключаемся после теста
-            client.disconnect()
-            
+
+            result["latency_ms"] = client.call_metrics()
+
     except Exception as e:
         result["error"] = str(e)
-    
+    finally:
+        client.disconnect()
+
     return result
 
 if __name__ == "__main__":
@@ -213,7 +213,7 @@ def test_uptime_kuma_socketio_connection() -> str:
 🔑 **Аутентификация**: {auth_status}
 📈 **Мониторы**: {monitors_info}
 🔔 **Уведомления**: {notifications_info}
-🌐 **URL**: {client.base_url if 'client' in locals() else 'Не определен'}
+🌐 **URL**: {result.get('url', 'Не определен')}
 """
         
         if result["error"]:
@@ -236,33 +236,8 @@ def get_monitoring_dashboard_data() -> str:
     try:
         client = get_uptime_kuma_client()
         
-        # Получаем все данные
-        monitors = client.get_monitors()
-        notifications = client.get_notifications()
-        
-        dashboard_data = {
-            "summary": {
-                "total_monitors": len(monitors),
-                "total_notifications": len(notifications),
-                "connection_status": client.is_connected()
-            },
-            "monitors": [],
-            "notifications": notifications
-        }
-        
-        # Обрабатываем каждый монитор
-        for monitor_id, monitor_data in monitors.items():
-            monitor_info = {
-                "id": monitor_id,
-                "name": monitor_data.get("name", "Unknown"),
-                "type": monitor_data.get("type", "Unknown"),
-                "url": monitor_data.get("url", "N/A"),
-                "active": monitor_data.get("active", False),
-                "tags": monitor_data.get("tags", []),
-                "recent_heartbeats": client.get_monitor_heartbeats(int(monitor_id), 5),
-                "uptime_stats": client.get_uptime_stats(int(monitor_id))
-            }
-            dashboard_data["monitors"].append(monitor_info)
+        # Все мониторы, heartbeat'ы и uptime — одним снимком, без запроса на монитор
+        dashboard_data = client.dashboard_snapshot(recent=5)
         
         return json.dumps(dashboard_data, indent=2, ensure_ascii=False)
         
@@ -91,6 +91,90 @@ def test_uptime_kuma_api() -> str:
     except Exception as e:
         return f"❌ Ошибка при тестировании API: {str(e)}"
 
+@tool
+def get_uptime_kuma_history(monitor_name: str, metric: str = "response_time_ms", hours: float = 1.0) -> str:
+    """
+    История метрики монитора из встроенного TSDB (снимки /metrics раз в минуту).
+    Показывает, деградировал ли сервис до инцидента.
+    
+    Args:
+        monitor_name: Имя монитора в Uptime Kuma
+        metric: response_time_ms или status
+        hours: Окно в часах (до 8760)
+    
+    Returns:
+        str: JSON с точками [ts, значение] и перцентилями p50/p95/p99
+    """
+    try:
+        from .tsdb import history
+
+        result = history(monitor_name, metric=metric, hours=hours)
+        if not result["points"]:
+            return f"❌ Нет истории {metric} для монитора {monitor_name}"
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        return f"❌ Ошибка при чтении истории: {str(e)}"
+
+@tool
+def get_uptime_kuma_slo(monitor_name: str = "") -> str:
+    """
+    SLO мониторов по истории heartbeat'ов: доступность за 1h/24h/7d/30d,
+    p50/p95/p99 времени ответа, остаток error budget за 30 дней и burn rate
+    с алертами (page/ticket). Нужен UPTIME_KUMA_PASSWORD (постоянное подключение).
+    
+    Args:
+        monitor_name: Имя монитора; пусто — все мониторы
+    
+    Returns:
+        str: JSON по мониторам
+    """
+    try:
+        from .slo import slo_report
+
+        report = slo_report(monitor_name or None)
+        if not report["monitors"]:
+            return "❌ Нет истории heartbeat'ов (постоянное подключение к Kuma не настроено или ещё не накопилось)"
+        monitors = [
+            {
+                "name": m["name"],
+                "target": m["target"],
+                "availability": m["availability"],
+                "latency_ms_24h": m["latency_ms"]["24h"],
+                "error_budget_remaining_pct": m["error_budget"]["remaining_pct"],
+                "burn_rate": {k: m["burn_rate"][k] for k in ("1h", "6h", "24h", "3d")},
+                "alerts": [f"{a['severity']}: {a['long']}/{a['short']} ≥ {a['threshold']}" for a in m["alerts"]],
+            }
+            for m in report["monitors"]
+        ]
+        return json.dumps(monitors, ensure_ascii=False)
+    except Exception as e:
+        return f"❌ Ошибка при расчёте SLO: {str(e)}"
+
+@tool
+def get_uptime_kuma_heartbeats(monitor_name: str, hours: float = 24.0, limit: int = 50) -> str:
+    """
+    Heartbeat'ы монитора напрямую из базы Uptime Kuma (kuma.db, только чтение):
+    сводка за окно (доступность, ping), последние смены статуса за 30 дней и
+    последние heartbeat'ы с сообщениями. Учётные данные не нужны.
+    
+    Args:
+        monitor_name: Имя монитора в Uptime Kuma
+        hours: Окно в часах
+        limit: Сколько последних heartbeat'ов вернуть (до 500)
+    
+    Returns:
+        str: JSON с monitor, summary, important, heartbeats
+    """
+    try:
+        from .kuma_db import monitor_report
+
+        report = monitor_report(monitor_name, hours=hours, limit=max(1, min(limit, 500)))
+        if report is None:
+            return f"❌ kuma.db недоступна (KUMA_DB_PATH) или нет монитора {monitor_name}"
+        return json.dumps(report, ensure_ascii=False)
+    except Exception as e:
+        return f"❌ Ошибка при чтении kuma.db: {str(e)}"
+
 # Удалены неработающие инструменты:
 # - get_monitor_badge (требует веб-аутентификации)
 # - get_monitor_heartbeat (требует веб-аутентификации)
@@ -104,5 +188,8 @@ def test_uptime_kuma_api() -> str:
 UPTIME_KUMA_TOOLS = [
     get_uptime_kuma_monitors,
     get_uptime_kuma_metrics,
+    get_uptime_kuma_history,
+    get_uptime_kuma_slo,
+    get_uptime_kuma_heartbeats,
     test_uptime_kuma_api
 ]
@@ -1,21 +1,34 @@
 """
 Homelab Incident Service — вебхуки Uptime Kuma, GitHub (опционально), health API.
 Чат-интерфейс удалён; анализ падений — через Cursor CLI.
+
+Импорт модуля лёгкий: миграция БД и прогрев тяжёлых модулей (RAG, requests,
+эмбеддинги) идут фоновой задачей lifespan — вебхуки принимаются сразу после
+старта uvicorn, готовность всего остального — /api/ready.
 """
 
 import os
 import hmac
+import time
+import asyncio
 import hashlib
-from datetime import datetime
+import importlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from typing import Any, Dict, Optional
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sqlmodel import SQLModel, create_engine, Session, select
+from sqlmodel import select
 
 from webhook_uptime import router as uptime_webhook_router
 from agent.cursor_incident import check_cursor_cli_available
+from agent.export import EXPORT_FORMATS, iter_logdoc_export
+from agent.embeddings import embedding_status, warm_up as warm_up_embeddings
+from agent.incidents import incident_statistics, monitor_stats, window_counters
+from db import async_session, get_async_engine, get_engine, migrate_schema
 from models import LogDoc
 
 DB_TYPE = os.environ.get("DB_TYPE", "postgres")
@@ -28,26 +41,112 @@ if DB_TYPE == "postgres":
 else:
     DB_PATH = os.environ.get("AGENT_DB", "sqlite:///./agent.db")
 
-if DB_TYPE == "postgres":
-    engine = create_engine(DB_PATH)
-else:
-    engine = create_engine(DB_PATH, connect_args={"check_same_thread": False})
+# Модули, которые обработчики импортируют лениво; прогреваются после миграции
+WARM_MODULES = ("requests", "agent.rag", "agent.retrieval", "agent.retention")
 
+# Выставляются фоновой задачей _initialize(); до этого эндпоинты БД отвечают 503
 db_ready = False
 db_init_error: Optional[str] = None
-try:
-    SQLModel.metadata.create_all(engine)
-    with Session(engine) as _session:
-        _session.exec(select(LogDoc).limit(1)).first()
-    db_ready = True
-except Exception as e:
-    db_init_error = str(e)
-    print(
-        f"⚠️ PostgreSQL недоступна — вебхуки Uptime Kuma работают, логи в БД нет: {e}",
-        flush=True,
-    )
+startup_ready = False
+startup_timings: Dict[str, Any] = {}
+_IMPORTED_AT = time.perf_counter()
+
+
+def _migrate() -> None:
+    global db_ready, db_init_error
+    # Sync engine — миграция при старте и синхронные инструменты агента; обработчики и
+    # фоновые задачи — async_session()
+    try:
+        migrate_schema(get_engine())
+        db_ready = True
+    except Exception as e:
+        db_init_error = str(e)
+        print(
+            f"⚠️ PostgreSQL недоступна — вебхуки Uptime Kuma работают, логи в БД нет: {e}",
+            flush=True,
+        )
+
+
+def _warm_imports() -> None:
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"⚠️ Прогрев {name}: {e}", flush=True)
+
+
+async def _initialize(tasks: list) -> None:
+    """Миграция БД, прогрев модулей, фоновые задачи; затем startup_ready."""
+    global startup_ready
+    t0 = time.perf_counter()
+    await asyncio.to_thread(_migrate)
+    startup_timings["db_s"] = round(time.perf_counter() - t0, 3)
+
+    t1 = time.perf_counter()
+    await asyncio.to_thread(_warm_imports)
+    startup_timings["imports_s"] = round(time.perf_counter() - t1, 3)
+
+    # Модель эмбеддингов грузится один раз в фоне — первый инцидент её уже не ждёт
+    tasks.append(asyncio.create_task(asyncio.to_thread(warm_up_embeddings)))
+    if db_ready:
+        # BM25 гибридного поиска — полный скан LogDoc здесь, а не в бюджете первого запроса
+        from agent.retrieval import build_bm25_index
+
+        tasks.append(asyncio.create_task(build_bm25_index()))
+        from agent.retention import retention_loop
+
+        tasks.append(asyncio.create_task(retention_loop()))
+    # История /metrics Uptime Kuma во встроенном TSDB
+    from agent.tsdb import scrape_loop
+
+    tasks.append(asyncio.create_task(scrape_loop()))
+    # Постоянное подключение к Uptime Kuma: метаданные мониторов — из памяти
+    from agent.uptime_kuma_live import UPTIME_KUMA_LIVE, start_live_client
+
+    if UPTIME_KUMA_LIVE:
+        # История heartbeat'ов для SLO читается с диска до первых push-событий
+        from agent.slo import get_history, save_loop
+
+        await asyncio.to_thread(get_history)
+        tasks.append(asyncio.create_task(save_loop()))
+    # Окна обслуживания Kuma (kuma.db) — индекс для подавления алертов
+    from agent.maintenance import maintenance_loop
+
+    tasks.append(asyncio.create_task(maintenance_loop()))
+    # Флаппинг: сводный анализ, когда монитор стабилизировался
+    from agent.flapping import flap_loop
+    from webhook_uptime import run_flap_summary
+
+    tasks.append(asyncio.create_task(flap_loop(run_flap_summary)))
+    kuma_task = start_live_client()
+    if kuma_task is not None:
+        tasks.append(kuma_task)
+    startup_timings["ready_s"] = round(time.perf_counter() - _IMPORTED_AT, 3)
+    startup_ready = True
+    print(f"✅ Агент готов за {startup_timings['ready_s']} с от импорта app", flush=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks: list = []
+    tasks.append(asyncio.create_task(_initialize(tasks)))
+    yield
+    from agent.uptime_kuma_live import stop_live_client
+
+    await stop_live_client()
+    for task in tasks:
+        task.cancel()
+    from agent.tsdb import loaded_tsdb
+
+    if loaded_tsdb() is not None:
+        loaded_tsdb().flush()
+    from agent.slo import save_history
 
-app = FastAPI(title="Homelab Incident Service")
+    save_history()
+    await get_async_engine().dispose()
+
+
+app = FastAPI(title="Homelab Incident Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -59,12 +158,22 @@ app.add_middleware(
 app.include_router(uptime_webhook_router, prefix="/api", tags=["webhooks"])
 
 
+@app.middleware("http")
+async def first_request_timer(request: Request, call_next):
+    response = await call_next(request)
+    if "first_request_s" not in startup_timings:
+        startup_timings["first_request_s"] = round(time.perf_counter() - _IMPORTED_AT, 3)
+    return response
+
+
 @app.get("/")
 def root():
     return {
         "service": "homelab-incident-service",
         "endpoints": {
             "health": "/api/health",
+            "ready": "/api/ready",
+            "search": "/api/search",
             "uptime_webhook": "/api/webhook/uptime-kuma",
             "uptime_webhook_health": "/api/webhook/uptime-kuma/health",
             "test_cursor": "/api/webhook/uptime-kuma/test-cursor",
@@ -73,13 +182,26 @@ def root():
     }
 
 
+def _kuma_live_status() -> Optional[Dict[str, Any]]:
+    from agent.uptime_kuma_live import get_live_client
+
+    live = get_live_client()
+    return live.status() if live is not None else None
+
+
+def _kuma_db_status() -> Optional[Dict[str, Any]]:
+    from agent.kuma_db import kuma_db_status
+
+    return kuma_db_status()
+
+
 @app.get("/api/health")
-def health_check():
-    cursor = check_cursor_cli_available()
+async def health_check():
+    cursor = await asyncio.to_thread(check_cursor_cli_available)
     db_error = None
     try:
-        with Session(engine) as session:
-            session.exec(select(LogDoc).limit(1)).first()
+        async with async_session() as session:
+            (await session.exec(select(LogDoc.id).limit(1))).first()
         db_ok = True
     except Exception as e:
         db_ok = False
@@ -92,7 +214,11 @@ def health_check():
         "status": "healthy" if healthy else "degraded",
         "database": "connected" if db_ok else ("unavailable" if not db_ready else "error"),
         "database_init_error": db_init_error,
+        "ready": startup_ready,
         "cursor_incidents_dir": os.environ.get("CURSOR_INCIDENTS_DIR", "/app/logs/incidents"),
+        "embeddings": embedding_status(),
+        "uptime_kuma_live": _kuma_live_status(),
+        "kuma_db": _kuma_db_status(),
         "timestamp": datetime.now().isoformat(),
         **cursor,
     }
@@ -101,29 +227,240 @@ def health_check():
     return payload
 
 
+@app.get("/api/ready")
+def readiness(response: Response):
+    """503, пока идёт миграция БД и прогрев модулей (секунды от импорта app)."""
+    if not startup_ready:
+        response.status_code = 503
+    return {
+        "ready": startup_ready,
+        "database": "connected" if db_ready else ("starting" if not startup_ready else "unavailable"),
+        "database_init_error": db_init_error,
+        "timings": startup_timings,
+    }
+
+
 @app.get("/api/logs")
-def get_logs(kind: Optional[str] = None, limit: int = 100):
+async def get_logs(
+    response: Response,
+    kind: Optional[str] = None,
+    source: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = 100,
+):
+    """
+    Последние записи LogDoc (новые первыми). Следующая страница —
+    ?before_id=<X-Next-Before-Id>: keyset по id, без OFFSET.
+    """
     if not db_ready:
         raise HTTPException(
             status_code=503,
             detail=db_init_error or "Database unavailable",
         )
-    with Session(engine) as session:
+    limit = max(1, min(limit, 1000))
+    async with async_session() as session:
         query = select(LogDoc)
         if kind:
             query = query.where(LogDoc.kind == kind)
+        if source:
+            query = query.where(LogDoc.source == source)
+        if before_id is not None:
+            query = query.where(LogDoc.id < before_id)
         query = query.order_by(LogDoc.id.desc()).limit(limit)
-        logs = session.exec(query).all()
-        return [
-            {
-                "id": log.id,
-                "kind": log.kind,
-                "source": log.source,
-                "content": log.content[:500] if log.content else "",
-                "timestamp": log.timestamp,
-            }
-            for log in logs
-        ]
+        logs = (await session.exec(query)).all()
+    if len(logs) == limit:
+        response.headers["X-Next-Before-Id"] = str(logs[-1].id)
+    return [
+        {
+            "id": log.id,
+            "kind": log.kind,
+            "source": log.source,
+            "content": log.content[:500] if log.content else "",
+            "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        }
+        for log in logs
+    ]
+
+
+@app.get("/api/logs/export")
+async def export_logs(
+    format: str = "ndjson",
+    kind: Optional[str] = None,
+    source: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+):
+    """Полная выгрузка LogDoc потоком (NDJSON или CSV, без обрезки content)."""
+    if not db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=db_init_error or "Database unavailable",
+        )
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format: {', '.join(EXPORT_FORMATS)}")
+    filename = f"logdoc_{datetime.now():%Y%m%d_%H%M%S}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_logdoc_export(get_async_engine(), format, kind, source, since, until, gzip=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/incidents/stats")
+async def get_incident_stats(
+    days: int = 7,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    monitor_name: Optional[str] = None,
+):
+    """Агрегаты по таблице Incident: по мониторам, типам, доля восстановлений."""
+    if not db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=db_init_error or "Database unavailable",
+        )
+    if since is None and until is None:
+        since = datetime.now().astimezone() - timedelta(days=days)
+    async with async_session() as session:
+        return await session.run_sync(incident_statistics, since, until, monitor_name)
+
+
+@app.get("/api/incidents/monitors")
+async def get_monitor_stats(monitor_name: Optional[str] = None):
+    """MTTR, суммарный простой и p95 длительности по мониторам (накопительно)."""
+    if not db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=db_init_error or "Database unavailable",
+        )
+    async with async_session() as session:
+        return await session.run_sync(monitor_stats, monitor_name)
+
+
+@app.get("/api/stats")
+async def get_stats(
+    days: int = 7,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    monitor_name: Optional[str] = None,
+):
+    """Счётчики событий по мониторам за окно — сумма часовых корзин MonitorHourly."""
+    if not db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=db_init_error or "Database unavailable",
+        )
+    until = until or datetime.now().astimezone()
+    since = since or until - timedelta(days=days)
+    async with async_session() as session:
+        return await session.run_sync(window_counters, since, until, monitor_name)
+
+
+@app.get("/api/metrics/history")
+def get_metrics_history(
+    monitor_name: str,
+    metric: str = "response_time_ms",
+    hours: float = 1.0,
+    bucket: Optional[float] = None,
+    agg: str = "mean",
+):
+    """История метрики монитора из TSDB (прореживание по корзинам bucket секунд)."""
+    from agent.tsdb import AGGREGATIONS, history
+
+    if agg not in AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"agg: одно из {', '.join(AGGREGATIONS)}")
+    return history(monitor_name, metric=metric, hours=hours, bucket=bucket, agg=agg)
+
+
+@app.get("/api/slo")
+def get_slo(monitor_name: Optional[str] = None):
+    """Доступность 1h/24h/7d/30d, перцентили ping, error budget и burn rate по мониторам."""
+    from agent.slo import slo_report
+
+    return slo_report(monitor_name)
+
+
+@app.get("/api/flapping")
+def get_flapping():
+    """Флаппинг мониторов: взвешенный процент смен за окно, подавленные смены."""
+    from agent.flapping import flap_status
+
+    return flap_status()
+
+
+@app.get("/api/kuma/monitor")
+def get_kuma_monitor(monitor_name: str, hours: float = 24, limit: int = 100):
+    """Монитор, сводка, heartbeat'ы и смены статуса напрямую из kuma.db (только чтение)."""
+    from agent.kuma_db import monitor_report
+
+    report = monitor_report(monitor_name, hours=hours, limit=min(limit, 5000))
+    if report is None:
+        raise HTTPException(status_code=404, detail="kuma.db недоступна (KUMA_DB_PATH) или монитор не найден")
+    return report
+
+
+@app.get("/api/kuma/maintenance")
+def get_kuma_maintenance():
+    """Окна обслуживания из kuma.db: развёрнутые интервалы по мониторам, активные сейчас."""
+    from agent.maintenance import maintenance_status
+
+    return maintenance_status()
+
+
+@app.get("/api/degradation")
+def get_degradation():
+    """Ранний детектор деградации: базовая линия ping, z, доля отказов, собранные улики."""
+    from agent.degradation import degradation_status
+
+    return degradation_status()
+
+
+@app.get("/api/search")
+async def search_incidents(
+    q: str,
+    monitor_name: Optional[str] = None,
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    days: Optional[int] = None,
+    k: int = 5,
+    budget_ms: Optional[float] = None,
+):
+    """Гибридный поиск (BM25 + векторы, RRF) по истории с фильтрами."""
+    from agent.retrieval import hybrid_search_async
+
+    filters: Dict[str, Any] = {
+        "monitor_name": monitor_name,
+        "status": status,
+        "kind": kind,
+    }
+    if days:
+        filters["since"] = datetime.now() - timedelta(days=days)
+    kwargs: Dict[str, Any] = {"k": k, "filters": filters}
+    if budget_ms:
+        kwargs["budget_ms"] = budget_ms
+    return await hybrid_search_async(q, **kwargs)
+
+
+@app.get("/api/maintenance/retention")
+def get_retention_report():
+    """Последний отчёт retention/компакции."""
+    from agent.retention import last_report
+
+    return {"last_report": last_report()}
+
+
+@app.post("/api/maintenance/compact")
+async def compact_history(dry_run: bool = False):
+    """Внеочередной проход retention (dry_run — только посчитать)."""
+    if not db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=db_init_error or "Database unavailable",
+        )
+    from agent.retention import run_compaction
+
+    return await run_compaction(dry_run=dry_run)
 
 
 @app.get("/api/services")
@@ -194,14 +531,14 @@ async def github_webhook(request: Request, payload: GitHubWebhookPayload):
     session_id = f"github_pr_{owner}_{repo_name}_{pr_number}"
 
     if db_ready:
-        with Session(engine) as session:
+        async with async_session() as session:
             log_doc = LogDoc(
                 kind="webhook",
                 source=session_id,
                 content=f"GitHub PR #{pr_number} {payload.action} — чат-агент отключён",
             )
             session.add(log_doc)
-            session.commit()
+            await session.commit()
 
     return {
         "status": "logged",
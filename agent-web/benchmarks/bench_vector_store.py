@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк векторных хранилищ RAG: встроенный Chroma против pgvector в agent-db.
+
+Оба хранилища получают одни и те же эмбеддинги (модель считается один раз),
+так что сравнивается именно запись и поиск, а не энкодер.
+
+Запуск в контейнере агента:
+    docker compose exec agent python benchmarks/bench_vector_store.py --docs 5000
+
+pgvector проверяется, только если AGENT_DB указывает на PostgreSQL; пишется
+во временную таблицу rag_vectors_bench, которая удаляется после прогона.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from db import get_engine, is_postgres  # noqa: E402
+from agent.rag import ChromaVectorStore, PgVectorStore, embed  # noqa: E402
+
+MONITORS = ["jellyfin", "immich", "vaultwarden", "torrserver", "homeassistant", "caddy"]
+MESSAGES = [
+    "Connection timeout",
+    "connect ECONNREFUSED",
+    "Request failed with status code 502",
+    "getaddrinfo ENOTFOUND",
+    "certificate has expired",
+]
+
+
+def make_corpus(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    start = datetime.now() - timedelta(days=90)
+    docs, metas = [], []
+    for i in range(n):
+        monitor = rnd.choice(MONITORS)
+        status = rnd.choice(["down", "down", "up"])
+        ts = start + timedelta(minutes=rnd.randint(0, 90 * 24 * 60))
+        docs.append(
+            f"ИНЦИДЕНТ UPTIME KUMA:\nМонитор: {monitor}\nСтатус: {status}\n"
+            f"Сообщение: {rnd.choice(MESSAGES)}\nКонтейнер: {monitor} #{i}"
+        )
+        metas.append({
+            "source": "uptime_kuma_webhook",
+            "kind": "incident_analysis",
+            "monitor_name": monitor,
+            "status": status,
+            "timestamp": ts.isoformat(),
+        })
+    return docs, metas
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def bench_store(store, docs, metas, embeddings, queries, k, batch):
+    ids = [f"bench_{i}" for i in range(len(docs))]
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), batch):
+        store.add(
+            ids[i:i + batch], docs[i:i + batch], metas[i:i + batch],
+            embeddings=embeddings[i:i + batch],
+        )
+    ingest_s = time.perf_counter() - t0
+
+    result = {"ingest_docs_per_s": round(len(docs) / ingest_s, 1)}
+    since = datetime.now() - timedelta(days=30)
+    for label, filters in (
+        ("unfiltered", None),
+        ("monitor_status", {"monitor_name": "vaultwarden", "status": "down"}),
+        ("monitor_status_30d", {"monitor_name": "vaultwarden", "status": "down", "since": since}),
+    ):
+        latencies = []
+        for q, emb in queries:
+            t0 = time.perf_counter()
+            store.query(q, k=k, filters=filters, embedding=emb)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        result[label] = {
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    docs, metas = make_corpus(args.docs)
+    t0 = time.perf_counter()
+    embeddings = embed(docs)
+    embed_s = time.perf_counter() - t0
+    query_texts = [docs[i] for i in random.Random(7).sample(range(len(docs)), args.queries)]
+    queries = list(zip(query_texts, embed(query_texts)))
+
+    results = {
+        "docs": args.docs,
+        "queries": args.queries,
+        "k": args.k,
+        "embed_docs_per_s": round(args.docs / embed_s, 1),
+    }
+
+    tmp_dir = tempfile.mkdtemp(prefix="chroma_bench_")
+    try:
+        chroma = ChromaVectorStore(path=tmp_dir, collection="bench")
+        results["chroma"] = bench_store(chroma, docs, metas, embeddings, queries, args.k, args.batch)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    engine = get_engine()
+    if is_postgres(engine):
+        store = PgVectorStore(engine, table="rag_vectors_bench")
+        try:
+            store.ensure_schema()
+            results["pgvector"] = bench_store(store, docs, metas, embeddings, queries, args.k, args.batch)
+        finally:
+            with engine.begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS rag_vectors_bench"))
+    else:
+        results["pgvector"] = "skipped: AGENT_DB не PostgreSQL"
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
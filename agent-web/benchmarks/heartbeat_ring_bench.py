@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кольцевых буферов heartbeat'ов (agent/heartbeat_ring.py).
+
+Заполняет --monitors мониторов по --kept heartbeat'ов в формате Kuma двумя
+способами — deque словарей (как было в KumaView) и HeartbeatStore — и сравнивает
+занятую память (tracemalloc), скорость записи, окна последних 50 heartbeat'ов
+и статистики uptime. Каждый прогон дописывается строкой в
+data/benchmarks/heartbeat_ring_bench.jsonl.
+
+Запуск:
+    docker compose exec agent python benchmarks/heartbeat_ring_bench.py --monitors 200
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.heartbeat_ring import HeartbeatStore  # noqa: E402
+
+MESSAGES = ("200 - OK", "200 - OK", "200 - OK", "timeout of 48000ms exceeded", "connect ECONNREFUSED")
+
+
+def make_beat(mid: int, i: int) -> dict:
+    # Строки собираются заново, как после json.loads из socket.io
+    at = datetime.fromtimestamp(1.7e9 + i * 60, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    msg = MESSAGES[(mid + i) % len(MESSAGES)]
+    return {
+        "monitorID": mid,
+        "status": 0 if msg != "200 - OK" else 1,
+        "time": at,
+        "msg": "".join(msg),
+        "ping": 20 + (i * 7) % 50,
+        "important": i % 40 == 0,
+        "duration": 60,
+        "localDateTime": at,
+        "timezone": "UTC",
+        "timezoneOffset": "+00:00",
+        "retries": 0,
+        "downCount": 0,
+    }
+
+
+def traced(fn):
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return round(statistics.median(timings), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--monitors", type=int, default=200)
+    parser.add_argument("--kept", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--output", default="./data/benchmarks/heartbeat_ring_bench.jsonl")
+    args = parser.parse_args()
+
+    total = args.monitors * args.kept
+    beats = [[make_beat(mid, i) for i in range(args.kept)] for mid in range(args.monitors)]
+
+    def fill_deques():
+        return {mid: deque((dict(b) for b in rows), maxlen=args.kept) for mid, rows in enumerate(beats)}
+
+    def fill_store():
+        store = HeartbeatStore(args.kept, rows=args.monitors)
+        for mid, rows in enumerate(beats):
+            for b in rows:
+                store.append(mid, dict(b))
+        return store
+
+    deques, deque_bytes = traced(fill_deques)
+    store, store_bytes = traced(fill_store)
+    t0 = time.perf_counter()
+    fill_store()
+    store_s = time.perf_counter() - t0
+    probe = args.monitors // 2
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "monitors": args.monitors,
+        "kept": args.kept,
+        "deque_mb": round(deque_bytes / 2**20, 2),
+        "ring_mb": round(store_bytes / 2**20, 2),
+        "ring_nbytes_mb": round(store.nbytes / 2**20, 2),
+        "memory_ratio": round(deque_bytes / max(store_bytes, 1), 1),
+        "messages": len(store.messages),
+        "append_per_s": round(total / store_s),
+        "deque_window50_us": timed(lambda: list(deques[probe])[-50:], args.runs),
+        "ring_window50_us": timed(lambda: store.window(probe, 50), args.runs),
+        "deque_stats_us": timed(lambda: sum(1 for hb in deques[probe] if hb.get("status") == 1), args.runs),
+        "ring_stats_us": timed(lambda: store.stats(probe), args.runs),
+        "ring_beats10_us": timed(lambda: store.beats(probe, 10), args.runs),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API агента: пропускная способность /api/logs и вебхука
+Uptime Kuma при N параллельных клиентах.
+
+Запуск против работающего агента:
+    docker compose exec agent python benchmarks/load_test.py --concurrency 50 --duration 20
+
+Сценарии (--scenarios):
+- logs     — GET /api/logs?limit=50 (чтение из БД)
+- export   — GET /api/logs/export?kind=... (поток, читается целиком)
+- webhook  — POST /api/webhook/uptime-kuma с тестовым сообщением (без БД и VPS)
+- webhook_up — POST с heartbeat status=up: запись в LogDoc/RAG и отправка
+  на VPS_WEBHOOK_URL. Запускайте только с VPS_WEBHOOK_URL на заглушку,
+  иначе каждое событие уйдёт в Telegram.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def make_request(scenario: str, i: int):
+    if scenario == "logs":
+        return "GET", "/api/logs", {"params": {"limit": 50}}
+    if scenario == "export":
+        return "GET", "/api/logs/export", {"params": {"kind": "incident_analysis"}}
+    if scenario == "webhook":
+        return "POST", "/api/webhook/uptime-kuma", {"json": {"msg": f"Testing load {i}"}}
+    if scenario == "webhook_up":
+        return "POST", "/api/webhook/uptime-kuma", {"json": {
+            "monitor": {"name": f"load-test-{i % 20}", "type": "http"},
+            "heartbeat": {"status": 1, "msg": "OK"},
+        }}
+    raise ValueError(scenario)
+
+
+async def run_scenario(base_url: str, scenario: str, concurrency: int, duration: float, timeout: float):
+    latencies = []
+    statuses = Counter()
+    counter = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal counter
+        while time.perf_counter() < deadline:
+            counter += 1
+            method, path, kwargs = make_request(scenario, counter)
+            t0 = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(n for code, n in statuses.items() if isinstance(code, int) and code < 400)
+    return {
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "rps": round(ok / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+async def main_async(args):
+    results = {
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "scenarios": {},
+    }
+    for scenario in args.scenarios.split(","):
+        scenario = scenario.strip()
+        results["scenarios"][scenario] = await run_scenario(
+            args.base_url, scenario, args.concurrency, args.duration, args.timeout,
+        )
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--scenarios", default="logs,webhook")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
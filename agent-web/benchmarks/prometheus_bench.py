@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк разбора /metrics Uptime Kuma на синтетическом ответе.
+
+Ответ повторяет формат prom-client в Kuma: семейства monitor_cert_days_remaining,
+monitor_cert_is_valid, monitor_response_time, monitor_status по --monitors
+мониторам (часть имён с экранированными кавычками и обратными слэшами, метки
+в разном порядке) плюс стандартные process_*/nodejs_* метрики с гистограммой.
+
+Измеряются медиана и минимум по --runs прогонам:
+- parse_families — все семейства;
+- monitors_from_text — только monitor_* в MonitorMetrics (как в UptimeKumaAPI),
+  установившийся режим: между прогонами меняется monitor_response_time, как
+  между опросами Kuma, остальные блоки и метки берутся из кэша с прошлого раза;
+- monitors_from_text_cold — то же с очищенными кэшами (первый опрос);
+- legacy — прежний разбор через line.find('monitor_name="'), только monitor_status
+  (для сравнения; на экранированных именах он ошибается — см. legacy_errors).
+
+Запуск:
+    docker compose exec agent python benchmarks/prometheus_bench.py --monitors 1000
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.prometheus import parse_families  # noqa: E402
+from agent import uptime_kuma_api  # noqa: E402
+from agent.uptime_kuma_api import monitors_from_text  # noqa: E402
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def make_payload(monitors: int, seed: int, scrape: int = 0) -> tuple:
+    """scrape — номер опроса: от него зависит только monitor_response_time."""
+    rnd = random.Random(seed)
+    latency = random.Random(seed * 1_000_003 + scrape)
+    names = []
+    for i in range(monitors):
+        name = f"service-{i}"
+        if i % 50 == 0:
+            name = f'svc "quoted" {i} \\ path'
+        names.append(name)
+
+    def labels(i: int) -> str:
+        pairs = [
+            ("monitor_name", names[i]),
+            ("monitor_type", "http" if i % 3 else "port"),
+            ("monitor_url", f"https://host-{i}.lan/health" if i % 3 else "https://"),
+            ("monitor_hostname", "null" if i % 3 else f"10.0.{i // 256}.{i % 256}"),
+            ("monitor_port", "null" if i % 3 else str(1000 + i)),
+        ]
+        if i % 7 == 0:
+            pairs.reverse()
+        return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+    lines = []
+    families = (
+        ("monitor_cert_days_remaining", "The number of days remaining until the certificate expires",
+         lambda i: str(rnd.randint(-5, 90))),
+        ("monitor_cert_is_valid", "Is the certificate still valid? (1 = Yes, 0= No)",
+         lambda i: str(rnd.randint(0, 1))),
+        ("monitor_response_time", "Monitor Response Time (ms)",
+         lambda i: str(latency.randint(1, 2000)) if i % 11 else "-1"),
+        ("monitor_status", "Monitor Status (1 = UP, 0= DOWN, 2= PENDING, 3= MAINTENANCE)",
+         lambda i: str(rnd.choice((0, 1, 1, 1, 2, 3)))),
+    )
+    for name, help_text, value in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{{{labels(i)}}} {value(i)}" for i in range(monitors))
+
+    lines += [
+        "# HELP process_cpu_user_seconds_total Total user CPU time spent in seconds.",
+        "# TYPE process_cpu_user_seconds_total counter",
+        "process_cpu_user_seconds_total 123.45",
+        "# HELP nodejs_eventloop_lag_seconds Lag of event loop in seconds.",
+        "# TYPE nodejs_eventloop_lag_seconds gauge",
+        "nodejs_eventloop_lag_seconds 0.0012",
+        "# HELP nodejs_gc_duration_seconds Garbage collection duration by kind.",
+        "# TYPE nodejs_gc_duration_seconds histogram",
+    ]
+    for kind in ("minor", "major", "incremental"):
+        for le in ("0.001", "0.01", "0.1", "1", "2", "5", "+Inf"):
+            lines.append(f'nodejs_gc_duration_seconds_bucket{{le="{le}",kind="{kind}"}} {rnd.randint(0, 999)}')
+        lines.append(f'nodejs_gc_duration_seconds_sum{{kind="{kind}"}} {rnd.random():.4f}')
+        lines.append(f'nodejs_gc_duration_seconds_count{{kind="{kind}"}} {rnd.randint(0, 999)}')
+    return "\n".join(lines) + "\n", names
+
+
+def legacy_parse(text: str) -> dict:
+    """Прежний UptimeKumaAPI.get_monitors (только monitor_status)."""
+    monitors = {}
+    for line in text.split('\n'):
+        if line.startswith('monitor_status{'):
+            try:
+                name_start = line.find('monitor_name="') + 14
+                name_end = line.find('"', name_start)
+                monitor_name = line[name_start:name_end]
+                type_start = line.find('monitor_type="') + 14
+                type_end = line.find('"', type_start)
+                url_start = line.find('monitor_url="') + 13
+                url_end = line.find('"', url_start)
+                status_start = line.rfind('} ') + 2
+                monitors[monitor_name] = {
+                    "name": monitor_name,
+                    "type": line[type_start:type_end],
+                    "url": line[url_start:url_end],
+                    "status": int(line[status_start:].strip()),
+                }
+            except (ValueError, IndexError):
+                continue
+    return monitors
+
+
+def bench(fn, runs: int) -> dict:
+    timings = []
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": round(statistics.median(timings), 2), "min_ms": round(min(timings), 2)}, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--monitors", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="./data/benchmarks/prometheus_bench.jsonl")
+    args = parser.parse_args()
+
+    text, names = make_payload(args.monitors, args.seed)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "monitors": args.monitors,
+        "payload_kb": round(len(text.encode()) / 1024, 1),
+        "lines": text.count("\n"),
+    }
+
+    results["parse_families"], families = bench(lambda: parse_families(text.splitlines()), args.runs)
+    results["legacy"], legacy = bench(lambda: legacy_parse(text), args.runs)
+
+    def cold():
+        uptime_kuma_api._label_cache = {}
+        uptime_kuma_api._family_cache.clear()
+        return monitors_from_text(text)
+
+    results["monitors_from_text_cold"], _ = bench(cold, args.runs)
+    # Соседние опросы отличаются временами отклика; статусы и сертификаты те же
+    scrapes = itertools.cycle([make_payload(args.monitors, args.seed, scrape)[0] for scrape in range(1, 11)])
+    results["monitors_from_text"], monitors = bench(lambda: monitors_from_text(next(scrapes)), args.runs)
+
+    results["families"] = len(families)
+    results["samples"] = sum(len(f.samples) for f in families.values())
+    results["parsed_monitors"] = len(monitors)
+    results["missing_monitors"] = sum(1 for name in names if name not in monitors)
+    results["legacy_errors"] = sum(1 for name in names if name not in legacy)
+    # < 1 — быстрый путь между опросами не медленнее прежнего разбора
+    results["warm_vs_legacy"] = round(results["monitors_from_text"]["min_ms"] / results["legacy"]["min_ms"], 2)
+    results["samples_per_s"] = round(results["samples"] / (results["parse_families"]["median_ms"] / 1000))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
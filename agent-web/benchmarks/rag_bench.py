@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк и оценка качества поиска RAG на синтетическом корпусе инцидентов.
+
+Корпус воспроизводим (--seed) и повторяет формат, который пишет
+uptime_kuma_webhook ("ИНЦИДЕНТ UPTIME KUMA: ..."): каждый down-инцидент
+относится к одному из типов отказа (FAILURE_MODES), что и служит разметкой.
+Запрос — ключевая фраза типа отказа (keyword) или её пересказ (paraphrase),
+иногда с фильтром по монитору и периоду; релевантны все инциденты этого типа,
+прошедшие фильтр. recall@k = найденные релевантные / min(k, всего релевантных).
+
+Измеряется:
+- скорость записи через rag.add_docs (LogDoc + векторы, как в вебхуке);
+- p50/p95/p99 задержки и recall@k для rag.query, rag.query_logs и
+  retrieval.hybrid_search;
+- для hybrid — как в проде: бюджет RETRIEVAL_BUDGET_MS (если не задан
+  --budget-ms), первый запрос на холодном процессе, пока BM25 строится в фоне
+  (hybrid_cold), и сколько раз стадии были обрезаны бюджетом или упали
+  (truncated_stages / stage_errors).
+
+Результат — одна JSON-строка, дописываемая в --output, для сравнения прогонов.
+
+Запуск:
+    docker compose exec agent python benchmarks/rag_bench.py --docs 10000
+    docker compose exec agent python benchmarks/rag_bench.py --docs 100000 --embedder hash
+
+По умолчанию всё пишется во временные SQLite + Chroma. Для pgvector нужна
+отдельная пустая PostgreSQL база (не рабочая agent-db):
+    python benchmarks/rag_bench.py --backend pgvector --db postgresql://.../rag_bench
+
+--embedder hash заменяет модель детерминированным хэшированием слов: так
+измеряется стоимость хранилищ и индексов без энкодера (recall при этом
+отражает только лексику).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+MONITORS = [
+    "jellyfin", "immich", "vaultwarden", "torrserver", "homeassistant", "caddy",
+    "nextcloud", "gitea", "grafana", "prometheus", "adguard", "paperless",
+]
+
+# key, сообщение Uptime Kuma, анализ, ключевая фраза (есть в каждом документе), пересказ
+FAILURE_MODES = [
+    ("refused", "connect ECONNREFUSED 172.18.0.{n}:{port}",
+     "Контейнер не принимает соединения на порту {port}: процесс упал или ещё не слушает.",
+     "ECONNREFUSED", "сервис отказывает в подключении, порт закрыт"),
+    ("timeout", "timeout of 48000ms exceeded",
+     "Сервис отвечает слишком долго: вероятно, высокая нагрузка на диск или CPU хоста.",
+     "timeout of 48000ms", "долгий ответ, превышено время ожидания запроса"),
+    ("dns", "getaddrinfo ENOTFOUND {monitor}.homelab",
+     "Имя хоста не резолвится: проверьте AdGuard и сеть homelab.",
+     "ENOTFOUND", "не удаётся разрешить имя хоста через dns"),
+    ("tls", "certificate has expired",
+     "Истёк TLS-сертификат: обновите сертификат в Caddy.",
+     "certificate has expired", "просрочен ssl сертификат https"),
+    ("bad_gateway", "Request failed with status code 502",
+     "Обратный прокси не достучался до бэкенда контейнера.",
+     "status code 502", "ошибка шлюза у reverse proxy"),
+    ("oom", "container exited with code 137 (OOMKilled)",
+     "Контейнер убит OOM killer: не хватает памяти, увеличьте лимит.",
+     "OOMKilled", "закончилась оперативная память, процесс убит"),
+    ("disk", "ENOSPC: no space left on device",
+     "Закончилось место на диске: очистите логи и неиспользуемые образы docker.",
+     "ENOSPC", "нет свободного места на диске"),
+    ("db_locked", "SQLITE_BUSY: database is locked",
+     "База данных сервиса заблокирована: долгие транзакции или параллельный бэкап.",
+     "database is locked", "база данных занята блокировкой"),
+    ("restart_loop", "Restarting (1) 12 seconds ago",
+     "Контейнер в цикле перезапуска: смотрите логи старта и healthcheck.",
+     "Restarting (1)", "контейнер постоянно перезапускается"),
+    ("unauthorized", "Request failed with status code 401",
+     "Сервис требует авторизацию: истёк токен или изменился пароль.",
+     "status code 401", "ошибка авторизации, токен не принят"),
+]
+
+NOISE_SHARE = 0.25
+SPAN_DAYS = 180
+NO_MODE = 255
+
+
+class HashEncoder:
+    """Детерминированный bag-of-words эмбеддинг (--embedder hash)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, texts):
+        vectors = []
+        for text in texts:
+            vec = [0.0] * self.dim
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                vec[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+            norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+            vectors.append([x / norm for x in vec])
+        return vectors
+
+
+class Corpus:
+    """Генератор документов пачками + компактная разметка (режим, монитор, время)."""
+
+    def __init__(self, n: int, seed: int, now: datetime):
+        self.n = n
+        self.rnd = random.Random(seed)
+        self.start = now - timedelta(days=SPAN_DAYS)
+        self.modes = array("B")
+        self.monitors = array("B")
+        self.ts = array("d")
+        self.log_ids = array("q")
+
+    def batches(self, size: int):
+        for offset in range(0, self.n, size):
+            docs, metas = [], []
+            for i in range(offset, min(self.n, offset + size)):
+                doc, meta, mode, monitor, ts = self._make(i)
+                docs.append(doc)
+                metas.append(meta)
+                self.modes.append(mode)
+                self.monitors.append(monitor)
+                self.ts.append(ts.timestamp())
+            yield docs, metas
+
+    def _make(self, i: int):
+        rnd = self.rnd
+        monitor_idx = rnd.randrange(len(MONITORS))
+        monitor = MONITORS[monitor_idx]
+        ts = self.start + timedelta(seconds=rnd.randrange(SPAN_DAYS * 86400))
+        meta = {
+            "source": "uptime_kuma_webhook",
+            "kind": "incident_analysis",
+            "monitor_name": monitor,
+            "timestamp": ts.isoformat(),
+        }
+        if rnd.random() < NOISE_SHARE:
+            meta.update(status="up", analysis_type="recovery")
+            doc = (
+                f"\nИНЦИДЕНТ UPTIME KUMA:\nМонитор: {monitor}\nСтатус: up\n"
+                f"Анализ (recovery): 🎉 **СЕРВИС ВОССТАНОВЛЕН: {monitor}**\n\n"
+                f"✅ Сервис снова доступен.\n⏰ {ts:%Y-%m-%d %H:%M:%S}...\nОтчёт: N/A\n"
+            )
+            return doc, meta, NO_MODE, monitor_idx, ts
+
+        mode_idx = rnd.randrange(len(FAILURE_MODES))
+        _, message, analysis, _, _ = FAILURE_MODES[mode_idx]
+        port = rnd.choice([80, 443, 8080, 8096, 2283, 3000, 9090])
+        fields = {"n": rnd.randrange(2, 250), "port": port, "monitor": monitor}
+        meta.update(status="down", analysis_type="cursor")
+        doc = (
+            f"\nИНЦИДЕНТ UPTIME KUMA:\nМонитор: {monitor}\nСтатус: down\n"
+            f"Анализ (cursor): Сообщение: {message.format(**fields)}. "
+            f"{analysis.format(**fields)} Инцидент #{i}...\n"
+            f"Отчёт: logs/incidents/{ts:%Y%m%d_%H%M%S}_{monitor}_down.md\n"
+        )
+        return doc, meta, mode_idx, monitor_idx, ts
+
+    def label_index(self):
+        """(режим, монитор) → [(log_id, ts)] для быстрого построения ground truth."""
+        index = {}
+        for mode, monitor, ts, log_id in zip(self.modes, self.monitors, self.ts, self.log_ids):
+            if mode != NO_MODE and log_id >= 0:
+                index.setdefault((mode, monitor), []).append((log_id, ts))
+        return index
+
+
+def make_queries(n: int, seed: int, now: datetime, index):
+    """Запросы с разметкой: класс = <keyword|paraphrase>/<none|monitor|monitor_30d>."""
+    rnd = random.Random(seed + 1)
+    since = now - timedelta(days=30)
+    queries = []
+    attempts = 0
+    while len(queries) < n and attempts < n * 10:
+        attempts += 1
+        mode_idx = rnd.randrange(len(FAILURE_MODES))
+        _, _, _, keyword, paraphrase = FAILURE_MODES[mode_idx]
+        style = rnd.choice(["keyword", "paraphrase"])
+        scope = rnd.choice(["none", "monitor", "monitor_30d"])
+        filters = {}
+        monitors = range(len(MONITORS))
+        if scope != "none":
+            monitor_idx = rnd.randrange(len(MONITORS))
+            monitors = [monitor_idx]
+            filters = {"monitor_name": MONITORS[monitor_idx], "status": "down"}
+            if scope == "monitor_30d":
+                filters["since"] = since
+        lo = since.timestamp() if "since" in filters else -math.inf
+        relevant = {
+            log_id
+            for m in monitors
+            for log_id, ts in index.get((mode_idx, m), ())
+            if ts >= lo
+        }
+        if not relevant:
+            continue
+        queries.append({
+            "q": keyword if style == "keyword" else paraphrase,
+            "filters": filters,
+            "class": f"{style}/{scope}",
+            "relevant": relevant,
+        })
+    return queries
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * p / 100
+    lo, hi = math.floor(rank), math.ceil(rank)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def log_id_of(item):
+    item_id = str(item.get("id") or "")
+    if item_id.startswith("log_"):
+        try:
+            return int(item_id[4:])
+        except ValueError:
+            return None
+    return None
+
+
+def bench_method(name, search, queries, k):
+    latencies, recalls, errors = [], [], 0
+    by_class = {}
+    for query in queries:
+        t0 = time.perf_counter()
+        try:
+            items = search(query)
+        except Exception as e:
+            print(f"⚠️ {name}: {e}")
+            items = []
+            errors += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if items and "error" in items[0]:
+            errors += 1
+            items = []
+        found = {log_id_of(item) for item in items[:k]} & query["relevant"]
+        recall = len(found) / min(k, len(query["relevant"]))
+        recalls.append(recall)
+        by_class.setdefault(query["class"], []).append(recall)
+    return {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        f"recall@{k}": round(statistics.fmean(recalls), 4),
+        "recall_by_class": {
+            cls: round(statistics.fmean(values), 4) for cls, values in sorted(by_class.items())
+        },
+        "errors": errors,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--docs", type=int, default=10000, help="размер корпуса (10k–1M)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=["chroma", "pgvector"], default="chroma")
+    parser.add_argument("--db", default="", help="URL пустой БД (по умолчанию временная SQLite)")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="бюджет hybrid_search (по умолчанию RETRIEVAL_BUDGET_MS, как в проде)")
+    parser.add_argument("--methods", default="query,query_logs,hybrid")
+    parser.add_argument("--output", default="./data/benchmarks/rag_bench.jsonl")
+    args = parser.parse_args()
+
+    if args.backend == "pgvector" and not args.db.startswith("postgresql"):
+        parser.error("--backend pgvector требует --db postgresql://... (отдельная база)")
+
+    # Настройки модулей читаются при импорте — окружение до импорта agent.*
+    tmp_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    os.environ["AGENT_DB"] = args.db or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ["RAG_BACKEND"] = args.backend
+    os.environ["RAG_DB_DIR"] = os.path.join(tmp_dir, "index")
+    os.environ["PGVECTOR_TABLE"] = "rag_vectors_bench"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+    from sqlalchemy import text
+    from sqlmodel import SQLModel, Session, select, func
+
+    from db import get_engine, is_postgres
+    from models import LogDoc
+    from agent import embeddings, rag, retrieval
+
+    engine = get_engine()
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        existing = session.exec(select(func.count()).select_from(LogDoc)).one()
+    if existing:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        sys.exit(f"В {engine.url.render_as_string()} уже {existing} строк LogDoc — нужна пустая база")
+
+    if args.embedder == "hash":
+        embeddings.get_embedder()._encoder = HashEncoder(rag.EMBEDDING_DIM)
+    else:
+        embeddings.warm_up()
+
+    now = datetime.now()
+    corpus = Corpus(args.docs, args.seed, now)
+    results = {
+        "timestamp": now.isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "db": engine.dialect.name,
+        "embedder": args.embedder,
+        "docs": args.docs,
+        "k": args.k,
+        "seed": args.seed,
+    }
+    budget_ms = args.budget_ms if args.budget_ms is not None else retrieval.RETRIEVAL_BUDGET_MS
+    results["budget_ms"] = budget_ms
+
+    try:
+        t0 = time.perf_counter()
+        for docs, metas in corpus.batches(args.batch):
+            ids = rag.add_docs(docs, metas)
+            if len(ids) != len(docs):
+                corpus.log_ids.extend([-1] * len(docs))
+                continue
+            corpus.log_ids.extend(log_id_of({"id": i}) or -1 for i in ids)
+        ingest_s = time.perf_counter() - t0
+        stored = sum(1 for i in corpus.log_ids if i >= 0)
+        results["ingest"] = {
+            "seconds": round(ingest_s, 2),
+            "docs_per_s": round(args.docs / ingest_s, 1),
+            "stored": stored,
+            "vector_bytes": rag.get_vector_store().size_bytes(),
+        }
+        print(f"📥 {stored}/{args.docs} документов за {ingest_s:.1f}s")
+
+        queries = make_queries(args.queries, args.seed, now, corpus.label_index())
+        results["queries"] = len(queries)
+        # Эмбеддинги запросов считаются заранее: сравниваются индексы, а не энкодер
+        embeddings.embed([query["q"] for query in queries])
+
+        truncated, stage_errors = Counter(), Counter()
+
+        def hybrid(query):
+            res = retrieval.hybrid_search(
+                query["q"], k=args.k, filters=query["filters"], budget_ms=budget_ms,
+            )
+            truncated.update(res["timed_out"])
+            stage_errors.update(res["errors"])
+            return res["items"]
+
+        methods = {
+            "query": lambda query: rag.query(query["q"], k=args.k, filters=query["filters"]),
+            "query_logs": lambda query: rag.query_logs(query["q"], k=args.k),
+            "hybrid": hybrid,
+        }
+        if "hybrid" in args.methods:
+            # Холодный процесс, как после рестарта: BM25 строится в фоне (lifespan app),
+            # первый запрос приходит сразу — без прогрева
+            retrieval._bm25 = None
+            build = {}
+
+            def build_index():
+                t0 = time.perf_counter()
+                asyncio.run(retrieval.build_bm25_index())
+                build["s"] = time.perf_counter() - t0
+
+            builder = threading.Thread(target=build_index)
+            builder.start()
+            t0 = time.perf_counter()
+            first = retrieval.hybrid_search(
+                queries[0]["q"], k=args.k, filters=queries[0]["filters"], budget_ms=budget_ms,
+            )
+            results["hybrid_cold"] = {
+                "first_query_ms": round((time.perf_counter() - t0) * 1000, 2),
+                "timed_out": first["timed_out"],
+                "errors": sorted(first["errors"]),
+                "items": len(first["items"]),
+            }
+            builder.join()
+            results["bm25_build_s"] = round(build["s"], 2)
+
+        results["methods"] = {}
+        for name in args.methods.split(","):
+            name = name.strip()
+            if name not in methods:
+                continue
+            results["methods"][name] = bench_method(name, methods[name], queries, args.k)
+            m = results["methods"][name]
+            if name == "hybrid":
+                m["truncated_stages"] = dict(truncated)
+                m["stage_errors"] = dict(stage_errors)
+            print(f"🔎 {name}: p50 {m['p50_ms']} мс, p99 {m['p99_ms']} мс, recall@{args.k} {m[f'recall@{args.k}']}")
+    finally:
+        if args.db:
+            # Внешняя база возвращается в исходное (пустое) состояние
+            with engine.begin() as conn:
+                if is_postgres(engine):
+                    conn.execute(text(f"DROP TABLE IF EXISTS {rag.PGVECTOR_TABLE}"))
+                conn.execute(text("DELETE FROM logdoc"))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
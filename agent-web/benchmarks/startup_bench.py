@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта агента: время импорта модулей и время до первого
+обслуженного запроса.
+
+1. `python -X importtime -c "import app"` — отчёт по модулям: суммарное время
+   импорта app, самые дорогие модули по cumulative и по self.
+2. Запуск uvicorn на свободном порту: время до первого ответа
+   /api/webhook/uptime-kuma/health (вебхуки принимаются) и до 200 на
+   /api/ready (миграция БД и прогрев модулей закончены).
+
+Результат — одна JSON-строка, дописываемая в --output, для сравнения прогонов.
+
+Запуск (из каталога agent-web, с теми же переменными окружения, что у агента):
+    docker compose exec agent python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --runs 5 --top 15
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Строки `import time: self | cumulative | name` → записи (мкс, глубина вложенности)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок "self [us] | cumulative | imported package"
+        name = parts[2].rstrip()
+        stripped = name.lstrip(" ")
+        rows.append({
+            "module": stripped,
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            "depth": (len(name) - len(stripped)) // 2,
+        })
+    return rows
+
+
+def importtime_report(module: str, top: int) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module}: {proc.stderr.strip().splitlines()[-1:]}")
+    target = next((r for r in rows if r["module"] == module and r["depth"] == 0), None)
+
+    def ms(us: int) -> float:
+        return round(us / 1000, 2)
+
+    by_cumulative = sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)
+    by_self = sorted(rows, key=lambda r: r["self_us"], reverse=True)
+    return {
+        "module": module,
+        "total_ms": ms(target["cumulative_us"]) if target else None,
+        "modules": len(rows),
+        "top_cumulative": [{"module": r["module"], "ms": ms(r["cumulative_us"])} for r in by_cumulative[:top]],
+        "top_self": [{"module": r["module"], "ms": ms(r["self_us"])} for r in by_self[:top]],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def cold_start(timeout: float) -> Dict[str, Any]:
+    """Секунды от запуска процесса uvicorn до первого ответа и до готовности."""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=APP_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    result: Dict[str, Any] = {"first_request_s": None, "ready_s": None}
+    try:
+        deadline = t0 + timeout
+        while time.perf_counter() < deadline and proc.poll() is None:
+            if result["first_request_s"] is None:
+                if _status(f"{base}/api/webhook/uptime-kuma/health") == 200:
+                    result["first_request_s"] = round(time.perf_counter() - t0, 3)
+            elif _status(f"{base}/api/ready") == 200:
+                result["ready_s"] = round(time.perf_counter() - t0, 3)
+                break
+            time.sleep(0.01)
+        if result["ready_s"] is not None:
+            with urllib.request.urlopen(f"{base}/api/ready", timeout=2) as response:
+                result["app_timings"] = json.loads(response.read()).get("timings")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3, help="число холодных стартов uvicorn")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--skip-server", action="store_true", help="только -X importtime")
+    parser.add_argument("--output", default="./data/benchmarks/startup_bench.jsonl")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "importtime": importtime_report(args.module, args.top),
+    }
+    print(f"📦 import {args.module}: {results['importtime']['total_ms']} мс, "
+          f"{results['importtime']['modules']} модулей")
+
+    if not args.skip_server:
+        runs = [cold_start(args.timeout) for _ in range(args.runs)]
+        first = [r["first_request_s"] for r in runs if r["first_request_s"] is not None]
+        ready = [r["ready_s"] for r in runs if r["ready_s"] is not None]
+        results["cold_start"] = {
+            "runs": runs,
+            "first_request_s_median": round(statistics.median(first), 3) if first else None,
+            "ready_s_median": round(statistics.median(ready), 3) if ready else None,
+        }
+        print(f"🚀 первый запрос: {results['cold_start']['first_request_s_median']} с, "
+              f"готовность: {results['cold_start']['ready_s_median']} с")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк встроенного TSDB (agent/tsdb.py): запись и запросы на синтетике.
+
+Заполняет --days дней по --monitors мониторов (response_time_ms и status с
+шагом 60 с) в хранилище с ёмкостью на год, затем меряет range / downsample /
+percentile / rate за 1 ч, 24 ч и всё окно. Печатает размер файлов, бюджет
+(матрица + slot_ticks) и пиковый RSS процесса. Каждый прогон дописывается
+строкой в data/benchmarks/tsdb_bench.jsonl.
+
+Запуск:
+    docker compose exec agent python benchmarks/tsdb_bench.py --monitors 50 --days 30
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.tsdb import RingTSDB  # noqa: E402
+
+
+def timed(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--monitors", type=int, default=50)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--retention-days", type=float, default=365)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--path", default=None, help="каталог хранилища (по умолчанию временный)")
+    parser.add_argument("--output", default="./data/benchmarks/tsdb_bench.jsonl")
+    args = parser.parse_args()
+
+    path = args.path or tempfile.mkdtemp(prefix="tsdb_bench_")
+    rng = np.random.default_rng(42)
+    db = RingTSDB(path, step=60, retention_days=args.retention_days, max_series=args.monitors * 2)
+    names = [f"service-{i}" for i in range(args.monitors)]
+
+    points = int(args.days * 1440)
+    end = time.time() // 60 * 60
+    start = end - (points - 1) * 60
+    latency = rng.gamma(2.0, 40.0, size=(points, args.monitors)).astype(np.float32)
+    status = (rng.random((points, args.monitors)) > 0.002).astype(np.float32)
+
+    t0 = time.perf_counter()
+    for i in range(points):
+        values = {}
+        for j, name in enumerate(names):
+            values[("response_time_ms", name)] = float(latency[i, j])
+            values[("status", name)] = float(status[i, j])
+        db.append(start + i * 60, values)
+    append_s = time.perf_counter() - t0
+    db.flush()
+
+    probe = names[len(names) // 2]
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "monitors": args.monitors,
+        "days": args.days,
+        "series": len(db.series()),
+        "append_per_s": round(points / append_s),
+        "append_values_per_s": round(points * len(names) * 2 / append_s),
+    }
+    for label, hours in (("1h", 1), ("24h", 24), ("all", args.days * 24)):
+        since = end - hours * 3600
+        results[f"range_{label}_ms"] = timed(lambda: db.range("response_time_ms", probe, since, end), args.runs)
+        results[f"downsample_{label}_ms"] = timed(
+            lambda: db.downsample("response_time_ms", probe, since, end, max(60, hours * 30), "mean"), args.runs
+        )
+        results[f"percentile_{label}_ms"] = timed(
+            lambda: db.percentile("response_time_ms", probe, since, end), args.runs
+        )
+        results[f"rate_{label}_ms"] = timed(lambda: db.rate("status", probe, since, end), args.runs)
+
+    stats = db.stats()
+    results["budget_mb"] = round(stats["budget_bytes"] / 2**20, 1)
+    results["disk_mb"] = round(
+        sum(os.stat(os.path.join(path, f)).st_blocks * 512 for f in os.listdir(path)) / 2**20, 1
+    )
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if not args.path:
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Подключение к базе данных агента (PostgreSQL agent-db или SQLite).
+Один engine на процесс вместо create_engine() в каждом вызове.
+
+Sync engine (psycopg2 / sqlite3) — для фоновых пакетных задач в потоках;
+async engine (asyncpg / aiosqlite) — для обработчиков FastAPI, чтобы запросы
+к БД не блокировали event loop и не занимали threadpool.
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import LogDoc, MemoryEntry  # импорт models регистрирует все таблицы в SQLModel.metadata
+
+DB_PATH = os.environ.get("AGENT_DB", "sqlite:///./agent.db")
+# PostgreSQL: помесячные партиции logdoc (0 — обычная таблица); число — сколько
+# будущих месяцев держать созданными заранее
+LOGDOC_PARTITION_AHEAD = int(os.environ.get("LOGDOC_PARTITION_AHEAD", "0"))
+
+# Колонки logdoc, добавленные после первой версии схемы
+LOGDOC_COLUMNS = {"monitor_name": "VARCHAR", "status": "VARCHAR"}
+# Старые записи инцидентов хранили монитор и статус только в тексте (шаблон вебхука)
+_LEGACY_MONITOR_RE = re.compile(r"^Монитор:\s*(.+?)\s*$", re.MULTILINE)
+_LEGACY_STATUS_RE = re.compile(r"^Статус:\s*(\w+)", re.MULTILINE)
+
+LOGDOC_INDEXES = {
+    "logdoc_kind_id": "(kind, id)",
+    "logdoc_source_kind_id": "(source, kind, id)",
+    "logdoc_timestamp": '("timestamp")',
+}
+
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+# Драйверы async engine для диалектов из AGENT_DB
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def get_engine() -> Engine:
+    """Общий sync engine (пул соединений переиспользуется)."""
+    global _engine
+    if _engine is None:
+        if DB_PATH.startswith("sqlite"):
+            connect_args = {"check_same_thread": False}
+        else:
+            connect_args = {}
+        _engine = create_engine(DB_PATH, connect_args=connect_args, pool_pre_ping=True)
+    return _engine
+
+
+def async_url(url: str = DB_PATH) -> str:
+    """postgresql[+psycopg2]:// → postgresql+asyncpg://, sqlite:// → sqlite+aiosqlite://"""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Нет async-драйвера для {parsed.get_backend_name()}")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+def get_async_engine() -> AsyncEngine:
+    """Общий async engine для обработчиков запросов."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(async_url(), pool_pre_ping=True)
+    return _async_engine
+
+
+def async_session() -> AsyncSession:
+    """AsyncSession на общем engine: `async with async_session() as session: ...`"""
+    return AsyncSession(get_async_engine(), expire_on_commit=False)
+
+
+def is_postgres(engine: Optional[Engine] = None) -> bool:
+    return (engine or get_engine()).dialect.name == "postgresql"
+
+
+def dialect_insert(bind):
+    """insert() диалекта с поддержкой ON CONFLICT DO UPDATE (PostgreSQL / SQLite)."""
+    return pg_insert if bind.dialect.name == "postgresql" else sqlite_insert
+
+
+def _month_start(value: date, shift: int = 0) -> date:
+    month = value.month - 1 + shift
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def logdoc_partitioned(conn) -> bool:
+    """logdoc — партиционированная таблица (PostgreSQL)."""
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'logdoc'"
+    )).first())
+
+
+def ensure_logdoc_partitions(engine: Optional[Engine] = None, ahead: int = LOGDOC_PARTITION_AHEAD) -> int:
+    """Создаёт партиции logdoc_YYYYMM на текущий и `ahead` следующих месяцев."""
+    engine = engine or get_engine()
+    if not is_postgres(engine) or ahead <= 0:
+        return 0
+    with engine.begin() as conn:
+        return create_logdoc_partitions(conn, ahead)
+
+
+def create_logdoc_partitions(conn, ahead: int = LOGDOC_PARTITION_AHEAD) -> int:
+    """
+    ensure_logdoc_partitions на открытом соединении (из async — через
+    AsyncConnection.run_sync). Каждая партиция — в своём savepoint.
+    """
+    if conn.dialect.name != "postgresql" or ahead <= 0 or not logdoc_partitioned(conn):
+        return 0
+    created = 0
+    today = date.today()
+    for shift in range(ahead + 1):
+        lo, hi = _month_start(today, shift), _month_start(today, shift + 1)
+        name = f"logdoc_{lo:%Y%m}"
+        try:
+            with conn.begin_nested():
+                if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar():
+                    continue
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF logdoc "
+                    f"FOR VALUES FROM ('{lo}') TO ('{hi}')"
+                ))
+                created += 1
+        except Exception as e:
+            # Например, строки этого месяца уже лежат в logdoc_default
+            print(f"⚠️ Партиция {name} не создана: {e}")
+    return created
+
+
+def _partition_logdoc(conn) -> None:
+    """Переводит logdoc в таблицу, партиционированную по месяцам timestamp."""
+    bounds = conn.execute(text('SELECT min("timestamp"), max("timestamp") FROM logdoc')).first()
+    today = date.today()
+    first = (bounds[0] or datetime.now()).date()
+    last = max((bounds[1] or datetime.now()).date(), today)
+
+    conn.execute(text("ALTER TABLE logdoc RENAME TO logdoc_legacy"))
+    conn.execute(text("ALTER TABLE logdoc_legacy RENAME CONSTRAINT logdoc_pkey TO logdoc_legacy_pkey"))
+    for name in LOGDOC_INDEXES:
+        conn.execute(text(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy"))
+    # PK партиционированной таблицы обязан включать ключ партиции
+    conn.execute(text("""
+        CREATE TABLE logdoc (
+            id INTEGER NOT NULL DEFAULT nextval('logdoc_id_seq'),
+            kind VARCHAR NOT NULL,
+            source VARCHAR NOT NULL,
+            content VARCHAR NOT NULL,
+            "timestamp" TIMESTAMPTZ NOT NULL DEFAULT now(),
+            monitor_name VARCHAR,
+            status VARCHAR,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """))
+    conn.execute(text("CREATE TABLE logdoc_default PARTITION OF logdoc DEFAULT"))
+    month = _month_start(first)
+    while month <= _month_start(last, LOGDOC_PARTITION_AHEAD):
+        nxt = _month_start(month, 1)
+        conn.execute(text(
+            f"CREATE TABLE logdoc_{month:%Y%m} PARTITION OF logdoc "
+            f"FOR VALUES FROM ('{month}') TO ('{nxt}')"
+        ))
+        month = nxt
+    conn.execute(text(
+        'INSERT INTO logdoc (id, kind, source, content, "timestamp", monitor_name, status) '
+        'SELECT id, kind, source, content, coalesce("timestamp", now()), monitor_name, status '
+        'FROM logdoc_legacy'
+    ))
+    conn.execute(text("ALTER SEQUENCE logdoc_id_seq OWNED BY logdoc.id"))
+    # CASCADE снимает и внешний ключ rag_vectors.log_id: на партиционированную
+    # таблицу по одному id он невозможен, векторы retention удаляет сам
+    conn.execute(text("DROP TABLE logdoc_legacy CASCADE"))
+
+
+def ensure_columns(engine: Engine, table: str, columns: Dict[str, str]) -> List[str]:
+    """ADD COLUMN для колонок, добавленных в модель после создания таблицы."""
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    missing = {name: ddl for name, ddl in columns.items() if name not in existing}
+    if missing:
+        with engine.begin() as conn:
+            for name, ddl in missing.items():
+                print(f"🔧 {table}.{name}: ADD COLUMN")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    return list(missing)
+
+
+def migrate_schema(engine: Optional[Engine] = None) -> None:
+    """Все таблицы агента + миграции существующих (вызывается при старте app)."""
+    engine = engine or get_engine()
+    SQLModel.metadata.create_all(engine)
+    migrate_logdoc(engine)
+    added = ensure_columns(engine, "incident", {
+        "state": "VARCHAR NOT NULL DEFAULT 'open'",
+        "duration_s": "FLOAT",
+    })
+    if "state" in added:
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE incident SET state = 'resolved' WHERE resolved_at IS NOT NULL"))
+    migrate_incident_unresolved(engine)
+    migrate_memory(engine)
+
+
+def migrate_incident_unresolved(engine: Optional[Engine] = None) -> None:
+    """
+    Уникальный частичный индекс «один незакрытый инцидент на монитор» для
+    существующей таблицы. Дубликаты, оставшиеся от гонок параллельных DOWN,
+    закрываются нулевой длительностью: остаётся самый ранний — от него и
+    считается простой при UP.
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        closed = conn.execute(text("""
+            UPDATE incident SET state = 'resolved', resolved_at = opened_at, duration_s = 0
+            WHERE resolved_at IS NULL AND EXISTS (
+                SELECT 1 FROM incident AS earlier
+                WHERE earlier.monitor_name = incident.monitor_name
+                  AND earlier.resolved_at IS NULL
+                  AND (earlier.opened_at < incident.opened_at
+                       OR (earlier.opened_at = incident.opened_at AND earlier.id < incident.id))
+            )
+        """)).rowcount
+        if closed:
+            print(f"🔧 incident: закрыто {closed} дублей незакрытых инцидентов")
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS incident_monitor_unresolved "
+            "ON incident (monitor_name) WHERE resolved_at IS NULL"
+        ))
+
+
+def migrate_memory(engine: Optional[Engine] = None) -> int:
+    """
+    Переносит память из LogDoc(kind="memory") в MemoryEntry (один раз — пока
+    таблица пуста). Дубликаты ключа схлопываются: остаётся последняя запись.
+    """
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        if conn.execute(select(MemoryEntry.__table__.c.id).limit(1)).first():
+            return 0
+        logdoc = LogDoc.__table__
+        rows = conn.execute(
+            select(logdoc.c.source, logdoc.c.content, logdoc.c.timestamp)
+            .where(logdoc.c.kind == "memory")
+            .order_by(logdoc.c.id)
+        ).all()
+        entries = {}
+        for source, content, ts in rows:
+            try:
+                data = json.loads(content)
+            except json.JSONDecodeError:
+                continue
+            category = data.get("category") or "general"
+            suffix = f"_{category}"
+            if not data.get("key") or not source.endswith(suffix):
+                continue
+            session_id = source[: -len(suffix)]
+            entries[(session_id, category, data["key"])] = {
+                "session_id": session_id,
+                "category": category,
+                "key": data["key"],
+                "value": str(data.get("value", "")),
+                "updated_at": ts,
+            }
+        if entries:
+            print(f"🔧 memory: {len(entries)} ключей из logdoc → memoryentry")
+            conn.execute(MemoryEntry.__table__.insert(), list(entries.values()))
+    return len(entries)
+
+
+def backfill_logdoc_meta(engine: Optional[Engine] = None, batch: int = 1000) -> int:
+    """
+    Один раз, при добавлении колонок: monitor_name/status старых записей
+    инцидентов из текста шаблона вебхука. Новые записи получают их из метаданных.
+    """
+    engine = engine or get_engine()
+    updated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, content FROM logdoc WHERE id > :last_id AND monitor_name IS NULL "
+                "AND content LIKE '%Монитор:%' ORDER BY id LIMIT :batch"
+            ), {"last_id": last_id, "batch": batch}).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            params = []
+            for row_id, content in rows:
+                monitor = _LEGACY_MONITOR_RE.search(content or "")
+                status = _LEGACY_STATUS_RE.search(content or "")
+                if monitor:
+                    params.append({
+                        "id": row_id,
+                        "monitor_name": monitor.group(1),
+                        "status": status.group(1).lower() if status else None,
+                    })
+            if params:
+                conn.execute(
+                    text("UPDATE logdoc SET monitor_name = :monitor_name, status = :status WHERE id = :id"),
+                    params,
+                )
+                updated += len(params)
+    if updated:
+        print(f"🔧 logdoc: monitor_name/status для {updated} старых записей")
+    return updated
+
+
+def migrate_logdoc(engine: Optional[Engine] = None) -> None:
+    """
+    Приводит существующую logdoc к текущей схеме (идемпотентно, при старте):
+    timestamp из ISO-строки в timestamptz, индексы (kind, id), (source, kind, id),
+    (timestamp); при LOGDOC_PARTITION_AHEAD > 0 — помесячные партиции.
+    """
+    engine = engine or get_engine()
+    SQLModel.metadata.create_all(engine, tables=[LogDoc.__table__])
+    if ensure_columns(engine, "logdoc", LOGDOC_COLUMNS):
+        backfill_logdoc_meta(engine)
+    columns = {c["name"]: c for c in inspect(engine).get_columns("logdoc")}
+    ts_type = str(columns["timestamp"]["type"]).upper()
+
+    if is_postgres(engine):
+        with engine.begin() as conn:
+            if "TIMESTAMP" not in ts_type:
+                print("🔧 logdoc.timestamp: text → timestamptz")
+                conn.execute(text(
+                    'ALTER TABLE logdoc ALTER COLUMN "timestamp" TYPE timestamptz '
+                    'USING coalesce(NULLIF("timestamp", \'\')::timestamptz, now())'
+                ))
+                conn.execute(text('ALTER TABLE logdoc ALTER COLUMN "timestamp" SET DEFAULT now()'))
+                conn.execute(text('ALTER TABLE logdoc ALTER COLUMN "timestamp" SET NOT NULL'))
+            if LOGDOC_PARTITION_AHEAD > 0 and not logdoc_partitioned(conn):
+                print("🔧 logdoc: переход на помесячные партиции")
+                _partition_logdoc(conn)
+            for name, cols in LOGDOC_INDEXES.items():
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON logdoc {cols}"))
+        ensure_logdoc_partitions(engine)
+        return
+
+    # SQLite: типов колонок нет, но SQLAlchemy DateTime читает только формат
+    # "YYYY-MM-DD HH:MM:SS.ffffff" — старые ISO-строки переписываются
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, \"timestamp\" FROM logdoc WHERE \"timestamp\" LIKE '%T%' OR \"timestamp\" IS NULL"
+        )).all()
+        if rows:
+            print(f"🔧 logdoc.timestamp: {len(rows)} строк ISO → DateTime")
+        for row_id, value in rows:
+            try:
+                ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            except ValueError:
+                ts = datetime.now()
+            conn.execute(
+                text('UPDATE logdoc SET "timestamp" = :ts WHERE id = :id'),
+                {"ts": ts.strftime("%Y-%m-%d %H:%M:%S.%f"), "id": row_id},
+            )
+        for name, cols in LOGDOC_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON logdoc {cols}"))
@@ -2,6 +2,12 @@
 """
 GitHub Polling Service для Homelab Agent
 Проверяет репозитории на наличие новых PR/MR и отправляет webhook агенту
+
+Запросы к /pulls — условные (If-None-Match / If-Modified-Since по сохранённым
+ETag и Last-Modified): ответ 304 не расходует квоту GitHub. Запросы по
+репозиториям распределяются по интервалу, а при малом остатке квоты
+(X-RateLimit-Remaining) растягиваются до её сброса (X-RateLimit-Reset).
+На вторичные лимиты (403/429) — пауза по Retry-After или экспоненциальная.
 """
 
 import os
@@ -29,6 +35,12 @@ class GitHubPoller:
         self.agent_url = os.getenv('AGENT_URL', 'http://agent:8000')
         self.config_file = '/app/github-config/polling.conf'
         self.last_check_file = '/app/data/github_last_check.json'
+        self.etags_file = '/app/data/github_etags.json'
+        # Сколько запросов квоты не трогать (для ручных вызовов тем же токеном)
+        self.rate_limit_reserve = int(os.getenv('GITHUB_RATE_LIMIT_RESERVE', 50))
+        # Пауза при вторичном лимите без Retry-After: от минимума, удваивается до максимума
+        self.backoff_min = int(os.getenv('GITHUB_BACKOFF_MIN', 60))
+        self.backoff_max = int(os.getenv('GITHUB_BACKOFF_MAX', 900))
         
         if not self.github_token:
             logging.error("GITHUB_TOKEN не задан")
@@ -44,6 +56,22 @@ class GitHubPoller:
         
         # Загружаем последние проверки
         self.last_checks = self.load_last_checks()
+        # ETag/Last-Modified без последних проверок бесполезны: 304 скрыл бы уже существующие PR
+        self.etags = self.load_etags() if self.last_checks else {}
+        
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'token {self.github_token}',
+            'Accept': 'application/vnd.github.v3+json'
+        })
+        
+        # Состояние квоты GitHub и расписания запросов
+        self.rate_remaining = None
+        self.rate_reset = 0.0
+        self.min_gap = 0.0
+        self.not_before = 0.0
+        self.last_request_at = 0.0
+        self.backoff = self.backoff_min
         
         logging.info(f"GitHub Poller инициализирован")
         logging.info(f"Интервал проверки: {self.polling_interval} секунд")
@@ -76,11 +104,24 @@ class GitHubPoller:
         
         return {}
     
+    def load_etags(self):
+        """Загрузка ETag/Last-Modified последних ответов по URL"""
+        try:
+            if Path(self.etags_file).exists():
+                with open(self.etags_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logging.warning(f"Ошибка загрузки ETag: {e}")
+        
+        return {}
+    
     def save_last_checks(self):
-        """Сохранение времени последних проверок"""
+        """Сохранение времени последних проверок (и ETag — вместе с ними)"""
         try:
             with open(self.last_check_file, 'w') as f:
                 json.dump(self.last_checks, f)
+            with open(self.etags_file, 'w') as f:
+                json.dump(self.etags, f)
         except Exception as e:
             logging.error(f"Ошибка сохранения последних проверок: {e}")
     
@@ -113,14 +154,90 @@ class GitHubPoller:
         
         return repos
     
+    def update_rate_limit(self, response):
+        """Учёт остатка квоты по заголовкам X-RateLimit-* (они есть и в ответах 304)"""
+        try:
+            remaining = int(response.headers['X-RateLimit-Remaining'])
+            reset = float(response.headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        
+        self.rate_remaining = remaining
+        self.rate_reset = reset
+        now = time.time()
+        budget = remaining - self.rate_limit_reserve
+        if budget <= 0:
+            # Квота (за вычетом резерва) кончилась — ждём сброса
+            self.not_before = max(self.not_before, reset + 1)
+            logging.warning(
+                f"Квота GitHub почти исчерпана ({remaining} запросов), "
+                f"пауза до {datetime.fromtimestamp(reset).strftime('%H:%M:%S')}"
+            )
+        else:
+            # Оставшиеся запросы растягиваются до сброса квоты
+            self.min_gap = max(0.0, reset - now) / budget
+    
+    def handle_rate_limited(self, response):
+        """403/429 от лимитов GitHub: ставит паузу, True — запрос упёрся в лимит"""
+        if response.status_code not in (403, 429):
+            return False
+        
+        now = time.time()
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            wait = int(retry_after)
+            reason = "Retry-After"
+        elif response.headers.get('X-RateLimit-Remaining') == '0':
+            # Пауза до сброса уже выставлена в update_rate_limit
+            return True
+        elif 'rate limit' in response.text.lower():
+            # Вторичный лимит без Retry-After: не меньше минуты, дальше экспоненциально
+            wait = self.backoff
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+            reason = "вторичный лимит"
+        else:
+            # Обычный 403 — нет доступа к репозиторию
+            return False
+        
+        self.not_before = max(self.not_before, now + wait)
+        logging.warning(f"GitHub rate limit ({reason}): пауза {int(wait)} секунд")
+        return True
+    
+    def wait_turn(self, slot_at):
+        """Ожидание очереди запроса: слот в интервале, темп по квоте и паузы после лимитов"""
+        at = max(slot_at, self.last_request_at + self.min_gap, self.not_before)
+        delay = at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    
+    def github_get(self, url, params):
+        """Условный GET к API GitHub; None — данные не изменились или запрос не удался"""
+        cached = self.etags.get(url, {})
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        
+        self.last_request_at = time.time()
+        response = self.session.get(url, headers=headers, params=params, timeout=10)
+        self.update_rate_limit(response)
+        
+        if response.status_code == 304:
+            self.backoff = self.backoff_min
+            return None
+        if self.handle_rate_limited(response):
+            return None
+        if response.status_code != 200:
+            logging.warning(f"Ошибка запроса {url}: {response.status_code}")
+            return None
+        
+        self.backoff = self.backoff_min
+        return response
+    
     def check_repository(self, repo_config):
         """Проверка репозитория на новые PR/MR"""
         try:
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-            
             # Получаем последние PR
             pr_url = f"https://api.github.com/repos/{repo_config['owner']}/{repo_config['repo']}/pulls"
             params = {
@@ -130,10 +247,9 @@ class GitHubPoller:
                 'per_page': 10
             }
             
-            response = requests.get(pr_url, headers=headers, params=params, timeout=10)
+            response = self.github_get(pr_url, params)
             
-            if response.status_code != 200:
-                logging.warning(f"Ошибка получения PR для {repo_config['owner']}/{repo_config['repo']}: {response.status_code}")
+            if response is None:
                 return
             
             prs = response.json()
@@ -156,6 +272,14 @@ class GitHubPoller:
                 
                 # Обновляем время последней проверки
                 self.last_checks[pr_key] = last_updated
+            
+            # Валидаторы запоминаются только после обработки всех PR ответа
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+            if any(validators.values()):
+                self.etags[pr_url] = validators
                 
         except Exception as e:
             logging.error(f"Ошибка проверки репозитория {repo_config['owner']}/{repo_config['repo']}: {e}")
@@ -211,15 +335,24 @@ class GitHubPoller:
                 else:
                     logging.info(f"Проверяем {len(repos)} репозиториев")
                     
-                    for repo_config in repos:
+                    # Запросы равномерно по интервалу, а не пачкой в начале
+                    started = time.time()
+                    spacing = self.polling_interval / len(repos)
+                    for i, repo_config in enumerate(repos):
+                        self.wait_turn(started + i * spacing)
                         self.check_repository(repo_config)
-                        time.sleep(1)  # Небольшая пауза между запросами
                     
                     # Сохраняем состояние
                     self.save_last_checks()
+                    if self.rate_remaining is not None:
+                        logging.info(f"Остаток квоты GitHub: {self.rate_remaining}")
                 
-                logging.info(f"Ожидание {self.polling_interval} секунд до следующей проверки")
-                time.sleep(self.polling_interval)
+                # Следующий цикл — через интервал от начала текущего, но не раньше снятия паузы
+                next_cycle = (started if repos else time.time()) + self.polling_interval
+                wait = max(next_cycle, self.not_before) - time.time()
+                logging.info(f"Ожидание {max(0, int(wait))} секунд до следующей проверки")
+                if wait > 0:
+                    time.sleep(wait)
                 
             except KeyboardInterrupt:
                 logging.info("Получен сигнал остановки")
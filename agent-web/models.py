@@ -2,13 +2,130 @@
 Модели данных для Homelab Agent
 """
 
+from sqlalchemy import JSON, Column, DateTime, Index, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from typing import Any, Dict, Optional
 from datetime import datetime
 
+
+def now_tz() -> datetime:
+    """Текущее время с часовым поясом (колонка timestamptz)."""
+    return datetime.now().astimezone()
+
+
 class LogDoc(SQLModel, table=True):
+    # Выборки идут по kind/source с сортировкой по id (последние N записей):
+    # составные индексы закрывают и фильтр, и ORDER BY id DESC LIMIT
+    __table_args__ = (
+        Index("logdoc_kind_id", "kind", "id"),
+        Index("logdoc_source_kind_id", "source", "kind", "id"),
+        Index("logdoc_timestamp", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     kind: str
     source: str
     content: str
-    timestamp: Optional[str] = Field(default_factory=lambda: datetime.now().isoformat())
+    timestamp: datetime = Field(
+        default_factory=now_tz,
+        sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+    )
+    # Метаданные инцидента (из add_docs): фильтры гибридного поиска и свёртки retention
+    monitor_name: Optional[str] = None
+    status: Optional[str] = None
+
+
+class Incident(SQLModel, table=True):
+    """Падение монитора: открывается вебхуком DOWN, закрывается вебхуком UP."""
+
+    __table_args__ = (
+        Index("incident_monitor_opened", "monitor_name", "opened_at"),
+        Index("incident_opened", "opened_at"),
+        Index("incident_fingerprint", "fingerprint"),
+        # Не больше одного незакрытого инцидента на монитор: параллельные DOWN
+        # сходятся в INSERT ... ON CONFLICT DO NOTHING (см. open_incident)
+        Index(
+            "incident_monitor_unresolved",
+            "monitor_name",
+            unique=True,
+            postgresql_where=text("resolved_at IS NULL"),
+            sqlite_where=text("resolved_at IS NULL"),
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    monitor_name: str
+    monitor_type: Optional[str] = None
+    status: str
+    # open → analyzing → notified → resolved (см. agent/incidents.py)
+    state: str = Field(default="open")
+    opened_at: datetime = Field(
+        default_factory=now_tz,
+        sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+    )
+    resolved_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+    duration_s: Optional[float] = None
+    analysis_type: Optional[str] = None
+    # Монитор + сообщение без чисел: одинаковые причины падений группируются
+    fingerprint: str
+    report_path: Optional[str] = None
+    details: Dict[str, Any] = Field(
+        default_factory=dict,
+        sa_column=Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False),
+    )
+
+
+class MonitorStats(SQLModel, table=True):
+    """Накопительные агрегаты закрытых инцидентов по монитору (обновляются за O(1))."""
+
+    monitor_name: str = Field(primary_key=True)
+    incidents: int = 0
+    total_downtime_s: float = 0.0
+    mttr_s: float = 0.0
+    max_duration_s: float = 0.0
+    # Оценка p95 длительности алгоритмом P² (5 маркеров вместо всей истории)
+    p95_duration_s: Optional[float] = None
+    p95_state: Dict[str, Any] = Field(
+        default_factory=dict,
+        sa_column=Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False),
+    )
+    last_resolved_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+
+
+class MonitorHourly(SQLModel, table=True):
+    """Счётчики событий монитора по часовым корзинам (UTC); upsert в транзакции инцидента."""
+
+    __table_args__ = (Index("monitorhourly_bucket", "bucket"),)
+
+    monitor_name: str = Field(primary_key=True)
+    bucket: datetime = Field(sa_column=Column(DateTime(timezone=True), primary_key=True))
+    down_events: int = 0
+    up_events: int = 0
+    analyses: int = 0
+    analysis_ms_total: float = 0.0
+    cursor_failures: int = 0
+
+
+class MemoryEntry(SQLModel, table=True):
+    """Память агента: одно значение на (сессия, категория, ключ), запись — upsert."""
+
+    __table_args__ = (
+        UniqueConstraint("session_id", "category", "key", name="memoryentry_session_category_key"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: str
+    category: str
+    key: str
+    value: str
+    updated_at: datetime = Field(
+        default_factory=now_tz,
+        sa_column=Column(DateTime(timezone=True), nullable=False, server_default=func.now()),
+    )
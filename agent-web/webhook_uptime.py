@@ -1,11 +1,16 @@
 """
 Вебхук Uptime Kuma: анализ инцидента через Cursor CLI → уведомление на VPS → Telegram.
+
+requests, agent.rag (chromadb, эмбеддинги), agent.uptime_kuma_live (numpy,
+socket.io) и agent.kuma_db импортируются при первом использовании — app
+прогревает их в фоне после старта.
 """
 
 import os
 import json
+import asyncio
 import socket
-import requests
+import time
 from datetime import datetime
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
@@ -13,12 +18,17 @@ from typing import Any, Dict, Optional
 
 from agent.container_logs import attach_container_logs
 from agent.cursor_incident import generate_cursor_incident_analysis
-
-try:
-    from agent.rag import add_log_to_rag
-    RAG_AVAILABLE = True
-except ImportError:
-    RAG_AVAILABLE = False
+from agent.degradation import apply_evidence
+from agent.flapping import FlapDecision, flap_observe
+from agent.maintenance import MaintenanceWindow, maintenance_window, record_suppressed_alert
+from agent.incidents import (
+    advance_incident,
+    format_duration,
+    open_incident,
+    record_analysis,
+    resolve_incident,
+)
+from db import async_session
 
 router = APIRouter()
 
@@ -102,15 +112,48 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
             "hostname": monitor_hostname,
             "port": monitor_port,
         }
+        await _enrich(details)
+
+        # Плановое обслуживание (окно Kuma + grace): алерт записывается без анализа и уведомления
+        window = maintenance_window(monitor_name)
+        if window is not None:
+            return await _record_maintenance(monitor_name, status, details, window)
+
+        # Осциллирующий монитор: смена записывается, анализ — одной сводкой после стабилизации
+        flap = flap_observe(monitor_name, status, alert_message)
+        if flap.suppress:
+            return await _record_flapping(monitor_name, status, details, flap)
 
         incident_analysis = ""
         incident_analysis_full = ""
         analysis_type = "none"
         report_path = None
+        incident_id = None
+        resolution = None
 
         if status in ("down", "error"):
-            attach_container_logs(details)
+            opened = await _incident_step(open_incident, details)
+            if opened is not None and not opened[1]:
+                # Повторный DOWN (повторная доставка или retry Kuma): инцидент уже
+                # анализируется или разослан — второй анализ и Telegram не нужны
+                print(f"↩️ {monitor_name}: инцидент #{opened[0].id} уже открыт ({opened[0].state})")
+                return {
+                    "success": True,
+                    "message": "Инцидент уже открыт: повторный DOWN записан без анализа",
+                    "incident_id": opened[0].id,
+                    "incident_state": opened[0].state,
+                    "timestamp": datetime.now().isoformat(),
+                }
+            incident_id = opened[0].id if opened else None
+            await _incident_step(advance_incident, incident_id, "analyzing")
+            # Улики, собранные детектором деградации до DOWN, — без docker logs на
+            # критическом пути; иначе docker logs (как и RAG, и POST на VPS) — в потоке
+            if apply_evidence(details):
+                print(f"📉 Улики собраны заранее ({details['evidence_age_s']} с назад)")
+            else:
+                await asyncio.to_thread(attach_container_logs, details)
             print("🔍 Анализ через Cursor CLI...")
+            analysis_started = time.perf_counter()
             (
                 incident_analysis_full,
                 incident_analysis,
@@ -123,10 +166,23 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
                 f"✅ Анализ ({analysis_type}), telegram: {len(incident_analysis)} симв., "
                 f"отчёт: {report_path}"
             )
+            await _incident_step(
+                record_analysis,
+                incident_id,
+                analysis_type,
+                (time.perf_counter() - analysis_started) * 1000,
+                report_path,
+            )
         elif status == "up":
+            resolution = await _incident_step(resolve_incident, monitor_name)
+            downtime = ""
+            if resolution:
+                details["downtime_s"] = round(resolution["duration_s"], 1)
+                downtime = f"⏱️ Простой: {format_duration(resolution['duration_s'])}\n"
             incident_analysis = (
                 f"🎉 **СЕРВИС ВОССТАНОВЛЕН: {monitor_name}**\n\n"
                 f"✅ Сервис снова доступен.\n"
+                f"{downtime}"
                 f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
             )
             analysis_type = "recovery"
@@ -137,7 +193,8 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
             )
             analysis_type = "status_change"
 
-        if RAG_AVAILABLE:
+        add_log_to_rag = _rag_writer()
+        if add_log_to_rag is not None:
             try:
                 incident_log = f"""
 ИНЦИДЕНТ UPTIME KUMA:
@@ -146,7 +203,7 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
 Анализ ({analysis_type}): {(incident_analysis_full or incident_analysis)[:800]}...
 Отчёт: {report_path or 'N/A'}
 """
-                add_log_to_rag(
+                await add_log_to_rag(
                     incident_log,
                     {
                         "source": "uptime_kuma_webhook",
@@ -175,6 +232,9 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
         else:
             print(f"❌ VPS: {vps_response.get('error')}")
 
+        if vps_response.get("success"):
+            await _incident_step(advance_incident, incident_id, "notified")
+
         return {
             "success": True,
             "message": "Уведомление обработано",
@@ -182,6 +242,8 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
             "incident_analysis_chars": len(incident_analysis),
             "analysis_type": analysis_type,
             "report_path": report_path,
+            "incident_id": incident_id or (resolution or {}).get("incident_id"),
+            "downtime_s": details.get("downtime_s"),
             "vps_response": vps_response,
             "timestamp": datetime.now().isoformat(),
         }
@@ -191,6 +253,127 @@ async def uptime_kuma_webhook(alert: UptimeAlert, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _record_maintenance(
+    monitor_name: str, status: str, details: Dict[str, Any], window: MaintenanceWindow
+) -> Dict[str, Any]:
+    """Алерт в окне обслуживания: запись в журнал; открытый инцидент закрывается на UP."""
+    titles = ", ".join(window.titles)
+    print(f"🛠️ {monitor_name}: {status} в окне обслуживания ({titles}) — без анализа и уведомления")
+    details["maintenance"] = list(window.titles)
+    await _incident_step(record_suppressed_alert, details, window)
+    if status == "up":
+        await _incident_step(resolve_incident, monitor_name)
+    return {
+        "success": True,
+        "message": "Окно обслуживания: алерт записан без анализа",
+        "suppressed": "maintenance",
+        "maintenance": list(window.titles),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+async def _record_flapping(
+    monitor_name: str, status: str, details: Dict[str, Any], flap: FlapDecision
+) -> Dict[str, Any]:
+    """Смена статуса флапающего монитора: инцидент и счётчики — да, логи, Cursor и Telegram — нет."""
+    incident_id = None
+    if status in ("down", "error"):
+        opened = await _incident_step(open_incident, details)
+        incident_id = opened[0].id if opened else None
+    elif status == "up":
+        await _incident_step(resolve_incident, monitor_name)
+    print(f"🔁 {monitor_name}: флаппинг ({flap.percent:.0f}%) — {status} записан без анализа")
+
+    vps_response = None
+    if flap.started:
+        notice = (
+            f"🔁 **ФЛАППИНГ: {monitor_name}**\n\n"
+            f"Статус меняется слишком часто ({flap.percent:.0f}% смен за окно). "
+            f"Анализ каждой смены приостановлен, сводка — после стабилизации.\n"
+            f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        vps_response = await send_to_vps(monitor_name, status, details, notice, analysis_type="flapping")
+    return {
+        "success": True,
+        "message": "Монитор флапает: смена записана без анализа",
+        "suppressed": "flapping",
+        "flap_percent": round(flap.percent, 1),
+        "incident_id": incident_id,
+        "vps_response": vps_response,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+async def run_flap_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Один анализ после флаппинга (agent.flapping.flap_loop): итоговый статус, смены, логи."""
+    monitor_name = summary["monitor_name"]
+    status = summary["final_status"]
+    details = {
+        "monitor_name": monitor_name,
+        "monitor_url": "N/A",
+        "status": status,
+        "alert_type": "flap_summary",
+        "message": (
+            f"Flapping: {summary['transitions']} status changes since "
+            f"{summary['flapping_since']}, stable {status} since {summary['stable_since']}"
+        ),
+        "datetime": datetime.now().isoformat(),
+        "monitor_type": "unknown",
+        "flap_summary": summary,
+    }
+    await _enrich(details)
+    if not apply_evidence(details):
+        await asyncio.to_thread(attach_container_logs, details)
+    _, incident_analysis, report_path, analysis_type = await generate_cursor_incident_analysis(
+        monitor_name, status, details
+    )
+    print(f"✅ Сводка флаппинга {monitor_name} ({analysis_type}), отчёт: {report_path}")
+    return await send_to_vps(
+        monitor_name,
+        status,
+        details,
+        incident_analysis,
+        analysis_type="flap_summary",
+        report_path=report_path,
+    )
+
+
+async def _enrich(details: Dict[str, Any]) -> None:
+    """
+    URL, интервал, последние смены статуса — из представления Kuma в памяти,
+    без постоянного подключения — из kuma.db (только чтение).
+    """
+    from agent.uptime_kuma_live import enrich_details
+
+    if not enrich_details(details):
+        from agent.kuma_db import enrich_from_kuma_db
+
+        await asyncio.to_thread(enrich_from_kuma_db, details)
+
+
+async def _incident_step(fn, *args, **kwargs):
+    """Шаг жизненного цикла инцидента в своей транзакции; ошибка БД не мешает алерту."""
+    if fn in (advance_incident, record_analysis) and args[0] is None:
+        return None
+    try:
+        async with async_session() as session:
+            result = await session.run_sync(fn, *args, **kwargs)
+            await session.commit()
+            return result
+    except Exception as e:
+        print(f"⚠️ Incident ({fn.__name__}): {e}")
+        return None
+
+
+def _rag_writer():
+    """agent.rag.add_log_to_rag_async или None, если RAG недоступен в образе."""
+    try:
+        from agent.rag import add_log_to_rag_async
+    except ImportError:
+        return None
+    return add_log_to_rag_async
+
+
 def _vps_url() -> str:
     """URL как в .env (на VPS может быть /uptime-alerts или /api/uptime-alerts)."""
     return os.environ.get(
@@ -223,6 +406,8 @@ async def send_to_vps(
     report_path: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Отправка на VPS (далее Telegram) с анализом от Cursor CLI."""
+    import requests
+
     alert_data = {
         "source": "homelab_uptime_kuma",
         "timestamp": datetime.now().isoformat(),
@@ -249,7 +434,8 @@ async def send_to_vps(
     print(f"📤 VPS: {vps_url} (connect={connect_timeout}s, read={read_timeout}s)")
 
     try:
-        response = requests.post(
+        response = await asyncio.to_thread(
+            requests.post,
             vps_url,
             json=alert_data,
             headers={"Content-Type": "application/json"},